@@ -0,0 +1,145 @@
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class AdmissionTicket:
+    """
+    Handle for one unit of admitted work.
+
+    start() waits for an execution slot, finish() frees it. Use as a context
+    manager to do both.
+    """
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._started_at: Optional[float] = None
+        self._finished = False
+
+    def start(self) -> None:
+        """Block until an in-flight slot is free."""
+        if self._started_at is None:
+            self._controller._start(self)
+            self._started_at = time.monotonic()
+
+    def finish(self) -> None:
+        """Release the slot (idempotent) and record the service time."""
+        if self._finished:
+            return
+        self._finished = True
+        service_time = (
+            time.monotonic() - self._started_at if self._started_at is not None else None
+        )
+        self._controller._finish(self._started_at is not None, service_time)
+
+    def __enter__(self) -> "AdmissionTicket":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.finish()
+
+
+class AdmissionController:
+    """
+    Bounds the LLM work the process accepts.
+
+    At most max_in_flight admitted jobs run at once and at most max_queue more
+    may wait for a slot. A new job is also refused when its estimated
+    completion time (queue position x average service time) exceeds the
+    latency budget, so the service never accepts work it cannot finish in time.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_queue: int = 32,
+        latency_budget: float = 30.0,
+        initial_service_time: float = 5.0,
+    ):
+        """
+        Args:
+            max_in_flight: Jobs allowed to run concurrently
+            max_queue: Admitted jobs allowed to wait for a slot
+            latency_budget: Seconds within which admitted work must be able to finish
+            initial_service_time: Service time estimate used until jobs have completed
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.latency_budget = latency_budget
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._outstanding = 0  # admitted and not finished (waiting + running)
+        self._running = 0
+        self._service_time = initial_service_time  # EWMA of completed jobs
+
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_admit(self) -> Optional[AdmissionTicket]:
+        """
+        Admit a new job if there is capacity for it within the latency budget.
+
+        Returns:
+            An AdmissionTicket, or None if the job should be shed
+        """
+        with self._lock:
+            over_capacity = self._outstanding >= self.max_in_flight + self.max_queue
+            if over_capacity or self._estimate(self._outstanding) > self.latency_budget:
+                self.rejected += 1
+                return None
+            self._outstanding += 1
+            self.admitted += 1
+        return AdmissionTicket(self)
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait before retrying."""
+        with self._lock:
+            backlog = self._outstanding - self.max_in_flight
+            waves = max(backlog, 0) / self.max_in_flight + 1
+            return max(1, math.ceil(waves * self._service_time))
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of admitted/running work and shed counts."""
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "latency_budget_seconds": self.latency_budget,
+                "running": self._running,
+                "waiting": self._outstanding - self._running,
+                "avg_service_seconds": round(self._service_time, 3),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+    def _estimate(self, outstanding: int) -> float:
+        # Completion time for a job joining behind `outstanding` others
+        waves = outstanding // self.max_in_flight + 1
+        return waves * self._service_time
+
+    def _start(self, ticket: AdmissionTicket) -> None:
+        self._slots.acquire()
+        with self._lock:
+            self._running += 1
+
+    def _finish(self, started: bool, service_time: Optional[float]) -> None:
+        with self._lock:
+            self._outstanding -= 1
+            if started:
+                self._running -= 1
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        if started:
+            self._slots.release()
+
+
+def run_admitted(ticket: AdmissionTicket, fn, *args, **kwargs) -> Any:
+    """Run fn inside an admitted ticket's execution slot (used as a queue job body)."""
+    with ticket:
+        return fn(*args, **kwargs)
@@ -0,0 +1,83 @@
+"""
+Benchmark scheduled-intervention planning: the per-user Python loop
+(determine_if_intervention_needed + select_intervention_type over context
+dicts) against the vectorized ContextTable.plan().
+
+Usage:
+    python bench_interventions.py [users] [hour]
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from context_table import ContextTable
+from intervention_rules import determine_if_intervention_needed, select_intervention_type
+
+SEED = 42
+# Separate seed for the synthetic data so it is not correlated with the draws
+POPULATION_SEED = 7
+
+
+def make_population(users: int):
+    """Synthetic users with last interactions spread over the past 48 hours."""
+    rng = np.random.default_rng(POPULATION_SEED)
+    now = datetime.now()
+    hours_ago = rng.uniform(0, 48, size=users)
+    last_meal = rng.integers(1, 9, size=users)
+    phone_numbers = [f"+1555{i:07d}" for i in range(users)]
+    contexts = [
+        {
+            "last_interaction": (now - timedelta(hours=float(h))).isoformat(),
+            "last_meal": int(m),
+            "glucose_readings": [],
+            "medication_adherence": {},
+        }
+        for h, m in zip(hours_ago, last_meal)
+    ]
+    return phone_numbers, contexts
+
+
+def run_loop(phone_numbers, contexts, hour: int) -> int:
+    random.seed(SEED)
+    due = 0
+    for phone_number, context in zip(phone_numbers, contexts):
+        if determine_if_intervention_needed(phone_number, context, hour):
+            select_intervention_type(context, hour)
+            due += 1
+    return due
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) >= 2 else 1_000_000
+    hour = int(sys.argv[2]) if len(sys.argv) >= 3 else 12
+
+    print(f"Building {users:,} synthetic contexts...")
+    phone_numbers, contexts = make_population(users)
+
+    start = time.perf_counter()
+    loop_due = run_loop(phone_numbers, contexts, hour)
+    loop_seconds = time.perf_counter() - start
+
+    table = ContextTable(seed=SEED)
+    start = time.perf_counter()
+    table.reload(zip(phone_numbers, contexts))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mask, _, _ = table.plan(hour)
+    plan_seconds = time.perf_counter() - start
+    table_due = int(mask.sum())
+
+    print(f"Hour {hour}, {users:,} users")
+    print(f"  Python loop:        {loop_seconds:8.3f}s  ({loop_due:,} due)")
+    print(f"  ContextTable.plan:  {plan_seconds:8.3f}s  ({table_due:,} due)")
+    print(f"  Speedup:            {loop_seconds / plan_seconds:8.1f}x")
+    print(f"  (one-off table load from dicts: {load_seconds:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
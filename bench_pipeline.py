@@ -0,0 +1,80 @@
+"""
+Benchmark the webhook pipeline offline: the model is replaced by the
+scripted FakeBackend (LLM_BACKEND=fake) and Pinnacle by FakePinnacleClient,
+so what is measured is our own queueing, tool calls, parsing, caching and
+sending.
+
+Usage:
+    python bench_pipeline.py [messages] [users]
+
+FAKE_LLM_SCRIPT, FAKE_LLM_LATENCY and FAKE_LLM_SEED configure the fake
+(e.g. FAKE_LLM_LATENCY='{}' for zero model latency); WEBHOOK_WORKERS sets
+the worker pool size.
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("PINNACLE_FAKE", "true")
+# Queue the whole run up front
+os.environ.setdefault("WEBHOOK_QUEUE_MAX_DEPTH", "0")
+
+import main  # noqa: E402
+
+QUESTIONS = [
+    "Show my cholesterol levels as a graph",
+    "What medications am I taking?",
+    "How has my blood sugar been this week?",
+    "What was my last blood pressure reading?",
+    "Am I due for an HbA1c test?",
+]
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main_bench():
+    messages = int(sys.argv[1]) if len(sys.argv) >= 2 else 200
+    users = int(sys.argv[2]) if len(sys.argv) >= 3 else 50
+
+    latencies = []
+
+    def timed(phone_number: str, text: str) -> str:
+        start = time.perf_counter()
+        message_type = main.process_webhook_message(phone_number, text, "")
+        latencies.append(time.perf_counter() - start)
+        return message_type
+
+    start = time.perf_counter()
+    futures = [
+        main.webhook_queue.submit(
+            timed,
+            f"+1555{i % users:07d}",
+            QUESTIONS[i % len(QUESTIONS)],
+            key=f"+1555{i % users:07d}",
+        )
+        for i in range(messages)
+    ]
+    errors = 0
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"{messages} messages from {users} users on {main.webhook_queue.workers} workers")
+    print(f"  Wall time:   {elapsed:8.3f}s  ({messages / elapsed:.1f} msg/s)")
+    if latencies:
+        print(f"  Job p50:     {percentile(latencies, 0.50):8.3f}s")
+        print(f"  Job p95:     {percentile(latencies, 0.95):8.3f}s")
+        print(f"  Job p99:     {percentile(latencies, 0.99):8.3f}s")
+    print(f"  Sent:        {main.pinnacle_client.sent_count}  (errors: {errors})")
+
+
+if __name__ == "__main__":
+    main_bench()
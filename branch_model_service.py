@@ -1,18 +1,17 @@
 # model_service.py
-import asyncio
 import json
 import logging
 import os
 import re
 
-from google import genai
 from google.genai import types
 from google.genai.types import (FunctionDeclaration, GenerateContentConfig,
-                                Part, Tool, LiveClientToolResponse,
-                                FunctionResponse)
+                                Part, Tool)
 
 from fhir_data import get_patient_data
+from gemini_runtime import get_runtime
 from graph_utils import generate_graph
+from llm_backends import LiveBackend, UnaryBackend, create_backend
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -118,102 +117,92 @@ generate_chart_declaration = {
 }
 
 
-async def handle_tool_call(session, tool_call):
-    """Handle function calls (tool calls) from the model."""
-    for fc in tool_call.function_calls:
-        if fc.name == "get_patient_data":
-            data_type = fc.args.get("data_type", "all")  # "all" is a fallback
-            if not data_type:  # data type should not be empty
-                raise ValueError("data_type cannot be empty")
-            try:
-                result = get_patient_data(data_type)
-            except Exception as e:
-                result = {"error": str(e)}
-
-            tool_response = LiveClientToolResponse(function_responses=[
-                FunctionResponse(name=fc.name, id=fc.id, response=result)
-            ])
-            await session.send(input=tool_response)
-
-        elif fc.name == "generate_chart":
-            react_code = fc.args.get("react_code")
-            if not react_code:
-                raise ValueError("react_code cannot be empty")
-            try:
-                graph_url = generate_graph(react_code)
-                tool_response = LiveClientToolResponse(function_responses=[
-                    FunctionResponse(
-                        name=fc.name, id=fc.id, response={"url": graph_url})
-                ])
-                await session.send(input=tool_response)
-            except Exception as e:
-                tool_response = LiveClientToolResponse(function_responses=[
-                    FunctionResponse(
-                        name=fc.name, id=fc.id, response={"error": str(e)})
-                ])
-                await session.send(input=tool_response)
-        else:
-            tool_response = LiveClientToolResponse(function_responses=[
-                FunctionResponse(name=fc.name,
-                                 id=fc.id,
-                                 response={"error": "Unknown function call"})
-            ])
-            await session.send(input=tool_response)
+def execute_tool(name: str, args: dict) -> dict:
+    """Run a tool call from the model and return its response payload."""
+    if name == "get_patient_data":
+        data_type = args.get("data_type", "all")  # "all" is a fallback
+        if not data_type:  # data type should not be empty
+            raise ValueError("data_type cannot be empty")
+        try:
+            return get_patient_data(data_type)
+        except Exception as e:
+            return {"error": str(e)}
+
+    if name == "generate_chart":
+        react_code = args.get("react_code")
+        if not react_code:
+            raise ValueError("react_code cannot be empty")
+        try:
+            return {"url": generate_graph(react_code)}
+        except Exception as e:
+            return {"error": str(e)}
+
+    return {"error": "Unknown function call"}
+
+
+def log_model_parts(parts, stream=None):
+    """Log generated code and code-execution output."""
+    for part in parts or []:
+        if part.executable_code:
+            logger.info(
+                f"Generated Python code:\n{part.executable_code.code}")
+        if part.code_execution_result:
+            logger.info(
+                f"Code execution result:\n{part.code_execution_result.output}"
+            )
+
+
+live_config = {
+    "tools": [
+        {
+            "function_declarations": [
+                get_patient_data_declaration,
+                generate_chart_declaration
+            ]
+        },
+        {
+            "code_execution": {}
+        }
+    ],
+    "generation_config": {
+        "response_modalities": ["TEXT"]
+    }
+}
+
+_backend = None
+
+
+def get_backend():
+    """The LLM backend selected by LLM_BACKEND (live, unary or fake)."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(
+            os.getenv("LLM_BACKEND") or "live",
+            live=lambda: LiveBackend("gemini-2.0-flash-exp", live_config,
+                                     execute_tool, log_model_parts),
+            unary=lambda: UnaryBackend(
+                "gemini-2.0-flash-001",
+                [
+                    Tool(function_declarations=[
+                        FunctionDeclaration(**get_patient_data_declaration),
+                        FunctionDeclaration(**generate_chart_declaration),
+                    ]),
+                    Tool(code_execution=types.ToolCodeExecution()),
+                ],
+                execute_tool,
+                log_model_parts,
+            ),
+            execute_tool=execute_tool,
+            on_parts=log_model_parts)
+    return _backend
 
 
 async def run_gemini_conversation(system_prompt: str,
                                   conversation_text: str) -> str:
     """
-    Open a live session with the Gemini model.
+    Run one model turn on the configured backend.
     """
-    client = genai.Client(
-        api_key=os.getenv('GEMINI_API_KEY'),
-        http_options={'api_version': 'v1alpha'}  # Live (experimental)
-    )
-
-    config = {
-        "tools": [
-            {
-                "function_declarations": [
-                    get_patient_data_declaration,
-                    generate_chart_declaration  
-                ]
-            },
-            {
-                "code_execution": {}
-            }
-        ],
-        "generation_config": {
-            "response_modalities": ["TEXT"]
-        }
-    }
-
-    final_text = ""
-
-    async with client.aio.live.connect(model="gemini-2.0-flash-exp",
-                                       config=config) as session:
-        await session.send(input=f"{system_prompt}\n\n{conversation_text}",
-                           end_of_turn=True)
-
-        async for response in session.receive():
-            if response.text:
-                final_text += response.text
-
-            if response.tool_call:
-                await handle_tool_call(session, response.tool_call)
-
-            if response.server_content and response.server_content.model_turn:
-                for part in response.server_content.model_turn.parts:
-                    if part.executable_code:
-                        logger.info(
-                            f"Generated Python code:\n{part.executable_code.code}"
-                        )
-                    if part.code_execution_result:
-                        logger.info(
-                            f"Code execution result:\n{part.code_execution_result.output}"
-                        )
-
-    return final_text
+    return await get_backend().generate(system_prompt, conversation_text)
 
 
 def build_conversation_text(conversation_slice):
@@ -238,7 +227,7 @@ def call_gemini(conversation_slice):
     system_prompt = create_context()
     conversation_text = build_conversation_text(conversation_slice)
 
-    final_text = asyncio.run(
+    final_text = get_runtime().run(
         run_gemini_conversation(system_prompt, conversation_text))
 
     # --- JSON Parsing (for the RCS response) ---
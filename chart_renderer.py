@@ -0,0 +1,224 @@
+import hashlib
+import io
+import json
+import logging
+import math
+from typing import Any, Dict, Optional
+
+import matplotlib
+
+matplotlib.use("Agg")
+from matplotlib.figure import Figure  # noqa: E402
+
+from chart_store import MMS_VARIANT, ChartStore, chart_url, get_chart_store  # noqa: E402
+from message_handler import optimize_image_bytes  # noqa: E402
+from metrics import counter  # noqa: E402
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CHART_TYPES = ("line", "bar", "scatter")
+MAX_SERIES = 6
+MAX_POINTS = 200
+# Part of every chart ID: bump when render_png output changes so stored images are not reused
+RENDER_VERSION = 1
+
+# Muted palette that stays readable after MMS JPEG compression
+COLORS = ("#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd", "#8c564b")
+
+CHARTS_RENDERED = counter(
+    "rcsbot_charts_rendered_total", "render_chart tool calls", ("type", "outcome")
+)
+
+
+class ChartSpecError(ValueError):
+    """The model's chart spec is missing fields or has the wrong shape."""
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ChartSpecError(f"not a number: {value!r}")
+    return number if math.isfinite(number) else None
+
+
+def validate_spec(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check a chart spec and return it in canonical form.
+
+    A spec looks like:
+        {
+            "type": "line",
+            "title": "HbA1c",
+            "labels": ["2023-04", "2023-07", "2023-10", "2024-01"],
+            "series": [{"name": "HbA1c", "values": [7.4, 7.1, 6.9, 6.8]}],
+            "y_label": "%",
+            "reference_ranges": [{"label": "Target", "low": 4.0, "high": 7.0}]
+        }
+
+    Raises:
+        ChartSpecError: If the spec cannot be drawn
+    """
+    if not isinstance(spec, dict):
+        raise ChartSpecError("spec must be an object")
+    chart_type = str(spec.get("type", "line")).lower()
+    if chart_type not in CHART_TYPES:
+        raise ChartSpecError(f"type must be one of {', '.join(CHART_TYPES)}")
+
+    series = spec.get("series")
+    if not isinstance(series, list) or not series:
+        raise ChartSpecError("series must be a non-empty list")
+    if len(series) > MAX_SERIES:
+        raise ChartSpecError(f"at most {MAX_SERIES} series")
+
+    labels = [str(label) for label in spec.get("labels") or []]
+    canonical_series = []
+    for item in series:
+        if not isinstance(item, dict) or not isinstance(item.get("values"), list):
+            raise ChartSpecError("each series needs a values list")
+        values = [_number(value) for value in item["values"]]
+        if not values or len(values) > MAX_POINTS:
+            raise ChartSpecError(f"each series needs 1-{MAX_POINTS} values")
+        if labels and len(values) != len(labels):
+            raise ChartSpecError("series values and labels must have the same length")
+        canonical_series.append({"name": str(item.get("name", "")), "values": values})
+
+    ranges = []
+    for item in spec.get("reference_ranges") or []:
+        if not isinstance(item, dict):
+            raise ChartSpecError("reference_ranges must be objects")
+        low, high = _number(item.get("low")), _number(item.get("high"))
+        if low is None and high is None:
+            raise ChartSpecError("a reference range needs low and/or high")
+        ranges.append({"label": str(item.get("label", "")), "low": low, "high": high})
+
+    return {
+        "type": chart_type,
+        "title": str(spec.get("title", "")),
+        "labels": labels,
+        "series": canonical_series,
+        "x_label": str(spec.get("x_label", "")),
+        "y_label": str(spec.get("y_label", "")),
+        "reference_ranges": ranges,
+    }
+
+
+def chart_id(spec: Dict[str, Any]) -> str:
+    """Content address of a canonical spec (data included): identical charts share an ID."""
+    encoded = json.dumps({"v": RENDER_VERSION, "spec": spec}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:24]
+
+
+def render_png(spec: Dict[str, Any]) -> bytes:
+    """Draw a canonical spec with matplotlib (Agg) and return PNG bytes."""
+    figure = Figure(figsize=(6, 4), dpi=100)
+    ax = figure.add_subplot()
+
+    points = len(spec["series"][0]["values"])
+    labels = spec["labels"] or [str(i + 1) for i in range(points)]
+    positions = list(range(len(labels)))
+
+    for band in spec["reference_ranges"]:
+        if band["low"] is not None and band["high"] is not None:
+            ax.axhspan(band["low"], band["high"], color="#2ca02c", alpha=0.12, label=band["label"] or None)
+        else:
+            ax.axhline(
+                band["low"] if band["low"] is not None else band["high"],
+                color="#2ca02c",
+                linestyle="--",
+                linewidth=1,
+                label=band["label"] or None,
+            )
+
+    count = len(spec["series"])
+    width = 0.8 / count
+    for index, series in enumerate(spec["series"]):
+        color = COLORS[index % len(COLORS)]
+        values = [math.nan if value is None else value for value in series["values"]]
+        name = series["name"] or None
+        if spec["type"] == "bar":
+            offsets = [p - 0.4 + width * (index + 0.5) for p in positions]
+            ax.bar(offsets, values, width=width, color=color, label=name)
+        elif spec["type"] == "scatter":
+            ax.scatter(positions, values, color=color, label=name)
+        else:
+            ax.plot(positions, values, marker="o", color=color, label=name)
+
+    ax.set_xticks(positions)
+    ax.set_xticklabels(labels, rotation=45 if len(labels) > 6 else 0, ha="right" if len(labels) > 6 else "center")
+    if spec["title"]:
+        ax.set_title(spec["title"])
+    if spec["x_label"]:
+        ax.set_xlabel(spec["x_label"])
+    if spec["y_label"]:
+        ax.set_ylabel(spec["y_label"])
+    ax.grid(axis="y", alpha=0.3)
+    if count > 1 or any(band["label"] for band in spec["reference_ranges"]):
+        ax.legend(fontsize="small")
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """
+    Backs the render_chart tool: renders compact chart specs locally and
+    serves the PNGs from this process, so the model passes a few hundred
+    bytes of JSON and the reply carries a URL instead of base64 image data.
+    Images live in a ChartStore under the spec's content hash, so a repeated
+    chart is served without drawing or optimizing it again.
+    """
+
+    def __init__(self, base_url: str = "", store: Optional[ChartStore] = None):
+        """
+        Args:
+            base_url: Absolute public URL of this service, used to build media URLs
+            store: Image store, the process-wide one by default
+        """
+        self.base_url = base_url.rstrip("/")
+        self.store = store or get_chart_store()
+
+    def render(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Render a spec (tool arguments) and return the tool response.
+
+        Raises:
+            ChartSpecError: If the spec is invalid
+        """
+        try:
+            canonical = validate_spec(spec)
+        except ChartSpecError:
+            CHARTS_RENDERED.inc(type=str(spec.get("type", "")) if isinstance(spec, dict) else "", outcome="invalid")
+            raise
+        key = chart_id(canonical)
+        if self.store.get(key, "png") is None:
+            self.store.set(key, "png", render_png(canonical))
+            CHARTS_RENDERED.inc(type=canonical["type"], outcome="ok")
+        else:
+            CHARTS_RENDERED.inc(type=canonical["type"], outcome="cached")
+        return {"url": self.url_for(key), "chart_id": key}
+
+    def url_for(self, key: str) -> str:
+        return chart_url(self.base_url, key)
+
+    def get(self, key: str, variant: str = "png") -> Optional[bytes]:
+        """
+        Image bytes for a chart ID, or None if unknown or expired. The MMS
+        variant is optimized from the PNG on first request and then stored.
+        """
+        data = self.store.get(key, variant)
+        if data is None and variant == MMS_VARIANT:
+            png = self.store.get(key, "png")
+            if png is None:
+                return None
+            data = optimize_image_bytes(png)
+            self.store.set(key, variant, data)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return self.store.stats()
@@ -0,0 +1,231 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from config import env_float, env_int
+from metrics import counter
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CHART_ROUTE = "/charts"
+# Stored variants by file extension: the original PNG and the MMS-optimized JPEG
+VARIANTS = {"png": "image/png", "jpg": "image/jpeg"}
+MMS_VARIANT = "jpg"
+DEFAULT_CHART_STORE_DIR = "chart_store"
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{16,64}$")
+_CHART_URL_PATTERN = re.compile(re.escape(CHART_ROUTE) + r"/([0-9a-f]{16,64})\.png$")
+
+STORE_LOOKUPS = counter(
+    "rcsbot_chart_store_lookups_total",
+    "Chart image lookups by variant and the tier that answered (memory, disk or miss)",
+    ("variant", "tier"),
+)
+
+
+def content_key(data: bytes) -> str:
+    """Content address for raw image bytes (e.g. a code execution chart)."""
+    return hashlib.sha256(data).hexdigest()[:24]
+
+
+def chart_url(base_url: str, key: str, variant: str = "png") -> str:
+    return f"{base_url}{CHART_ROUTE}/{key}.{variant}"
+
+
+def mms_variant_url(url: str) -> str:
+    """Point a URL for one of our chart PNGs at its MMS-optimized variant; other URLs are unchanged."""
+    if not isinstance(url, str):
+        return url
+    return _CHART_URL_PATTERN.sub(lambda m: f"{CHART_ROUTE}/{m.group(1)}.{MMS_VARIANT}", url)
+
+
+class DiskTier:
+    """
+    Size-bounded directory of chart images, one file per key and variant.
+
+    Files are evicted least recently used first once the directory holds more
+    than max_bytes. Several processes may share the directory: entries are
+    content-addressed, so a concurrent write of the same key is harmless, and
+    each process enforces the budget over the files it knows about.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        """
+        Args:
+            path: Directory for the image files (created if missing)
+            max_bytes: Total size kept on disk
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        """Index existing files, oldest access first, so the LRU order survives restarts."""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def get(self, name: str) -> Optional[bytes]:
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._bytes -= self._files.pop(name, 0)
+            return None
+        with self._lock:
+            if name in self._files:
+                self._files.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def set(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.path, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write chart {name} to {self.path}: {e}")
+            return
+        with self._lock:
+            self._bytes += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "files": len(self._files),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class ChartStore:
+    """
+    Content-addressed chart images in two tiers: an in-memory LRU with TTL in
+    front of an optional size-bounded directory. Each chart key holds the
+    original PNG and the MMS-optimized JPEG, so a repeated chart is neither
+    redrawn nor re-optimized.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl: Optional[float] = 86400.0,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        """
+        Args:
+            max_size: Images (key and variant) kept in memory
+            ttl: Seconds an image stays in memory
+            disk_path: Directory for the disk tier, None to keep images in memory only
+            disk_max_bytes: Size budget of the disk tier
+        """
+        self._memory = TTLCache(max_size=max_size, ttl=ttl)
+        self._disk = DiskTier(disk_path, disk_max_bytes) if disk_path else None
+
+    def get(self, key: str, variant: str = "png") -> Optional[bytes]:
+        """Image bytes for a chart key and variant, or None if not stored."""
+        if variant not in VARIANTS or not _KEY_PATTERN.match(key):
+            return None
+        data = self._memory.get((key, variant))
+        if data is not None:
+            STORE_LOOKUPS.inc(variant=variant, tier="memory")
+            return data
+        if self._disk is not None:
+            data = self._disk.get(f"{key}.{variant}")
+            if data is not None:
+                STORE_LOOKUPS.inc(variant=variant, tier="disk")
+                self._memory.set((key, variant), data)
+                return data
+        STORE_LOOKUPS.inc(variant=variant, tier="miss")
+        return None
+
+    def set(self, key: str, variant: str, data: bytes) -> None:
+        if variant not in VARIANTS or not _KEY_PATTERN.match(key):
+            raise ValueError(f"invalid chart key or variant: {key}.{variant}")
+        self._memory.set((key, variant), data)
+        if self._disk is not None:
+            self._disk.set(f"{key}.{variant}", data)
+
+    def get_or_create(self, key: str, variant: str, build: Callable[[], bytes]) -> bytes:
+        """Stored image, or build it, store it in both tiers and return it."""
+        data = self.get(key, variant)
+        if data is None:
+            data = build()
+            self.set(key, variant, data)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self._memory.stats(),
+            "disk": self._disk.stats() if self._disk is not None else None,
+        }
+
+
+_chart_store: Optional[ChartStore] = None
+_chart_store_lock = threading.Lock()
+
+
+def get_chart_store() -> ChartStore:
+    """Process-wide chart store, configured from CHART_STORE_* settings."""
+    global _chart_store
+    with _chart_store_lock:
+        if _chart_store is None:
+            # Chart URLs are fetched later by Pinnacle and may reach any worker,
+            # so images go to a directory all workers on the host share unless
+            # CHART_STORE_DIR is explicitly set to ""
+            disk_path = os.getenv("CHART_STORE_DIR", DEFAULT_CHART_STORE_DIR) or None
+            kwargs = dict(
+                max_size=env_int("CHART_STORE_MAX_SIZE", 256),
+                ttl=env_float("CHART_STORE_TTL", 86400.0),
+                disk_max_bytes=env_int("CHART_STORE_DISK_MAX_MB", 256) * 1024 * 1024,
+            )
+            try:
+                _chart_store = ChartStore(disk_path=disk_path, **kwargs)
+            except OSError as e:
+                logger.error(f"Chart store directory {disk_path} is unusable, keeping charts in memory only: {e}")
+                _chart_store = ChartStore(**kwargs)
+        return _chart_store
@@ -0,0 +1,193 @@
+import copy
+import logging
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from intervention_rules import hours_since_last_interaction, time_of_day_for_hour
+from intervention_runner import GenerationUnit, InterventionJob, InterventionRunner, SkippedJob
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Per-user values the model may reference in a cohort template. Anything else
+# in double braces (e.g. {{GRAPH_URL}}) is left for later processing.
+TEMPLATE_FIELDS = {
+    "last_meal_hours": "hours since the user's last meal",
+    "hours_since_interaction": "hours since the user last messaged us",
+}
+
+_PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(" + "|".join(TEMPLATE_FIELDS) + r")\s*\}\}")
+
+
+def meal_bucket(last_meal: Any) -> str:
+    if not isinstance(last_meal, (int, float)):
+        return "unknown"
+    if last_meal < 3:
+        return "recent"
+    if last_meal < 6:
+        return "due"
+    return "overdue"
+
+
+def interaction_bucket(hours_since_interaction: float) -> str:
+    if hours_since_interaction < 6:
+        return "recent"
+    if hours_since_interaction < 24:
+        return "today"
+    return "inactive"
+
+
+class Cohort:
+    """Due users that share an intervention type, time of day and context buckets."""
+
+    def __init__(self, key: Tuple[str, ...]):
+        self.key = key
+        self.members: List[InterventionJob] = []
+
+    @property
+    def intervention_type(self) -> str:
+        return self.key[0]
+
+    def shared_context(self) -> Dict[str, Any]:
+        """Context common to every member, sent to the model instead of a user's own."""
+        intervention_type, time_of_day, location, activity, meal, interaction = self.key
+        return {
+            "intervention_type": intervention_type,
+            "time_of_day": time_of_day,
+            "location": location,
+            "activity": activity,
+            "last_meal": meal,
+            "last_interaction": interaction,
+        }
+
+
+def cohort_key(context: Dict[str, Any], intervention_type: str, time_of_day: str) -> Tuple[str, ...]:
+    """
+    Args:
+        time_of_day: Time of day of the run; the context's own time_of_day is
+            from the user's last message and may be hours old
+    """
+    return (
+        intervention_type,
+        time_of_day,
+        context.get("location", "unknown"),
+        context.get("activity", "unknown"),
+        meal_bucket(context.get("last_meal")),
+        interaction_bucket(hours_since_last_interaction(context)),
+    )
+
+
+def group_into_cohorts(jobs: Iterable[InterventionJob], now: Optional[datetime] = None) -> List[Cohort]:
+    """Group due users by cohort_key at the run time now, preserving first-seen order."""
+    time_of_day = time_of_day_for_hour((now or datetime.now()).hour)
+    cohorts: Dict[Tuple[str, ...], Cohort] = {}
+    for job in jobs:
+        phone_number, context, intervention_type = job
+        key = cohort_key(context, intervention_type, time_of_day)
+        if key not in cohorts:
+            cohorts[key] = Cohort(key)
+        cohorts[key].members.append(job)
+    return list(cohorts.values())
+
+
+def build_template_request(cohort: Cohort) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Build the call_gemini conversation and context for a cohort template.
+
+    Returns:
+        (conversation_slice, context_data)
+    """
+    placeholders = "\n".join(
+        f"- {{{{{name}}}}}: {description}" for name, description in TEMPLATE_FIELDS.items()
+    )
+    conversation = [
+        {
+            "role": "user",
+            "content": (
+                f"SYSTEM: Generate a scheduled {cohort.intervention_type} intervention. "
+                f"It will be sent to {len(cohort.members)} users who share the context below, "
+                "so do not mention any other personal details. Where a per-user value belongs, "
+                f"write one of these placeholders exactly and it will be filled in:\n{placeholders}"
+            ),
+        }
+    ]
+    return conversation, cohort.shared_context()
+
+
+def template_values(context: Dict[str, Any]) -> Dict[str, str]:
+    """Per-user values for the TEMPLATE_FIELDS placeholders."""
+    last_meal = context.get("last_meal")
+    return {
+        "last_meal_hours": str(last_meal) if last_meal is not None else "a few",
+        "hours_since_interaction": str(int(hours_since_last_interaction(context))),
+    }
+
+
+def fill_template(template: Any, values: Dict[str, str]) -> Any:
+    """Return a copy of an RCS response with known placeholders replaced."""
+    if isinstance(template, str):
+        return _PLACEHOLDER_PATTERN.sub(lambda m: values.get(m.group(1), m.group(0)), template)
+    if isinstance(template, dict):
+        return {key: fill_template(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill_template(item, values) for item in template]
+    return copy.copy(template)
+
+
+class CohortInterventionRunner(InterventionRunner):
+    """
+    InterventionRunner that makes one LLM call per cohort instead of per user.
+
+    Each cohort's template is generated on the LLM pool; as soon as it is
+    ready, every member's copy is filled locally and queued on the send pool.
+    Grouping needs every due user up front, so jobs are read eagerly.
+    """
+
+    def __init__(
+        self,
+        generate_template: Callable[[Cohort], Dict[str, Any]],
+        send: Callable[[str, Dict[str, Any], str], str],
+        llm_concurrency: int = 4,
+        send_concurrency: int = 8,
+        max_pending: int = 0,
+        clock: Callable[[], datetime] = datetime.now,
+    ):
+        """
+        Args:
+            generate_template: cohort -> RCS response containing placeholders
+            send: (phone_number, rcs_response, intervention_type) -> message type sent
+            llm_concurrency: Maximum concurrent template generations
+            send_concurrency: Maximum concurrent send calls
+            max_pending: Outstanding generations/sends before new cohorts wait
+            clock: Source of the run's current time, which sets the cohorts' time of day
+        """
+        super().__init__(
+            generate=None,
+            send=send,
+            llm_concurrency=llm_concurrency,
+            send_concurrency=send_concurrency,
+            max_pending=max_pending,
+        )
+        self.generate_template = generate_template
+        self.clock = clock
+
+    def _generation_units(
+        self, jobs: Iterable[Union[InterventionJob, SkippedJob]]
+    ) -> Iterator[Union[GenerationUnit, SkippedJob]]:
+        # Skipped users pass straight through while due users are collected
+        due: List[InterventionJob] = []
+        for job in jobs:
+            if isinstance(job, SkippedJob):
+                yield job
+            else:
+                due.append(job)
+        cohorts = group_into_cohorts(due, self.clock())
+        logger.info(
+            f"Grouped {sum(len(c.members) for c in cohorts)} due users into {len(cohorts)} cohorts"
+        )
+        for cohort in cohorts:
+            yield cohort.members, self.generate_template, (cohort,)
+
+    def _personalize(self, job: InterventionJob, rcs_response: Dict[str, Any]) -> Dict[str, Any]:
+        return fill_template(rcs_response, template_values(job[1]))
@@ -0,0 +1,34 @@
+import os
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """
+    Read a boolean flag from the environment.
+
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is not set
+
+    Returns:
+        True for "true", "1" or "yes" (case-insensitive), otherwise False
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("true", "1", "yes")
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default."""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back to default."""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return float(value)
@@ -0,0 +1,224 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from config import env_float
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Seconds re-read by items_updated_since to catch writes that committed late
+UPDATED_AT_OVERLAP = 5.0
+
+
+class ContextStore:
+    """Interface for storing per-user context dicts keyed by phone number."""
+
+    def get(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """Return the user's context, or None if the user is unknown."""
+        raise NotImplementedError
+
+    def set(self, phone_number: str, context: Dict[str, Any]) -> None:
+        """Store (replace) the user's context."""
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over (phone_number, context) for every known user."""
+        raise NotImplementedError
+
+    def items_updated_since(self, since: float) -> Iterator[Tuple[str, Dict[str, Any], float]]:
+        """Iterate over (phone_number, context, updated_at) for users written after since."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Persist any buffered writes."""
+
+    def close(self) -> None:
+        """Flush and release resources."""
+        self.flush()
+
+
+class InMemoryContextStore(ContextStore):
+    """
+    Process-local store. get() returns the stored dict itself, so in-place
+    changes are visible immediately; only suitable for a single worker.
+    """
+
+    def __init__(self):
+        self._contexts: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        return self._contexts.get(phone_number)
+
+    def set(self, phone_number: str, context: Dict[str, Any]) -> None:
+        self._contexts[phone_number] = context
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # Copy so callers can update contexts while iterating
+        return iter(list(self._contexts.items()))
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+
+class SQLiteContextStore(ContextStore):
+    """
+    Context store in a SQLite database in WAL mode, shareable by several
+    worker processes on the same host.
+
+    With write_behind_interval > 0, set() only buffers the context and a
+    background thread writes buffered contexts in batches. Reads in the same
+    process see buffered writes; other processes see them after the next flush.
+    """
+
+    def __init__(self, path: str, write_behind_interval: float = 0.0):
+        """
+        Args:
+            path: SQLite database file
+            write_behind_interval: Seconds between batched writes, 0 to write through
+        """
+        self.path = path
+        self.write_behind_interval = write_behind_interval
+        self._local = threading.local()
+        self._pending: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        # Serializes flushes so an older batch never commits after a newer one
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_contexts ("
+            "phone_number TEXT PRIMARY KEY, "
+            "context TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS user_contexts_updated_at ON user_contexts (updated_at)"
+        )
+        conn.commit()
+
+        if write_behind_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="context-store-flusher", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.close)
+
+        logger.info(
+            f"Using SQLite context store at {path}"
+            + (f" (write-behind every {write_behind_interval}s)" if self._flusher else "")
+        )
+
+    def get(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        with self._pending_lock:
+            pending = self._pending.get(phone_number)
+        if pending is not None:
+            return json.loads(pending)
+
+        row = self._conn().execute(
+            "SELECT context FROM user_contexts WHERE phone_number = ?", (phone_number,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, phone_number: str, context: Dict[str, Any]) -> None:
+        data = json.dumps(context, default=str)
+        if self._flusher is not None:
+            with self._pending_lock:
+                self._pending[phone_number] = data
+            return
+        self._write({phone_number: data})
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        self.flush()
+        cursor = self._conn().execute("SELECT phone_number, context FROM user_contexts")
+        for phone_number, data in cursor:
+            yield phone_number, json.loads(data)
+
+    def items_updated_since(self, since: float) -> Iterator[Tuple[str, Dict[str, Any], float]]:
+        # updated_at is stamped before the write commits, so a slow writer in
+        # another process can commit a slightly older timestamp after we have
+        # read past it; re-reading a short overlap catches those rows
+        self.flush()
+        cursor = self._conn().execute(
+            "SELECT phone_number, context, updated_at FROM user_contexts WHERE updated_at > ?",
+            (since - UPDATED_AT_OVERLAP,),
+        )
+        for phone_number, data, updated_at in cursor:
+            yield phone_number, json.loads(data), updated_at
+
+    def __len__(self) -> int:
+        self.flush()
+        return self._conn().execute("SELECT COUNT(*) FROM user_contexts").fetchone()[0]
+
+    def flush(self) -> None:
+        # Buffered contexts stay in _pending (and are served by get) until the
+        # write commits, so a failed write is retried by the next flush. Only
+        # entries not overwritten meanwhile are removed afterwards.
+        with self._flush_lock:
+            with self._pending_lock:
+                batch = dict(self._pending)
+            if not batch:
+                return
+            self._write(batch)
+            with self._pending_lock:
+                for phone_number, data in batch.items():
+                    if self._pending.get(phone_number) is data:
+                        del self._pending[phone_number]
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite connections are not thread-safe
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, batch: Dict[str, str]) -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO user_contexts (phone_number, context, updated_at) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT(phone_number) DO UPDATE SET "
+                "context = excluded.context, updated_at = excluded.updated_at",
+                [(phone, data, now) for phone, data in batch.items()],
+            )
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.write_behind_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush user contexts: {e}")
+
+
+def create_context_store() -> ContextStore:
+    """
+    Build the context store selected by CONTEXT_STORE ("memory" or "sqlite").
+    """
+    backend = os.getenv("CONTEXT_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteContextStore(
+            path=os.getenv("CONTEXT_STORE_PATH", "user_contexts.db"),
+            write_behind_interval=env_float("CONTEXT_STORE_WRITE_BEHIND", 0.0),
+        )
+    if backend != "memory":
+        logger.warning(f"Unknown CONTEXT_STORE '{backend}', using in-memory store")
+    return InMemoryContextStore()
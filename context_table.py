@@ -0,0 +1,213 @@
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from intervention_rules import (
+    BASE_PROBABILITY,
+    MIN_HOURS_SINCE_INTERACTION,
+    PROBABILITY_BANDS,
+    intervention_types_for_hour,
+    is_quiet_hour,
+    last_interaction_time,
+)
+
+# Bit flags stored per user
+FLAG_HAS_GLUCOSE = 1
+FLAG_HAS_MEDICATION_ADHERENCE = 2
+
+
+def _latest_glucose(readings: Any) -> float:
+    if not readings or not isinstance(readings, list):
+        return np.nan
+    latest = readings[-1]
+    if isinstance(latest, dict):
+        latest = latest.get("value")
+    try:
+        return float(latest)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class ContextTable:
+    """
+    Columnar copy of the numeric parts of every user context.
+
+    Rows are kept in NumPy arrays (last interaction as epoch seconds, hours
+    since last meal, latest glucose, flags) so scheduled-intervention
+    eligibility and type selection can be computed for the whole population
+    in one vectorized pass instead of a Python loop over contexts.
+    """
+
+    def __init__(self, capacity: int = 1024, seed: Optional[int] = None):
+        """
+        Args:
+            capacity: Initial number of rows allocated
+            seed: Seed for the random generator used by plan()
+        """
+        self.rng = np.random.default_rng(seed)
+        # Newest store updated_at applied by refresh()
+        self.synced_until = 0.0
+        self._lock = threading.RLock()
+        self._index: Dict[str, int] = {}
+        self._phones: List[str] = []
+        self._size = 0
+        self.last_interaction = np.zeros(capacity, dtype=np.float64)
+        self.last_meal = np.full(capacity, np.nan, dtype=np.float32)
+        self.glucose = np.full(capacity, np.nan, dtype=np.float32)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+
+    def reload(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Rebuild the table from (phone_number, context) pairs."""
+        staging = ContextTable()
+        for phone_number, context in items:
+            staging.upsert(phone_number, context)
+        size = len(staging)
+        self.set_arrays(
+            staging.phone_numbers,
+            staging.last_interaction[:size],
+            staging.last_meal[:size],
+            staging.glucose[:size],
+            staging.flags[:size],
+        )
+
+    def refresh(self, updates: Iterable[Tuple[str, Dict[str, Any], float]]) -> int:
+        """
+        Upsert the rows a shared store changed since the last refresh.
+
+        Args:
+            updates: (phone_number, context, updated_at) from
+                ContextStore.items_updated_since(synced_until)
+
+        Returns:
+            Number of rows refreshed
+        """
+        count = 0
+        for phone_number, context, updated_at in updates:
+            self.upsert(phone_number, context)
+            self.synced_until = max(self.synced_until, updated_at)
+            count += 1
+        return count
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def phone_numbers(self) -> List[str]:
+        return self._phones[: self._size]
+
+    def upsert(self, phone_number: str, context: Dict[str, Any]) -> None:
+        """Insert or refresh a user's row from their context dict."""
+        last_meal = context.get("last_meal")
+        flags = 0
+        if context.get("glucose_readings"):
+            flags |= FLAG_HAS_GLUCOSE
+        if context.get("medication_adherence"):
+            flags |= FLAG_HAS_MEDICATION_ADHERENCE
+
+        with self._lock:
+            row = self._index.get(phone_number)
+            if row is None:
+                row = self._size
+                if row == len(self.last_interaction):
+                    self._grow()
+                self._index[phone_number] = row
+                self._phones.append(phone_number)
+                self._size += 1
+            self.last_interaction[row] = last_interaction_time(context).timestamp()
+            self.last_meal[row] = last_meal if isinstance(last_meal, (int, float)) else np.nan
+            self.glucose[row] = _latest_glucose(context.get("glucose_readings"))
+            self.flags[row] = flags
+
+    def set_arrays(
+        self,
+        phone_numbers: List[str],
+        last_interaction: np.ndarray,
+        last_meal: Optional[np.ndarray] = None,
+        glucose: Optional[np.ndarray] = None,
+        flags: Optional[np.ndarray] = None,
+    ) -> None:
+        """Replace the whole table from column arrays (bulk load)."""
+        size = len(phone_numbers)
+        with self._lock:
+            self._phones = list(phone_numbers)
+            self._index = {phone: row for row, phone in enumerate(self._phones)}
+            self._size = size
+            self.last_interaction = np.asarray(last_interaction, dtype=np.float64).copy()
+            self.last_meal = (
+                np.full(size, np.nan, dtype=np.float32)
+                if last_meal is None
+                else np.asarray(last_meal, dtype=np.float32).copy()
+            )
+            self.glucose = (
+                np.full(size, np.nan, dtype=np.float32)
+                if glucose is None
+                else np.asarray(glucose, dtype=np.float32).copy()
+            )
+            self.flags = (
+                np.zeros(size, dtype=np.uint8)
+                if flags is None
+                else np.asarray(flags, dtype=np.uint8).copy()
+            )
+
+    def intervention_probabilities(self, now: Optional[float] = None) -> np.ndarray:
+        """Per-user intervention chance from hours since last interaction."""
+        now = datetime.now().timestamp() if now is None else now
+        with self._lock:
+            hours = (now - self.last_interaction[: self._size]) / 3600
+        conditions = [hours < MIN_HOURS_SINCE_INTERACTION]
+        choices = [0.0]
+        for min_hours, probability in PROBABILITY_BANDS:
+            conditions.append(hours > min_hours)
+            choices.append(probability)
+        return np.select(conditions, choices, default=BASE_PROBABILITY)
+
+    def due_mask(
+        self,
+        current_hour: int,
+        rng: np.random.Generator,
+        now: Optional[float] = None,
+    ) -> np.ndarray:
+        """Boolean mask of users who should get an intervention on this run."""
+        if is_quiet_hour(current_hour):
+            return np.zeros(self._size, dtype=bool)
+        probabilities = self.intervention_probabilities(now)
+        return rng.random(len(probabilities)) < probabilities
+
+    def plan(
+        self,
+        current_hour: int,
+        rng: Optional[np.random.Generator] = None,
+        now: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        Decide who is due and which intervention each gets, in one pass.
+
+        Args:
+            current_hour: Hour of day used for quiet hours and type selection
+            rng: Random generator (defaults to the table's seeded generator)
+            now: Epoch seconds to measure time since last interaction from
+
+        Returns:
+            (due mask, array of intervention types per due user, the phone
+            numbers the mask covers, taken under the same lock)
+        """
+        with self._lock:
+            rng = rng or self.rng
+            mask = self.due_mask(current_hour, rng, now)
+            types = np.asarray(intervention_types_for_hour(current_hour), dtype=object)
+            return mask, types[rng.integers(len(types), size=int(mask.sum()))], self.phone_numbers
+
+    def _grow(self) -> None:
+        # Caller holds the lock
+        capacity = max(len(self.last_interaction) * 2, 1024)
+        extra = capacity - len(self.last_interaction)
+        self.last_interaction = np.concatenate(
+            [self.last_interaction, np.zeros(extra, dtype=np.float64)]
+        )
+        self.last_meal = np.concatenate(
+            [self.last_meal, np.full(extra, np.nan, dtype=np.float32)]
+        )
+        self.glucose = np.concatenate([self.glucose, np.full(extra, np.nan, dtype=np.float32)])
+        self.flags = np.concatenate([self.flags, np.zeros(extra, dtype=np.uint8)])
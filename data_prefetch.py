@@ -0,0 +1,120 @@
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from fhir_data import get_patient_data
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# get_patient_data types in prompt order, with the words that ask for them
+INTENT_KEYWORDS = {
+    "labs": {
+        "lab", "labs", "test", "tests", "result", "results", "bloodwork", "cholesterol",
+        "ldl", "hdl", "a1c", "hba1c", "triglyceride", "triglycerides", "glucose", "sugar",
+        "creatinine", "kidney",
+    },
+    "vitals": {
+        "vital", "vitals", "bp", "blood pressure", "pressure", "heart rate", "pulse",
+        "weight", "weigh", "bmi", "temperature", "height",
+    },
+    "medications": {
+        "medication", "medications", "med", "meds", "medicine", "pill", "pills", "dose",
+        "dosage", "prescription", "refill", "drug", "drugs", "metformin", "lisinopril",
+    },
+    "conditions": {
+        "condition", "conditions", "diagnosis", "diagnosed", "diabetes", "diabetic",
+        "hypertension", "disease", "illness",
+    },
+}
+# Questions about the whole record get everything
+SUMMARY_KEYWORDS = {"summary", "overview", "everything", "record", "records", "my health"}
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+PREFETCH_TURNS = counter(
+    "rcsbot_patient_data_prefetch_total",
+    "Model turns by whether patient data was prefetched into the prompt and "
+    "whether the model still called get_patient_data",
+    ("prefetched", "tool_called"),
+)
+
+
+def _matches(words: List[str], keywords: Sequence[str]) -> bool:
+    text = f" {' '.join(words)} "
+    return any(f" {keyword} " in text for keyword in keywords)
+
+
+def detect_data_types(text: str) -> List[str]:
+    """
+    Guess which get_patient_data types a message needs from keywords.
+
+    Returns:
+        Matching data types in INTENT_KEYWORDS order, ["all"] for summary
+        questions or when three or more types match, or [] if none match
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if not words:
+        return []
+    if _matches(words, SUMMARY_KEYWORDS):
+        return ["all"]
+    data_types = [
+        data_type for data_type, keywords in INTENT_KEYWORDS.items() if _matches(words, keywords)
+    ]
+    return ["all"] if len(data_types) >= 3 else data_types
+
+
+def build_prefetch_block(
+    data_types: List[str],
+    fetch: Callable[[str], Dict[str, Any]] = get_patient_data,
+    max_chars: int = 8000,
+) -> Tuple[List[str], str]:
+    """
+    Fetch the projections for the detected data types and format them for
+    the prompt. Types whose data would push the block past max_chars are
+    left for the model to fetch itself.
+
+    Returns:
+        (data types included, text block to append to the prompt or "")
+    """
+    included: List[str] = []
+    data: Dict[str, Any] = {}
+    size = 0
+    for data_type in data_types:
+        try:
+            projection = fetch(data_type)
+        except Exception as e:
+            logger.warning(f"Patient data prefetch for {data_type} failed: {e}")
+            continue
+        if not projection:
+            continue
+        encoded = json.dumps(projection, default=str)
+        if size + len(encoded) > max_chars:
+            continue
+        size += len(encoded)
+        included.append(data_type)
+        data.update(projection)
+
+    if not included:
+        return [], ""
+    block = (
+        "\nPatient data already retrieved with get_patient_data("
+        + ", ".join(included)
+        + "). Use it directly; only call get_patient_data for other data types:\n"
+        + json.dumps(data, default=str)
+        + "\n"
+    )
+    return included, block
+
+
+def record_prefetch_outcome(prefetched: List[str], tool_calls: List[str]) -> None:
+    """Count whether the model still fetched patient data after the prompt was built."""
+    tool_called = "get_patient_data" in tool_calls
+    PREFETCH_TURNS.inc(
+        prefetched="true" if prefetched else "false",
+        tool_called="true" if tool_called else "false",
+    )
+    if prefetched and tool_called:
+        logger.info(f"Model called get_patient_data despite prefetched {prefetched}")
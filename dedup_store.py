@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def webhook_dedup_key(webhook_data: Dict[str, Any]) -> str:
+    """
+    Build the idempotency key for an inbound webhook event.
+
+    Uses the inbound message ID when Pinnacle provides one, otherwise a hash
+    of sender, text, payload and timestamp.
+    """
+    message_id = (
+        webhook_data.get("messageId")
+        or webhook_data.get("message_id")
+        or webhook_data.get("id")
+    )
+    if message_id:
+        return f"id:{message_id}"
+
+    fingerprint = json.dumps(
+        [
+            webhook_data.get("from", ""),
+            webhook_data.get("text", ""),
+            webhook_data.get("payload", ""),
+            webhook_data.get("timestamp", ""),
+        ],
+        sort_keys=True,
+    )
+    return "hash:" + hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+class DedupStore:
+    """
+    Bounded store of recently seen inbound message keys.
+
+    An in-memory LRU with TTL answers most lookups; an optional SQLite file
+    makes the seen-set survive restarts and be shared between worker processes.
+    """
+
+    def __init__(
+        self, max_size: int = 10000, ttl: float = 86400.0, db_path: Optional[str] = None
+    ):
+        """
+        Args:
+            max_size: Maximum number of keys kept in memory
+            ttl: Seconds a key is remembered
+            db_path: Optional SQLite file backing the in-memory store
+        """
+        self.ttl = ttl
+        self._memory = TTLCache(max_size=max_size, ttl=ttl)
+        self._db: Optional[sqlite3.Connection] = None
+        # Guards the SQLite connection and the counters (webhook threads)
+        self._lock = threading.Lock()
+        self._inserts_since_purge = 0
+
+        self.checked = 0
+        self.duplicates = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen_messages "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"Webhook dedup store backed by SQLite at {db_path}")
+
+    def check_and_add(self, key: str, ttl: Optional[float] = None) -> bool:
+        """
+        Record a key and report whether it is new.
+
+        Args:
+            key: Idempotency key from webhook_dedup_key()
+            ttl: Overrides the default time-to-live for this key
+
+        Returns:
+            True the first time a key is seen, False for duplicates
+        """
+        ttl = self.ttl if ttl is None else ttl
+        is_new = self._memory.add(key, ttl=ttl)
+        if is_new and self._db is not None:
+            is_new = self._db_add(key, ttl)
+
+        with self._lock:
+            self.checked += 1
+            if not is_new:
+                self.duplicates += 1
+        return is_new
+
+    def discard(self, key: str) -> None:
+        """Forget a key so a redelivery is processed again (e.g. after a failure)."""
+        self._memory.pop(key)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM seen_messages WHERE key = ?", (key,))
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for checked events and dropped duplicates."""
+        with self._lock:
+            checked, duplicates = self.checked, self.duplicates
+        return {
+            "checked": checked,
+            "duplicates_dropped": duplicates,
+            # Every dropped duplicate would have been a full LLM call + send
+            "llm_calls_saved": duplicates,
+            "memory_size": len(self._memory),
+            "sqlite_backed": self._db is not None,
+        }
+
+    def _db_add(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM seen_messages WHERE key = ? AND expires_at <= ?", (key, now)
+            )
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO seen_messages (key, expires_at) VALUES (?, ?)",
+                (key, now + ttl),
+            )
+            added = cursor.rowcount == 1
+
+            self._inserts_since_purge += 1
+            if self._inserts_since_purge >= 1000:
+                self._db.execute("DELETE FROM seen_messages WHERE expires_at <= ?", (now,))
+                self._inserts_since_purge = 0
+
+            self._db.commit()
+        return added
@@ -233,6 +233,45 @@ SAMPLE_PATIENT = {
 }
 
 import logging
+import threading
+
+# Callbacks run after patient data changes (e.g. to drop cached responses)
+_change_listeners = []
+_change_lock = threading.Lock()
+_data_version = 0
+
+
+def patient_data_version():
+    """Counter bumped on every update_patient_data call (for cache keys)."""
+    return _data_version
+
+
+def on_patient_data_change(callback):
+    """Register a callback(changed_keys) run whenever patient data is updated."""
+    with _change_lock:
+        _change_listeners.append(callback)
+    return callback
+
+
+def update_patient_data(updates):
+    """
+    Apply updates to the patient record and notify change listeners.
+
+    Args:
+        updates: Top-level patient fields to replace (e.g. {"labResults": [...]})
+    """
+    global _data_version
+    with _change_lock:
+        SAMPLE_PATIENT.update(updates)
+        _data_version += 1
+        listeners = list(_change_listeners)
+    logging.info(f"Patient data updated: {', '.join(updates)}")
+    for callback in listeners:
+        try:
+            callback(list(updates))
+        except Exception as e:
+            logging.error(f"Patient data change listener failed: {e}")
+
 
 def get_patient_data(data_type='all'):
     logging.info(f"Retrieving FHIR patient data for type: {data_type}")
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Optional
+
+from google import genai
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class GeminiRuntime:
+    """
+    Process-wide home for Gemini work.
+
+    Owns one background event loop thread and one genai.Client, so each
+    message no longer pays for a new event loop and a fresh TLS/HTTP2 setup.
+    Flask handlers hand coroutines over with submit()/run(); code that already
+    runs in its own event loop can await run_async().
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the background event loop thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(
+                target=_run_loop, name="gemini-runtime", daemon=True
+            )
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+        logger.info("Gemini runtime event loop started")
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The runtime's event loop, started on first use."""
+        if self._loop is None:
+            self.start()
+        return self._loop
+
+    @property
+    def client(self) -> genai.Client:
+        """The shared genai.Client, created on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = genai.Client(
+                        api_key=os.getenv("GEMINI_API_KEY"),
+                        http_options={"api_version": "v1alpha"},  # Live (experimental)
+                    )
+        return self._client
+
+    def submit(self, coro: Awaitable[Any]) -> Future:
+        """
+        Schedule a coroutine on the runtime loop from any thread.
+
+        Returns:
+            A concurrent.futures.Future with the coroutine's result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the runtime loop and block until it finishes.
+
+        Must not be called from the runtime loop itself (it would deadlock).
+        """
+        if self._thread is not None and threading.current_thread() is self._thread:
+            raise RuntimeError("GeminiRuntime.run() called from the runtime loop")
+        return self.submit(coro).result(timeout=timeout)
+
+    async def run_async(self, coro: Awaitable[Any]) -> Any:
+        """Await a coroutine on the runtime loop from another event loop."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def shutdown(self) -> None:
+        """Stop the event loop and wait for its thread to exit."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join()
+
+
+_runtime: Optional[GeminiRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> GeminiRuntime:
+    """Return the process-wide GeminiRuntime, starting it if needed."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = GeminiRuntime()
+                _runtime.start()
+    return _runtime
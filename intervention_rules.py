@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+# Rules deciding who gets a scheduled intervention and of which type. The
+# tables are shared by the per-user functions below and the vectorized
+# version in context_table.py.
+
+# Interventions are never sent during quiet hours (11pm-6am)
+QUIET_HOURS_START = 23
+QUIET_HOURS_END = 6
+
+# Don't send if user interacted in the last hour
+MIN_HOURS_SINCE_INTERACTION = 1.0
+
+# Higher chance of intervention if it's been a while:
+# (more than N hours since last interaction, chance), checked in order
+PROBABILITY_BANDS: Tuple[Tuple[float, float], ...] = ((24, 0.8), (12, 0.5), (6, 0.3))
+BASE_PROBABILITY = 0.1
+
+# (start hour, end hour, intervention types to pick from), checked in order
+INTERVENTION_TYPES_BY_HOUR: Tuple[Tuple[int, int, List[str]], ...] = (
+    # Morning (6am-10am): Focus on glucose and medication
+    (6, 10, ["glucose", "medication"]),
+    # Middle of day (10am-2pm): Focus on activity
+    (10, 14, ["activity", "glucose"]),
+    # Afternoon (2pm-6pm): Mix of all types
+    (14, 18, ["glucose", "activity", "medication"]),
+)
+# Evening (6pm-11pm): Focus on medication and educational
+DEFAULT_INTERVENTION_TYPES = ["medication", "educational"]
+
+DEFAULT_LAST_INTERACTION = "2020-01-01T00:00:00"
+
+
+def is_quiet_hour(hour: int) -> bool:
+    """Whether interventions are suppressed at this hour of the day."""
+    return hour >= QUIET_HOURS_START or hour < QUIET_HOURS_END
+
+
+def last_interaction_time(context: Dict[str, Any]) -> datetime:
+    return datetime.fromisoformat(context.get("last_interaction", DEFAULT_LAST_INTERACTION))
+
+
+def hours_since_last_interaction(context: Dict[str, Any]) -> float:
+    return (datetime.now() - last_interaction_time(context)).total_seconds() / 3600
+
+
+def intervention_probability(hours_since_interaction: float) -> float:
+    """Chance of sending an intervention given hours since the last interaction."""
+    if hours_since_interaction < MIN_HOURS_SINCE_INTERACTION:
+        return 0.0
+    for min_hours, probability in PROBABILITY_BANDS:
+        if hours_since_interaction > min_hours:
+            return probability
+    return BASE_PROBABILITY
+
+
+def time_of_day_for_hour(hour: int) -> str:
+    """Time of day classification (morning, afternoon, evening, night) for an hour."""
+    if 5 <= hour < 12:
+        return "morning"
+    elif 12 <= hour < 17:
+        return "afternoon"
+    elif 17 <= hour < 22:
+        return "evening"
+    else:
+        return "night"
+
+
+def intervention_types_for_hour(hour: int) -> List[str]:
+    """Intervention types suitable at this hour of the day."""
+    for start, end, types in INTERVENTION_TYPES_BY_HOUR:
+        if start <= hour < end:
+            return types
+    return DEFAULT_INTERVENTION_TYPES
+
+
+def next_intervention_check(
+    context: Dict[str, Any], not_before: datetime = None
+) -> datetime:
+    """
+    Earliest time a user can next be considered for an intervention: an hour
+    after their last interaction (and not before not_before), moved past
+    quiet hours.
+    """
+    check_at = max(
+        last_interaction_time(context) + timedelta(hours=MIN_HOURS_SINCE_INTERACTION),
+        not_before or datetime.now(),
+    )
+
+    if check_at.hour >= QUIET_HOURS_START:
+        check_at = (check_at + timedelta(days=1)).replace(
+            hour=QUIET_HOURS_END, minute=0, second=0, microsecond=0
+        )
+    elif check_at.hour < QUIET_HOURS_END:
+        check_at = check_at.replace(hour=QUIET_HOURS_END, minute=0, second=0, microsecond=0)
+    return check_at
+
+
+def determine_if_intervention_needed(
+    phone_number: str, context: Dict[str, Any], current_hour: int
+) -> bool:
+    """
+    Determine if an intervention should be sent based on user data and time.
+    In a real app, this would use more sophisticated logic.
+    """
+    if is_quiet_hour(current_hour):
+        return False
+
+    # Randomize a bit to avoid predictability
+    probability = intervention_probability(hours_since_last_interaction(context))
+    return probability > 0 and random.random() < probability
+
+
+def select_intervention_type(context: Dict[str, Any], current_hour: int) -> str:
+    """
+    Select which type of intervention to send based on context and time.
+    In a real app, this would use more sophisticated logic.
+    """
+    return random.choice(intervention_types_for_hour(current_hour))
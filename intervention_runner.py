@@ -0,0 +1,246 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# (phone_number, context, intervention_type)
+InterventionJob = Tuple[str, Dict[str, Any], str]
+
+
+class SkippedJob:
+    """
+    Yielded by a job iterable in place of a job for a user who gets no
+    intervention; iter_run passes its result straight through, so skipped
+    users are reported as soon as they are scanned.
+    """
+
+    def __init__(self, result: Dict[str, Any]):
+        self.result = result
+
+
+# (jobs covered by one LLM call, generate function, its args)
+GenerationUnit = Tuple[List[InterventionJob], Callable[..., Dict[str, Any]], tuple]
+
+
+class StageStats:
+    """Running count/total/max of stage durations (constant memory)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 3),
+            "avg_seconds": round(self.total / self.count, 3) if self.count else 0.0,
+            "max_seconds": round(self.max, 3),
+        }
+
+
+class RunSummary:
+    """Totals for one run, updated as results are produced."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.users = 0
+        self.sent = 0
+        self.failed = 0
+        self.llm_calls = 0
+        self.llm = StageStats()
+        self.send = StageStats()
+
+    def record(self, result: Dict[str, Any]) -> None:
+        self.users += 1
+        if result["status"] == "sent":
+            self.sent += 1
+        elif result["status"] == "failed":
+            self.failed += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "users": self.users,
+            "sent": self.sent,
+            "failed": self.failed,
+            "llm_calls": self.llm_calls,
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+            "llm": self.llm.summary(),
+            "send": self.send.summary(),
+        }
+
+
+class InterventionRunner:
+    """
+    Runs scheduled interventions for many users concurrently.
+
+    Generation (LLM) and delivery (send) use separate bounded thread pools, so
+    the Gemini and Pinnacle limits can be tuned independently. A user's send
+    starts as soon as their message has been generated.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str, Dict[str, Any], str], Dict[str, Any]],
+        send: Callable[[str, Dict[str, Any], str], str],
+        llm_concurrency: int = 4,
+        send_concurrency: int = 8,
+        max_pending: int = 0,
+    ):
+        """
+        Args:
+            generate: (phone_number, context, intervention_type) -> RCS response
+            send: (phone_number, rcs_response, intervention_type) -> message type sent
+            llm_concurrency: Maximum concurrent generate calls
+            send_concurrency: Maximum concurrent send calls
+            max_pending: Outstanding generations/sends before new jobs wait
+                (0 = twice the combined concurrency)
+        """
+        self.generate = generate
+        self.send = send
+        self.llm_concurrency = llm_concurrency
+        self.send_concurrency = send_concurrency
+        self.max_pending = max_pending or 2 * (llm_concurrency + send_concurrency)
+
+    def run(
+        self, jobs: Iterable[Union[InterventionJob, SkippedJob]]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Generate and send an intervention for every job.
+
+        Returns:
+            (per-user results, skipped users included, in completion order;
+            summary with stage timings)
+        """
+        summary = RunSummary()
+        results = list(self.iter_run(jobs, summary))
+        return results, summary.as_dict()
+
+    def iter_run(
+        self, jobs: Iterable[Union[InterventionJob, SkippedJob]], summary: Optional[RunSummary] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield per-user results as each user finishes.
+
+        Jobs are pulled from the iterable lazily and at most max_pending
+        generations/sends are outstanding, so memory stays flat however many
+        users there are. SkippedJob results are yielded as soon as they are
+        pulled. Pass a RunSummary to collect totals.
+        """
+        summary = summary or RunSummary()
+        units = self._generation_units(jobs)
+        # future -> (stage, jobs it covers, llm seconds)
+        pending: Dict[Future, Tuple[str, List[InterventionJob], float]] = {}
+        exhausted = False
+
+        with ThreadPoolExecutor(
+            max_workers=self.llm_concurrency, thread_name_prefix="intervention-llm"
+        ) as llm_pool, ThreadPoolExecutor(
+            max_workers=self.send_concurrency, thread_name_prefix="intervention-send"
+        ) as send_pool:
+
+            def submit_generations() -> Optional[SkippedJob]:
+                # Stops at a skipped user so it can be yielded right away
+                nonlocal exhausted
+                while not exhausted and len(pending) < self.max_pending:
+                    unit = next(units, None)
+                    if unit is None:
+                        exhausted = True
+                    elif isinstance(unit, SkippedJob):
+                        return unit
+                    else:
+                        members, generate, args = unit
+                        future = llm_pool.submit(self._timed, generate, *args)
+                        pending[future] = ("generate", members, 0.0)
+                return None
+
+            while True:
+                skipped = submit_generations()
+                if skipped is not None:
+                    yield skipped.result
+                    continue
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, members, llm_seconds = pending.pop(future)
+
+                    if stage == "generate":
+                        try:
+                            rcs_response, llm_seconds = future.result()
+                        except Exception as e:
+                            for job in members:
+                                result = self._failure(job, "generate", e)
+                                summary.record(result)
+                                yield result
+                            continue
+                        summary.llm_calls += 1
+                        summary.llm.add(llm_seconds)
+                        for job in members:
+                            send_future = send_pool.submit(
+                                self._timed,
+                                self.send,
+                                job[0],
+                                self._personalize(job, rcs_response),
+                                job[2],
+                            )
+                            pending[send_future] = ("send", [job], llm_seconds)
+                        continue
+
+                    job = members[0]
+                    try:
+                        message_type, send_seconds = future.result()
+                    except Exception as e:
+                        result = self._failure(job, "send", e)
+                        result["llm_seconds"] = round(llm_seconds, 3)
+                    else:
+                        summary.send.add(send_seconds)
+                        result = {
+                            "phone_number": job[0],
+                            "intervention_type": job[2],
+                            "status": "sent",
+                            "message_type": message_type,
+                            "llm_seconds": round(llm_seconds, 3),
+                            "send_seconds": round(send_seconds, 3),
+                        }
+                    summary.record(result)
+                    yield result
+
+    def _generation_units(
+        self, jobs: Iterable[Union[InterventionJob, SkippedJob]]
+    ) -> Iterator[Union[GenerationUnit, SkippedJob]]:
+        """Split jobs into LLM calls: (jobs covered, generate function, its args)."""
+        for job in jobs:
+            if isinstance(job, SkippedJob):
+                yield job
+            else:
+                yield [job], self.generate, job
+
+    def _personalize(self, job: InterventionJob, rcs_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Adapt a generated response for one user before it is sent."""
+        return rcs_response
+
+    @staticmethod
+    def _timed(fn: Callable[..., Any], *args) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+
+    @staticmethod
+    def _failure(job: InterventionJob, stage: str, error: Exception) -> Dict[str, Any]:
+        logger.error(f"Scheduled {job[2]} intervention for {job[0]} failed in {stage}: {error}")
+        return {
+            "phone_number": job[0],
+            "intervention_type": job[2],
+            "status": "failed",
+            "stage": stage,
+            "error": str(error),
+        }
@@ -0,0 +1,166 @@
+import heapq
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class InterventionScheduler:
+    """
+    In-process scheduler that wakes up only when users become due.
+
+    Each user's next eligible time lives in a min-heap keyed by timestamp.
+    Rescheduling a user pushes a new entry and leaves the old one to be
+    skipped when popped, so updates are O(log n) and a wake-up costs
+    O(due users * log n) regardless of how many users are known.
+    """
+
+    def __init__(
+        self,
+        on_due: Callable[[List[str]], None],
+        batch_limit: int = 1000,
+        clock: Callable[[], float] = time.time,
+        retry_delay: float = 300.0,
+    ):
+        """
+        Args:
+            on_due: Called from the scheduler thread with the phone numbers that are due
+            batch_limit: Maximum users handed to on_due per wake-up
+            clock: Source of the current epoch time (overridable for testing)
+            retry_delay: Seconds until users are due again when on_due raised
+                before rescheduling them
+        """
+        self.on_due = on_due
+        self.batch_limit = batch_limit
+        self.clock = clock
+        self.retry_delay = retry_delay
+
+        self._heap: List[Tuple[float, str]] = []
+        self._due_at: Dict[str, float] = {}  # authoritative next time per user
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.wakeups = 0
+        self.dispatched = 0
+        self.retried = 0
+
+    def schedule(self, phone_number: str, due_at: float) -> None:
+        """Set (or move) the time at which a user is next due."""
+        with self._condition:
+            self._due_at[phone_number] = due_at
+            heapq.heappush(self._heap, (due_at, phone_number))
+            if len(self._heap) > 2 * len(self._due_at) + 1000:
+                self._compact()
+            # Wake the loop if this is now the earliest entry
+            if self._heap[0] == (due_at, phone_number):
+                self._condition.notify()
+
+    def unschedule(self, phone_number: str) -> None:
+        """Stop scheduling a user."""
+        with self._condition:
+            self._due_at.pop(phone_number, None)
+
+    def next_due(self, phone_number: str) -> Optional[float]:
+        return self._due_at.get(phone_number)
+
+    def start(self) -> None:
+        """Start the scheduler thread (idempotent)."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="intervention-scheduler", daemon=True
+            )
+            self._thread.start()
+        logger.info("Intervention scheduler started")
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            next_due = self._peek()
+            return {
+                "scheduled_users": len(self._due_at),
+                "heap_entries": len(self._heap),
+                "next_due_in_seconds": (
+                    round(max(next_due - self.clock(), 0.0), 1) if next_due is not None else None
+                ),
+                "wakeups": self.wakeups,
+                "dispatched": self.dispatched,
+                "retried": self.retried,
+            }
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """Remove and return users due at or before now (up to batch_limit)."""
+        now = self.clock() if now is None else now
+        due = []
+        with self._condition:
+            while self._heap and len(due) < self.batch_limit:
+                due_at, phone_number = self._heap[0]
+                if self._due_at.get(phone_number) != due_at:
+                    heapq.heappop(self._heap)  # stale entry
+                    continue
+                if due_at > now:
+                    break
+                heapq.heappop(self._heap)
+                del self._due_at[phone_number]
+                due.append(phone_number)
+        return due
+
+    def _peek(self) -> Optional[float]:
+        # Caller holds the lock; drops stale entries from the top of the heap
+        while self._heap:
+            due_at, phone_number = self._heap[0]
+            if self._due_at.get(phone_number) == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+    def _compact(self) -> None:
+        self._heap = [(due_at, phone) for phone, due_at in self._due_at.items()]
+        heapq.heapify(self._heap)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    next_due = self._peek()
+                    timeout = None if next_due is None else next_due - self.clock()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self._stopping:
+                    return
+
+            due = self.pop_due()
+            if not due:
+                continue
+            self.wakeups += 1
+            self.dispatched += len(due)
+            try:
+                self.on_due(due)
+            except Exception as e:
+                logger.error(f"Error handling {len(due)} due interventions: {e}")
+                self._retry(due)
+
+    def _retry(self, due: List[str]) -> None:
+        # pop_due removed these users; any that on_due did not get to
+        # reschedule would otherwise never be due again
+        retry_at = self.clock() + self.retry_delay
+        with self._condition:
+            missing = [phone for phone in due if phone not in self._due_at]
+        for phone_number in missing:
+            self.schedule(phone_number, retry_at)
+        self.retried += len(missing)
+        if missing:
+            logger.warning(f"Retrying {len(missing)} due users in {self.retry_delay:.0f}s")
@@ -0,0 +1,251 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a queue that is already at max depth."""
+
+
+class _Job:
+    __slots__ = ("future", "fn", "args", "kwargs", "enqueued_at")
+
+    def __init__(self, future: Future, fn: Callable[..., Any], args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+
+
+class WaitStats:
+    """Queue wait time aggregates for one key (or the whole queue)."""
+
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, wait: float) -> None:
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+        self.last = wait
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_seconds": round(self.total / self.count, 4) if self.count else 0.0,
+            "max_seconds": round(self.max, 4),
+            "last_seconds": round(self.last, 4),
+        }
+
+
+class JobQueue:
+    """
+    In-process job queue backed by a pool of worker threads.
+
+    Used by the webhook to acknowledge Pinnacle immediately and run the
+    LLM + send pipeline in the background.
+
+    Jobs submitted with the same key (e.g. the sender's phone number) run
+    strictly in submission order, one at a time; jobs with different keys run
+    in parallel up to the number of workers. Jobs without a key are independent.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_depth: int = 0,
+        name: str = "jobs",
+        max_tracked_keys: int = 1000,
+    ):
+        """
+        Args:
+            workers: Number of worker threads processing jobs concurrently
+            max_depth: Maximum number of queued (not yet started) jobs, 0 for unbounded
+            name: Name used for worker threads and log messages
+            max_tracked_keys: Number of most recently used keys kept in wait-time metrics
+        """
+        self.workers = workers
+        self.max_depth = max_depth
+        self.name = name
+        self.max_tracked_keys = max_tracked_keys
+
+        self._condition = threading.Condition()
+        self._pending: Dict[Hashable, Deque[_Job]] = {}
+        self._ready: Deque[Hashable] = deque()  # keys with pending jobs and no active job
+        self._active: set = set()
+        self._depth = 0
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = WaitStats()
+        self._wait_by_key: "OrderedDict[Hashable, WaitStats]" = OrderedDict()
+
+    def start(self) -> None:
+        """Start the worker threads (idempotent)."""
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"{self.name}-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {self.workers} workers for job queue '{self.name}'")
+
+    def submit(
+        self, fn: Callable[..., Any], *args, key: Optional[Hashable] = None, **kwargs
+    ) -> Future:
+        """
+        Queue a job for background execution.
+
+        Args:
+            fn: Callable to run on a worker thread
+            key: Optional ordering key; jobs sharing a key run one at a time, in order
+            *args, **kwargs: Passed to fn
+
+        Returns:
+            A Future resolved with the job's return value (or exception)
+
+        Raises:
+            QueueFullError: If the queue is at max depth
+        """
+        if not self._threads:
+            self.start()
+
+        future: Future = Future()
+        job = _Job(future, fn, args, kwargs)
+        if key is None:
+            key = job  # unique key: no ordering constraint
+
+        with self._condition:
+            if self.max_depth and self._depth >= self.max_depth:
+                raise QueueFullError(
+                    f"Job queue '{self.name}' is full ({self.max_depth} jobs waiting)"
+                )
+            jobs = self._pending.get(key)
+            if jobs is None:
+                jobs = self._pending[key] = deque()
+            jobs.append(job)
+            self._depth += 1
+            if len(jobs) == 1 and key not in self._active:
+                self._ready.append(key)
+                self._condition.notify()
+        return future
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be picked up by a worker."""
+        return self._depth
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, worker activity and queue wait times."""
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "max_depth": self.max_depth,
+                "depth": self._depth,
+                "pending_keys": len(self._pending),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait": self._wait_total.to_dict(),
+            }
+
+    def wait_stats_by_key(self, limit: int = 20) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue wait time per key for the most recently used keys.
+
+        Args:
+            limit: Maximum number of keys to return (most recent first)
+        """
+        with self._condition:
+            recent = list(self._wait_by_key.items())[-limit:]
+        return {str(key): stats.to_dict() for key, stats in reversed(recent)}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers once the jobs already queued have been processed."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _record_wait(self, key: Hashable, job: _Job, wait: float) -> None:
+        self._wait_total.record(wait)
+        if key is job:
+            return  # keyless job
+        stats = self._wait_by_key.pop(key, None) or WaitStats()
+        stats.record(wait)
+        self._wait_by_key[key] = stats
+        while len(self._wait_by_key) > self.max_tracked_keys:
+            self._wait_by_key.popitem(last=False)
+
+    def _next_job(self):
+        with self._condition:
+            while not self._ready:
+                if self._stopping and not self._depth:
+                    return None, None
+                self._condition.wait()
+            key = self._ready.popleft()
+            job = self._pending[key].popleft()
+            self._active.add(key)
+            self._depth -= 1
+            self._in_flight += 1
+            self._record_wait(key, job, time.monotonic() - job.enqueued_at)
+            return key, job
+
+    def _finish(self, key: Hashable, failed: bool) -> None:
+        with self._condition:
+            self._active.discard(key)
+            self._in_flight -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+            if self._pending[key]:
+                # Next job for this key may run now that the previous one finished
+                self._ready.append(key)
+                self._condition.notify()
+            else:
+                del self._pending[key]
+            if self._stopping or not self._depth:
+                # Idle workers waiting on other keys must re-check whether to exit
+                self._condition.notify_all()
+
+    def _worker(self) -> None:
+        while True:
+            key, job = self._next_job()
+            if job is None:
+                break
+
+            if not job.future.set_running_or_notify_cancel():
+                self._finish(key, failed=False)
+                continue
+
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                logger.error(f"Job failed in queue '{self.name}': {str(e)}")
+                job.future.set_exception(e)
+                self._finish(key, failed=True)
+            else:
+                job.future.set_result(result)
+                self._finish(key, failed=False)
@@ -0,0 +1,563 @@
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from google.genai import types
+from google.genai.types import FunctionResponse
+
+from config import env_int
+from gemini_runtime import get_runtime
+from metrics import histogram, span
+from prompt_cache import PromptCache, PromptCacheUnavailable
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ToolExecutor = Callable[[str, Dict[str, Any]], Dict[str, Any]]
+# Called with the model's parts (code, code-execution results) and the reply stream
+PartsHandler = Callable[[List[types.Part], Any], None]
+
+# Events of the turn being recorded (set per conversation by RecordingBackend)
+_recording: contextvars.ContextVar = contextvars.ContextVar("llm_recording", default=None)
+# Names of the tools called in the current turn (see track_tool_calls)
+_tool_calls: contextvars.ContextVar = contextvars.ContextVar("llm_tool_calls", default=None)
+
+TOOL_CALL_SECONDS = histogram(
+    "rcsbot_tool_call_seconds", "Execution time of model tool calls", ("tool", "outcome")
+)
+
+# Tools are synchronous (FHIR requests, chart rendering); they run here so
+# they never block the Gemini loop that every session shares
+_tool_pool: Optional[ThreadPoolExecutor] = None
+_tool_pool_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def track_tool_calls(calls: Optional[List[str]]) -> Iterator[None]:
+    """
+    Append the name of every tool the model calls to `calls` while active.
+    Must be entered inside the coroutine running the turn.
+    """
+    token = _tool_calls.set(calls)
+    try:
+        yield
+    finally:
+        _tool_calls.reset(token)
+
+
+def get_tool_pool() -> ThreadPoolExecutor:
+    """Worker threads for tool calls (LLM_TOOL_WORKERS, created on first use)."""
+    global _tool_pool
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(
+                max_workers=env_int("LLM_TOOL_WORKERS", 8), thread_name_prefix="llm-tool"
+            )
+        return _tool_pool
+
+
+class LLMBackend:
+    """
+    Runs one model turn: sends the prompt and conversation, executes tool
+    calls, passes code-execution parts to `on_parts`, and returns the text.
+
+    Implementations must be awaited on the Gemini runtime loop. Streamed text
+    and parts are forwarded to the optional reply stream
+    (progressive_delivery.ReplyStream).
+    """
+
+    name = "base"
+
+    def __init__(self, execute_tool: ToolExecutor, on_parts: Optional[PartsHandler] = None):
+        """
+        Args:
+            execute_tool: Runs a tool call by name and returns its response payload
+            on_parts: Handles generated code and code-execution output
+        """
+        self.execute_tool = execute_tool
+        self.on_parts = on_parts
+
+    async def generate(self, system_prompt: str, conversation_text: str, stream: Any = None) -> str:
+        raise NotImplementedError
+
+    def _text(self, text: str, stream: Any) -> None:
+        events = _recording.get()
+        if events is not None:
+            if events and events[-1]["type"] == "text":
+                events[-1]["text"] += text
+            else:
+                events.append({"type": "text", "text": text})
+        if stream is not None:
+            stream.feed(text)
+
+    async def _run_tools(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Run all tool calls from one model message concurrently on the tool
+        pool and return their responses in call order.
+        """
+        events = _recording.get()
+        if events is not None:
+            events.extend({"type": "tool_call", "name": name, "args": dict(args)} for name, args in calls)
+        called = _tool_calls.get()
+        if called is not None:
+            called.extend(name for name, _ in calls)
+        loop = asyncio.get_running_loop()
+        pool = get_tool_pool()
+        with span("handle_tool_call"):
+            return await asyncio.gather(
+                *(
+                    # Copy the context so stage timings keep their request labels
+                    loop.run_in_executor(pool, contextvars.copy_context().run, self._timed_tool, name, args)
+                    for name, args in calls
+                )
+            )
+
+    def _timed_tool(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        outcome = "exception"
+        try:
+            result = self.execute_tool(name, args)
+            outcome = "error" if isinstance(result, dict) and "error" in result else "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            TOOL_CALL_SECONDS.observe(elapsed, tool=name, outcome=outcome)
+            logger.info(f"Tool {name} took {elapsed:.3f}s ({outcome})")
+
+    def _parts(self, parts: Optional[List[types.Part]], stream: Any) -> None:
+        events = _recording.get()
+        if events is not None:
+            for part in parts or []:
+                if part.executable_code:
+                    events.append({"type": "code", "code": part.executable_code.code})
+                if part.code_execution_result:
+                    events.append(
+                        {"type": "code_result", "output": part.code_execution_result.output or ""}
+                    )
+        if self.on_parts is not None:
+            self.on_parts(parts, stream)
+
+
+class LiveBackend(LLMBackend):
+    """Gemini Live API: one streaming session per conversation (or a pooled warm one)."""
+
+    name = "live"
+
+    def __init__(
+        self,
+        model: str,
+        config: Dict[str, Any],
+        execute_tool: ToolExecutor,
+        on_parts: Optional[PartsHandler] = None,
+        session_source: Optional[Callable[[str], Any]] = None,
+    ):
+        """
+        Args:
+            model: Live model name
+            config: Live connect config (tools, generation config)
+            execute_tool: Runs a tool call and returns its response payload
+            on_parts: Handles generated code and code-execution output
+            session_source: Optional callable taking the system prompt and
+                returning an async context manager that yields a session which
+                already holds that prompt (e.g. a warm pool lease)
+        """
+        super().__init__(execute_tool, on_parts)
+        self.model = model
+        self.config = config
+        self.session_source = session_source
+
+    async def generate(self, system_prompt: str, conversation_text: str, stream: Any = None) -> str:
+        if self.session_source is not None:
+            async with self.session_source(system_prompt) as session:
+                await session.send(input=conversation_text, end_of_turn=True)
+                return await self._receive_turn(session, stream)
+
+        client = get_runtime().client
+        async with client.aio.live.connect(model=self.model, config=self.config) as session:
+            # Send the combined prompt with end_of_turn flag
+            await session.send(input=f"{system_prompt}\n\n{conversation_text}", end_of_turn=True)
+            return await self._receive_turn(session, stream)
+
+    async def _receive_turn(self, session: Any, stream: Any) -> str:
+        final_text = ""
+        async for response in session.receive():
+            if response.text:
+                final_text += response.text
+                self._text(response.text, stream)
+
+            if response.tool_call:
+                function_calls = response.tool_call.function_calls or []
+                results = await self._run_tools([(fc.name, fc.args or {}) for fc in function_calls])
+                # All responses for this tool-call message go back together
+                await session.send(
+                    input=types.LiveClientToolResponse(
+                        function_responses=[
+                            FunctionResponse(name=fc.name, id=fc.id, response=result)
+                            for fc, result in zip(function_calls, results)
+                        ]
+                    )
+                )
+
+            # Process code execution and images as soon as they arrive
+            if response.server_content and response.server_content.model_turn:
+                self._parts(response.server_content.model_turn.parts, stream)
+        return final_text
+
+
+class UnaryBackend(LLMBackend):
+    """
+    Unary generate_content calls, executing tool calls between rounds until
+    the model returns its final answer. With a PromptCache the system prompt
+    is referenced from Gemini cached content instead of being sent inline.
+    """
+
+    name = "unary"
+
+    def __init__(
+        self,
+        model: str,
+        tools: List[types.Tool],
+        execute_tool: ToolExecutor,
+        on_parts: Optional[PartsHandler] = None,
+        prompt_cache: Optional[PromptCache] = None,
+        max_tool_rounds: int = 5,
+    ):
+        """
+        Args:
+            model: Model name for generate_content
+            tools: Tool declarations sent with inline prompts
+            execute_tool: Runs a tool call and returns its response payload
+            on_parts: Handles generated code and code-execution output
+            prompt_cache: Cached system prompt (and tools) to reference, if any
+            max_tool_rounds: Tool-call rounds allowed before giving up
+        """
+        super().__init__(execute_tool, on_parts)
+        self.model = model
+        self.tools = tools
+        self.prompt_cache = prompt_cache
+        self.max_tool_rounds = max_tool_rounds
+
+    async def generate(self, system_prompt: str, conversation_text: str, stream: Any = None) -> str:
+        client = get_runtime().client
+        config = await self._config(system_prompt)
+        contents = [types.Content(role="user", parts=[types.Part.from_text(text=conversation_text)])]
+
+        final_text = ""
+        for _ in range(self.max_tool_rounds + 1):
+            response = await client.aio.models.generate_content(
+                model=self.model, contents=contents, config=config
+            )
+            if not response.candidates or not response.candidates[0].content:
+                break
+            content = response.candidates[0].content
+            parts = content.parts or []
+            text = "".join(part.text for part in parts if part.text)
+            final_text += text
+            if text:
+                self._text(text, stream)
+            self._parts(parts, stream)
+
+            function_calls = [part.function_call for part in parts if part.function_call]
+            if not function_calls:
+                break
+
+            results = await self._run_tools([(fc.name, fc.args or {}) for fc in function_calls])
+            contents.append(content)
+            contents.append(
+                types.Content(
+                    role="user",
+                    parts=[
+                        types.Part.from_function_response(name=fc.name, response=result)
+                        for fc, result in zip(function_calls, results)
+                    ],
+                )
+            )
+        return final_text
+
+    async def _config(self, system_prompt: str) -> types.GenerateContentConfig:
+        if self.prompt_cache is not None:
+            try:
+                return types.GenerateContentConfig(cached_content=await self.prompt_cache.get_name())
+            except PromptCacheUnavailable as e:
+                logger.warning(f"Prompt cache unavailable, sending prompt inline: {e}")
+        return types.GenerateContentConfig(system_instruction=system_prompt, tools=self.tools)
+
+
+class LatencyDistribution:
+    """
+    Delay drawn per event, configured as a dict:
+
+        {"dist": "constant", "value": 0.2}
+        {"dist": "uniform", "low": 0.1, "high": 0.5}
+        {"dist": "normal", "mean": 1.0, "stddev": 0.3}      (clipped at 0)
+        {"dist": "lognormal", "median": 0.8, "sigma": 0.5}
+        {"dist": "exponential", "mean": 0.5}
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = dict(spec)
+        self.kind = self.spec.get("dist", "constant")
+        if self.kind not in ("constant", "uniform", "normal", "lognormal", "exponential"):
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+
+    def sample(self, rng: random.Random) -> float:
+        spec = self.spec
+        if self.kind == "constant":
+            value = spec.get("value", 0.0)
+        elif self.kind == "uniform":
+            value = rng.uniform(spec.get("low", 0.0), spec.get("high", 0.0))
+        elif self.kind == "normal":
+            value = rng.gauss(spec.get("mean", 0.0), spec.get("stddev", 0.0))
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(spec.get("median", 1.0)), spec.get("sigma", 0.0))
+        else:
+            mean = spec.get("mean", 0.0)
+            value = rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        return max(0.0, float(value))
+
+
+# Roughly what the Live API shows for our prompts; override with FAKE_LLM_LATENCY
+DEFAULT_FAKE_LATENCY = {
+    "first_token": {"dist": "lognormal", "median": 0.8, "sigma": 0.4},
+    "text_chunk": {"dist": "constant", "value": 0.02},
+    "tool_call": {"dist": "lognormal", "median": 0.4, "sigma": 0.3},
+    "code_execution": {"dist": "lognormal", "median": 1.5, "sigma": 0.4},
+}
+
+# Used when no script is configured: fetch patient data, then a short reply
+DEFAULT_FAKE_SCRIPT = [
+    {
+        "events": [
+            {"type": "tool_call", "name": "get_patient_data", "args": {"data_type": "all"}},
+            {
+                "type": "text",
+                "text": '```json\n{"text": "This is a scripted reply from the fake LLM backend."}\n```',
+            },
+        ]
+    }
+]
+
+
+def load_script(path: str) -> List[Dict[str, Any]]:
+    """Load recorded responses from a JSON Lines file (as written by RecordingBackend)."""
+    responses = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                responses.append(json.loads(line))
+    if not responses:
+        raise ValueError(f"No responses in fake LLM script {path}")
+    return responses
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic stand-in for the model that replays scripted turns.
+
+    Each response is a list of events: "text" (streamed in chunks),
+    "tool_call" (run through the real tool executor, e.g. a FHIR fetch;
+    consecutive calls run concurrently as one model message would),
+    "code" and "code_result" (passed to on_parts as genai parts, so chart
+    handling runs as usual). Delays between events are drawn from latency
+    distributions with a seeded generator, so everything except the model
+    can be load-tested offline.
+
+    A response is chosen by exact match on its recorded "prompt", then by its
+    "match" regex, then by a stable hash of the conversation text.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        execute_tool: ToolExecutor,
+        on_parts: Optional[PartsHandler] = None,
+        script: Optional[List[Dict[str, Any]]] = None,
+        latency: Optional[Dict[str, Dict[str, Any]]] = None,
+        seed: int = 0,
+        chunk_chars: int = 40,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+    ):
+        """
+        Args:
+            execute_tool: Runs scripted tool calls
+            on_parts: Handles scripted code and code-execution output
+            script: Responses to replay (defaults to DEFAULT_FAKE_SCRIPT)
+            latency: Distribution per event kind: first_token, text_chunk,
+                tool_call, code_execution (missing kinds add no delay)
+            seed: Seed for latency draws (call N of a run always draws the same delays)
+            chunk_chars: Characters per streamed text chunk
+            sleep: Awaitable sleep (overridable for testing)
+        """
+        super().__init__(execute_tool, on_parts)
+        self.script = script or DEFAULT_FAKE_SCRIPT
+        self.latency = {
+            kind: LatencyDistribution(spec)
+            for kind, spec in (DEFAULT_FAKE_LATENCY if latency is None else latency).items()
+        }
+        self.seed = seed
+        self.chunk_chars = max(1, chunk_chars)
+        self.sleep = sleep
+        self._patterns = [
+            re.compile(response["match"], re.IGNORECASE) if response.get("match") else None
+            for response in self.script
+        ]
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def select(self, conversation_text: str) -> Dict[str, Any]:
+        for response in self.script:
+            if response.get("prompt") == conversation_text:
+                return response
+        for response, pattern in zip(self.script, self._patterns):
+            if pattern is not None and pattern.search(conversation_text):
+                return response
+        digest = hashlib.sha1(conversation_text.encode("utf-8")).digest()
+        return self.script[int.from_bytes(digest[:8], "big") % len(self.script)]
+
+    async def generate(self, system_prompt: str, conversation_text: str, stream: Any = None) -> str:
+        with self._lock:
+            self._calls += 1
+            rng = random.Random(f"{self.seed}:{self._calls}")
+
+        response = self.select(conversation_text)
+        await self._delay("first_token", rng)
+
+        final_text = ""
+        events = response.get("events", [])
+        for index, event in enumerate(events):
+            kind = event.get("type")
+            if kind == "text":
+                text = event.get("text", "")
+                for start in range(0, len(text), self.chunk_chars):
+                    chunk = text[start:start + self.chunk_chars]
+                    final_text += chunk
+                    self._text(chunk, stream)
+                    await self._delay("text_chunk", rng)
+            elif kind == "tool_call":
+                if index > 0 and events[index - 1].get("type") == "tool_call":
+                    continue  # already run with the first call of its batch
+                # Consecutive calls came from one model message: run them together
+                batch = []
+                for call in events[index:]:
+                    if call.get("type") != "tool_call":
+                        break
+                    batch.append((call.get("name", ""), call.get("args") or {}))
+                await self._run_tools(batch)
+                await self._delay("tool_call", rng)
+            elif kind == "code":
+                self._parts(
+                    [types.Part(executable_code=types.ExecutableCode(code=event.get("code", ""), language="PYTHON"))],
+                    stream,
+                )
+            elif kind == "code_result":
+                await self._delay("code_execution", rng)
+                self._parts(
+                    [
+                        types.Part(
+                            code_execution_result=types.CodeExecutionResult(
+                                outcome="OUTCOME_OK", output=event.get("output", "")
+                            )
+                        )
+                    ],
+                    stream,
+                )
+            else:
+                logger.warning(f"Unknown fake LLM event type: {kind}")
+        return final_text
+
+    async def _delay(self, kind: str, rng: random.Random) -> None:
+        distribution = self.latency.get(kind)
+        if distribution is not None:
+            delay = distribution.sample(rng)
+            if delay > 0:
+                await self.sleep(delay)
+
+
+class RecordingBackend(LLMBackend):
+    """
+    Wraps another backend and appends every turn (prompt, text, tool calls,
+    code and code-execution output, elapsed time) to a JSON Lines file that
+    FakeBackend can replay.
+    """
+
+    def __init__(self, inner: LLMBackend, path: str):
+        super().__init__(inner.execute_tool, inner.on_parts)
+        self.inner = inner
+        self.path = path
+        self.name = inner.name
+        self._lock = threading.Lock()
+
+    async def generate(self, system_prompt: str, conversation_text: str, stream: Any = None) -> str:
+        events: List[Dict[str, Any]] = []
+        token = _recording.set(events)
+        started = time.monotonic()
+        try:
+            text = await self.inner.generate(system_prompt, conversation_text, stream)
+        finally:
+            _recording.reset(token)
+        record = {
+            "prompt": conversation_text,
+            "events": events,
+            "elapsed": round(time.monotonic() - started, 3),
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return text
+
+
+def create_backend(
+    name: str,
+    live: Callable[[], LLMBackend],
+    unary: Callable[[], LLMBackend],
+    execute_tool: ToolExecutor,
+    on_parts: Optional[PartsHandler] = None,
+) -> LLMBackend:
+    """
+    Build the backend selected by name ("live", "unary" or "fake").
+
+    The fake is configured from FAKE_LLM_SCRIPT (JSON Lines of recorded
+    responses), FAKE_LLM_LATENCY (JSON distributions per event kind),
+    FAKE_LLM_SEED and FAKE_LLM_CHUNK_CHARS. With LLM_RECORD_PATH set, the
+    live and unary backends append every turn to that file for later replay.
+    """
+    name = name.lower()
+    if name == "fake":
+        script_path = os.getenv("FAKE_LLM_SCRIPT")
+        latency = os.getenv("FAKE_LLM_LATENCY")
+        backend = FakeBackend(
+            execute_tool,
+            on_parts,
+            script=load_script(script_path) if script_path else None,
+            latency=json.loads(latency) if latency else None,
+            seed=env_int("FAKE_LLM_SEED", 0),
+            chunk_chars=env_int("FAKE_LLM_CHUNK_CHARS", 40),
+        )
+        logger.warning(f"Using the fake LLM backend ({len(backend.script)} scripted responses)")
+        return backend
+
+    if name == "live":
+        backend = live()
+    elif name == "unary":
+        backend = unary()
+    else:
+        raise ValueError(f"Unknown LLM backend: {name}")
+
+    record_path = os.getenv("LLM_RECORD_PATH")
+    if record_path:
+        logger.info(f"Recording {name} LLM turns to {record_path}")
+        backend = RecordingBackend(backend, record_path)
+    return backend
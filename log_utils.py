@@ -0,0 +1,155 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import reprlib
+from typing import Any, Optional
+
+from config import env_float, env_int
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Pass as `extra=VERBOSE` on high-volume debug-style events (generated code,
+# code execution output); only LOG_VERBOSE_SAMPLE_RATE of them are kept.
+VERBOSE = {"verbose": True}
+
+_DATA_URI_PATTERN = re.compile(r"data:([\w/+.-]+);base64,[A-Za-z0-9+/=\s]{64,}")
+
+
+def _redact_data_uris(text: str) -> str:
+    return _DATA_URI_PATTERN.sub(
+        lambda m: f"<data:{m.group(1)};base64 {len(m.group(0))} chars>", text
+    )
+
+
+def truncate_text(text: str, max_length: int) -> str:
+    """Replace base64 data URIs with a size marker and cap the text length."""
+    if "base64," in text:
+        text = _redact_data_uris(text)
+    if len(text) > max_length:
+        text = f"{text[:max_length]}... (+{len(text) - max_length} chars)"
+    return text
+
+
+class _BoundedRepr(reprlib.Repr):
+    def __init__(self, max_length: int):
+        super().__init__()
+        self.maxstring = max_length
+        self.maxother = max_length
+        self.maxdict = 20
+        self.maxlist = 20
+        self.maxlevel = 4
+
+    def repr_str(self, value, level):
+        return repr(truncate_text(value, self.maxstring))
+
+
+def shrink_arg(value: Any, max_length: int) -> Any:
+    """
+    Make a log argument cheap and safe to format later on the listener thread.
+
+    Numbers and short values pass through; strings are truncated; containers
+    and other objects are turned into a bounded repr now, so later mutation
+    (or a huge payload) cannot affect the log line.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return truncate_text(value, max_length)
+    return truncate_text(_BoundedRepr(max_length).repr(value), max_length)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a sample of records logged with extra=VERBOSE."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "verbose", False):
+            return random.random() < self.rate
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks and never formats on the caller's thread.
+
+    Plain messages, or the arguments of %-style messages, are truncated (base64
+    data URIs collapsed) and the record is queued for a background listener to
+    format and write. If the queue is full, the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_field_length: int = 1000):
+        super().__init__(log_queue)
+        self.max_field_length = max_field_length
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if isinstance(record.msg, str) and not record.args:
+            record.msg = truncate_text(record.msg, self.max_field_length)
+        if record.args:
+            # msg is a format string here; cutting it could split a placeholder,
+            # so only the arguments are shrunk
+            if isinstance(record.args, dict):
+                record.args = {
+                    k: shrink_arg(v, self.max_field_length) for k, v in record.args.items()
+                }
+            else:
+                record.args = tuple(
+                    shrink_arg(arg, self.max_field_length) for arg in record.args
+                )
+        if record.exc_info:
+            # Tracebacks hold frames alive; render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """
+    Configure root logging with a queue-based background handler.
+
+    Settings come from LOG_LEVEL, LOG_MAX_FIELD_LENGTH, LOG_VERBOSE_SAMPLE_RATE
+    and LOG_QUEUE_SIZE.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    log_queue: queue.Queue = queue.Queue(maxsize=env_int("LOG_QUEUE_SIZE", 10000))
+
+    handler = BoundedQueueHandler(
+        log_queue, max_field_length=env_int("LOG_MAX_FIELD_LENGTH", 1000)
+    )
+    handler.addFilter(SamplingFilter(env_float("LOG_VERBOSE_SAMPLE_RATE", 0.1)))
+
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,21 +1,52 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
+import contextlib
+import copy
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import os
 import random
-from typing import Dict, Any
-
-from model_service import call_gemini, process_payload_response
+import time
+from typing import Dict, Any, Iterator, Union
+
+from chart_store import CHART_ROUTE, VARIANTS as CHART_VARIANTS
+from model_service import (
+    LLM_BACKEND,
+    PROMPT_VERSION,
+    call_gemini,
+    chart_renderer,
+    payload_response_cache,
+    process_payload_response,
+    warm_session_pool,
+)
 from message_handler import send_message, get_pinnacle_client
-from fhir_data import get_patient_data
+from fhir_data import get_patient_data, on_patient_data_change, patient_data_version
+from job_queue import JobQueue, QueueFullError
+from dedup_store import DedupStore, webhook_dedup_key
+from admission import AdmissionController, run_admitted
+from context_store import InMemoryContextStore, create_context_store
+from context_table import ContextTable
+from question_cache import QuestionCache
+from progressive_delivery import ReplyStream
+from intervention_runner import InterventionJob, InterventionRunner, RunSummary, SkippedJob
+from cohort_interventions import Cohort, CohortInterventionRunner, build_template_request
+from intervention_scheduler import InterventionScheduler
+from intervention_rules import (
+    determine_if_intervention_needed,
+    next_intervention_check,
+    select_intervention_type,
+    time_of_day_for_hour,
+)
+from shard_leases import LeaseLostError, ShardLeaseManager
+from log_utils import setup_logging
+from metrics import gauge, histogram, render_metrics, request_labels, span, REGISTRY
+from config import env_flag, env_float, env_int
 
 # Configure logging
-# These settings are used by basicConfig to properly format log messages
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+# Records are truncated and handed to a background thread for formatting,
+# so logging never blocks or bloats a request
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Create Flask app
@@ -24,8 +55,122 @@ app = Flask(__name__)
 # Initialize Pinnacle client once
 pinnacle_client = get_pinnacle_client()
 
-# Store user contexts (in a real app, this would be in a database)
-user_contexts = {}
+# Pre-connect Gemini Live sessions if pooling is enabled
+warm_session_pool()
+
+# Store user contexts. The default in-memory store only works with a single
+# worker; CONTEXT_STORE=sqlite shares contexts between worker processes.
+context_store = create_context_store()
+
+# Optional columnar copy of the numeric context fields so scheduled runs can
+# decide eligibility and intervention types for every user in one NumPy pass
+SCHEDULED_VECTORIZED = env_flag("SCHEDULED_VECTORIZED", False)
+context_table = None
+if SCHEDULED_VECTORIZED:
+    seed = os.getenv("SCHEDULED_RNG_SEED")
+    context_table = ContextTable(seed=int(seed) if seed else None)
+    if isinstance(context_store, InMemoryContextStore):
+        context_table.reload(context_store.items())
+    else:
+        context_table.refresh(context_store.items_updated_since(0.0))
+
+# Webhook jobs run on a worker pool keyed by sender. In async mode Pinnacle
+# is acknowledged right away so slow replies don't trigger redeliveries.
+WEBHOOK_ASYNC_MODE = env_flag("WEBHOOK_ASYNC_MODE", False)
+WEBHOOK_WORKERS = env_int("WEBHOOK_WORKERS", 4)
+webhook_queue = JobQueue(
+    workers=WEBHOOK_WORKERS,
+    max_depth=env_int("WEBHOOK_QUEUE_MAX_DEPTH", 100),
+    name="webhook",
+)
+
+# Admission control for LLM work (webhooks and triggered interventions).
+# When saturated we reply fast instead of piling up threads: 503 with
+# Retry-After, or in "sms" mode a reply asking the sender to resend. The completion
+# estimate assumes max_in_flight jobs really run in parallel, and webhook jobs
+# only do so up to the worker count.
+ADMISSION_MAX_IN_FLIGHT = env_int("ADMISSION_MAX_IN_FLIGHT", WEBHOOK_WORKERS)
+if ADMISSION_MAX_IN_FLIGHT > WEBHOOK_WORKERS:
+    raise ValueError(
+        f"ADMISSION_MAX_IN_FLIGHT ({ADMISSION_MAX_IN_FLIGHT}) must not exceed "
+        f"WEBHOOK_WORKERS ({WEBHOOK_WORKERS})"
+    )
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_queue=env_int("ADMISSION_MAX_QUEUE", 32),
+    latency_budget=env_float("ADMISSION_LATENCY_BUDGET", 30.0),
+)
+ADMISSION_OVERLOAD_MODE = os.getenv("ADMISSION_OVERLOAD_MODE", "reject").lower()
+ADMISSION_OVERLOAD_MESSAGE = os.getenv(
+    "ADMISSION_OVERLOAD_MESSAGE",
+    "We're getting a lot of messages right now and couldn't read yours. "
+    "Please send it again in a few minutes.",
+)
+
+# Pinnacle redelivers events when /webhook is slow; drop repeats before any
+# LLM or FHIR work. Events without a message ID or timestamp are only
+# deduplicated for a short window so genuine repeats ("yes") still go through.
+WEBHOOK_DEDUP = env_flag("WEBHOOK_DEDUP", True)
+WEBHOOK_DEDUP_CONTENT_TTL = env_float("WEBHOOK_DEDUP_CONTENT_TTL", 120.0)
+dedup_store = DedupStore(
+    max_size=env_int("WEBHOOK_DEDUP_MAX_SIZE", 10000),
+    ttl=env_float("WEBHOOK_DEDUP_TTL", 86400.0),
+    db_path=os.getenv("WEBHOOK_DEDUP_DB") or None,
+)
+
+# Near-duplicate free-text questions ("show my cholesterol" / "cholesterol
+# please") reuse a recent answer for the same user, patient-data version and
+# prompt version. A sample of hits is re-generated in the background to
+# measure false hits.
+QUESTION_CACHE = env_flag("QUESTION_CACHE", False)
+question_cache = QuestionCache(
+    threshold=env_float("QUESTION_CACHE_THRESHOLD", 0.8),
+    max_scopes=env_int("QUESTION_CACHE_MAX_USERS", 1000),
+    max_entries_per_scope=env_int("QUESTION_CACHE_MAX_PER_USER", 50),
+    ttl=env_float("QUESTION_CACHE_TTL", 3600.0),
+    audit_rate=env_float("QUESTION_CACHE_AUDIT_RATE", 0.05),
+)
+question_audit_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="question-audit")
+on_patient_data_change(lambda changed_keys: question_cache.clear())
+
+# Send the reply text (or first card) as soon as the model has written it and
+# follow with the chart card once code execution has rendered it, instead of
+# holding everything until the whole turn is done
+PROGRESSIVE_DELIVERY = env_flag("PROGRESSIVE_DELIVERY", False)
+REPLY_FIRST_MESSAGE = histogram(
+    "rcsbot_reply_first_message_seconds",
+    "Time from starting a webhook reply until its first message was sent",
+    ("delivery",),
+)
+REPLY_COMPLETE = histogram(
+    "rcsbot_reply_complete_seconds",
+    "Time from starting a webhook reply until all of it was sent",
+    ("delivery",),
+)
+
+# Queue, admission and dedup state exported on /metrics
+WEBHOOK_QUEUE_DEPTH = gauge("rcsbot_webhook_queue_depth", "Webhook jobs waiting for a worker")
+ADMISSION_STATE = gauge(
+    "rcsbot_admission_jobs", "Admitted LLM jobs by state", ("state",)
+)
+ADMISSION_REJECTED = gauge(
+    "rcsbot_admission_rejected", "LLM jobs shed by admission control since start"
+)
+WEBHOOK_DUPLICATES = gauge(
+    "rcsbot_webhook_duplicates_dropped", "Redelivered webhook events dropped since start"
+)
+
+
+def collect_service_metrics() -> None:
+    WEBHOOK_QUEUE_DEPTH.set(webhook_queue.depth())
+    admission_stats = admission.stats()
+    ADMISSION_STATE.set(admission_stats["running"], state="running")
+    ADMISSION_STATE.set(admission_stats["waiting"], state="waiting")
+    ADMISSION_REJECTED.set(admission_stats["rejected"])
+    WEBHOOK_DUPLICATES.set(dedup_store.duplicates)
+
+
+REGISTRY.add_collector(collect_service_metrics)
 
 
 @app.route("/webhook", methods=["POST"])
@@ -34,7 +179,7 @@ def webhook():
     try:
         # Get request data
         webhook_data = request.json
-        logger.info(f"Received webhook: {webhook_data}")
+        logger.info("Received webhook: %s", webhook_data)
 
         # Extract essential data
         from_number = webhook_data.get("from", "")
@@ -44,40 +189,208 @@ def webhook():
         if not from_number:
             return jsonify({"status": "error", "message": "Missing sender number"}), 400
 
+        if not payload and not user_content:
+            return (
+                jsonify({"status": "error", "message": "Missing text or payload"}),
+                400,
+            )
+
+        dedup_key = None
+        if WEBHOOK_DEDUP:
+            dedup_key = webhook_dedup_key(webhook_data)
+            has_identity = dedup_key.startswith("id:") or webhook_data.get("timestamp")
+            ttl = None if has_identity else WEBHOOK_DEDUP_CONTENT_TTL
+            if not dedup_store.check_and_add(dedup_key, ttl=ttl):
+                logger.info(f"Dropping duplicate webhook {dedup_key} from {from_number}")
+                return jsonify({"status": "duplicate"})
+
+        # Shed load we cannot finish within the latency budget
+        ticket = admission.try_admit()
+        if ticket is None:
+            logger.warning(f"Admission control rejected webhook from {from_number}")
+            return shed_webhook(from_number, dedup_key)
+
+        # Messages from the same sender are processed strictly in order;
+        # different senders run in parallel on the worker pool
+        try:
+            job = webhook_queue.submit(
+                run_admitted,
+                ticket,
+                process_webhook_message,
+                from_number,
+                user_content,
+                payload,
+                key=from_number,
+            )
+        except QueueFullError as e:
+            logger.warning(str(e))
+            ticket.finish()
+            return shed_webhook(from_number, dedup_key)
+
+        if WEBHOOK_ASYNC_MODE:
+            # Let a redelivery through if the background job fails
+            def on_done(future):
+                if future.exception() is not None:
+                    forget_webhook(dedup_key)
+
+            job.add_done_callback(on_done)
+            # Acknowledge now, reply from a background worker
+            return jsonify(
+                {"status": "accepted", "queue_depth": webhook_queue.depth()}
+            )
+
+        try:
+            message_type = job.result()
+        except Exception:
+            forget_webhook(dedup_key)
+            raise
+        return jsonify({"status": "success", "message_type": message_type})
+
+    except Exception as e:
+        logger.error(f"Error processing webhook: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def shed_webhook(from_number: str, dedup_key: str):
+    """Overload response for an inbound message we are not going to process."""
+    response = overload_response(from_number)
+    if response.status_code != 200:
+        # Pinnacle will redeliver; let that attempt through the dedup store
+        forget_webhook(dedup_key)
+    return response
+
+
+def forget_webhook(dedup_key: str) -> None:
+    """Remove a webhook from the dedup store so Pinnacle's retry is processed."""
+    if dedup_key:
+        dedup_store.discard(dedup_key)
+
+
+def process_webhook_message(from_number: str, user_content: str, payload: str) -> str:
+    """
+    Generate and send the reply for an inbound message.
+
+    Runs inline in the request or as a background job in async mode.
+
+    Returns:
+        The message type that was sent (rcs, mms or sms)
+    """
+    started = time.monotonic()
+    stream = None
+    message_kind = "payload" if payload else "text"
+    with request_labels(message_type=message_kind), span("webhook_job"):
         # Handle button/quick reply payloads
         if payload:
             logger.info(f"Processing payload: {payload} from {from_number}")
             rcs_response = process_payload_response(payload)
         # Handle regular text messages
-        elif user_content:
+        else:
             # Get or create user context
             user_context = get_user_context(from_number)
 
-            # Process the message using Gemini
-            conversation = [{"role": "user", "content": user_content}]
-            rcs_response = call_gemini(conversation, user_context)
+            if PROGRESSIVE_DELIVERY:
+                stream = ReplyStream(lambda message: send_reply(from_number, message))
+
+            # Process the message using Gemini (or a cached near-duplicate answer)
+            rcs_response = answer_question(from_number, user_content, user_context, stream)
 
             # Update user context based on this interaction
             update_user_context(from_number, user_content, rcs_response)
+
+        if stream is not None and stream.first_sent:
+            # Text went out early; now the charts and whatever else is left
+            _, message_type = stream.first_result
+            first_message_seconds = stream.first_message_at - started
+            follow_up = stream.follow_up(rcs_response)
+            if follow_up is not None:
+                _, message_type = send_reply(from_number, follow_up)
+            delivery = "progressive"
         else:
-            return (
-                jsonify({"status": "error", "message": "Missing text or payload"}),
-                400,
+            # Send response with smart fallback
+            _, message_type = send_reply(from_number, rcs_response)
+            first_message_seconds = time.monotonic() - started
+            delivery = "single"
+
+    REPLY_FIRST_MESSAGE.observe(first_message_seconds, delivery=delivery)
+    REPLY_COMPLETE.observe(time.monotonic() - started, delivery=delivery)
+    logger.info(f"Sent {message_type} response to {from_number}")
+    return message_type
+
+
+def send_reply(to_number: str, rcs_response: Dict[str, Any]):
+    """Send one message to the user with smart fallback."""
+    return send_message(
+        to_number=to_number,
+        rcs_response=rcs_response,
+        pinnacle_client=pinnacle_client,
+    )
+
+
+def answer_question(
+    from_number: str,
+    user_content: str,
+    user_context: Dict[str, Any],
+    stream: ReplyStream = None,
+) -> Dict[str, Any]:
+    """
+    Answer a free-text message, reusing a cached answer to a near-identical question.
+
+    A freshly generated answer is delivered progressively through `stream`
+    if given; cached answers are returned whole.
+    """
+    conversation = [{"role": "user", "content": user_content}]
+    if not QUESTION_CACHE:
+        return call_gemini(conversation, user_context, stream)
+
+    scope = (from_number, patient_data_version(), PROMPT_VERSION)
+    cached = question_cache.lookup(scope, user_content)
+    if cached is not None:
+        logger.info(f"Question cache hit for {from_number}")
+        if question_cache.should_audit():
+            question_audit_pool.submit(
+                audit_question_hit, conversation, dict(user_context), copy.deepcopy(cached)
             )
+        return cached
 
-        # Send response with smart fallback
-        response, message_type = send_message(
-            to_number=from_number,
-            rcs_response=rcs_response,
-            pinnacle_client=pinnacle_client,
-        )
+    rcs_response = call_gemini(conversation, user_context, stream)
+    question_cache.store(scope, user_content, rcs_response)
+    return rcs_response
 
-        logger.info(f"Sent {message_type} response to {from_number}")
-        return jsonify({"status": "success", "message_type": message_type})
 
+def audit_question_hit(
+    conversation, user_context: Dict[str, Any], cached_response: Dict[str, Any]
+) -> None:
+    """Generate a fresh answer for a served cache hit and record whether they agree."""
+    try:
+        fresh_response = call_gemini(conversation, user_context)
+        if not question_cache.record_audit(cached_response, fresh_response):
+            logger.warning(f"Question cache false hit for: {conversation[0]['content']}")
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        logger.error(f"Question cache audit failed: {e}")
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics: per-stage latency histograms, in-flight gauges, errors."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route(f"{CHART_ROUTE}/<chart_id>.<variant>", methods=["GET"])
+def chart_image(chart_id, variant):
+    """
+    Chart drawn by the render_chart tool (IDs are content hashes): .png is the
+    original, .jpg the MMS-optimized variant.
+    """
+    if variant not in CHART_VARIANTS:
+        return jsonify({"error": "Chart not found"}), 404
+    image = chart_renderer.get(chart_id, variant)
+    if image is None:
+        return jsonify({"error": "Chart not found"}), 404
+    return Response(
+        image,
+        mimetype=CHART_VARIANTS[variant],
+        headers={"Cache-Control": "public, max-age=86400, immutable"},
+    )
 
 
 @app.route("/health", methods=["GET"])
@@ -88,6 +401,32 @@ def health_check():
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
             "version": "1.0.0",
+            "prompt_version": PROMPT_VERSION,
+            "llm_backend": LLM_BACKEND,
+            "webhook_async_mode": WEBHOOK_ASYNC_MODE,
+            "webhook_queue": webhook_queue.stats(),
+            "webhook_dedup": dedup_store.stats(),
+            "admission": admission.stats(),
+            "payload_cache": payload_response_cache.stats(),
+            "chart_store": chart_renderer.stats(),
+            "question_cache": question_cache.stats() if QUESTION_CACHE else None,
+            "intervention_scheduler": (
+                intervention_scheduler.stats() if INTERVENTION_SCHEDULER else None
+            ),
+            "shard_leases": shard_leases.stats() if shard_leases else None,
+        }
+    )
+
+
+@app.route("/webhook/queue", methods=["GET"])
+def webhook_queue_stats():
+    """Webhook queue depth and per-sender queue wait times."""
+    return jsonify(
+        {
+            "queue": webhook_queue.stats(),
+            "wait_by_sender": webhook_queue.wait_stats_by_key(
+                limit=request.args.get("limit", 20, type=int)
+            ),
         }
     )
 
@@ -107,6 +446,36 @@ def trigger_intervention():
         if not phone_number:
             return jsonify({"status": "error", "message": "Missing phone number"}), 400
 
+        ticket = admission.try_admit()
+        if ticket is None:
+            return overload_response()
+
+        with ticket:
+            message_type = send_intervention(phone_number, intervention_type)
+
+        return jsonify(
+            {
+                "status": "success",
+                "message_type": message_type,
+                "intervention_type": intervention_type,
+            }
+        )
+
+    except Exception as e:
+        logger.error(f"Error triggering intervention: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def send_intervention(phone_number: str, intervention_type: str) -> str:
+    """
+    Generate and send a proactive intervention of the given type.
+
+    Returns:
+        The message type that was sent (rcs, mms or sms)
+    """
+    with request_labels(
+        message_type="intervention", intervention_type=intervention_type
+    ), span("intervention"):
         # Get user context or create if it doesn't exist
         user_context = get_user_context(phone_number)
 
@@ -141,6 +510,8 @@ def trigger_intervention():
                 user_context["intervention_type"] = "glucose"
                 user_context["current_glucose"] = glucose_values[0]
 
+        save_user_context(phone_number, user_context)
+
         # Create a special intervention request
         intervention_request = [
             {
@@ -159,20 +530,40 @@ def trigger_intervention():
             pinnacle_client=pinnacle_client,
         )
 
-        logger.info(
-            f"Sent proactive {intervention_type} intervention ({message_type}) to {phone_number}"
-        )
-        return jsonify(
-            {
-                "status": "success",
-                "message_type": message_type,
-                "intervention_type": intervention_type,
-            }
-        )
+    logger.info(
+        f"Sent proactive {intervention_type} intervention ({message_type}) to {phone_number}"
+    )
+    return message_type
 
-    except Exception as e:
-        logger.error(f"Error triggering intervention: {str(e)}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+
+def overload_response(to_number: str = None):
+    """
+    Response for work shed by admission control.
+
+    Returns 503 with Retry-After, or in "sms" overload mode (inbound messages
+    only) drops the message, sends a templated reply asking the sender to
+    resend it and returns 200.
+    """
+    retry_after = admission.retry_after()
+
+    if ADMISSION_OVERLOAD_MODE == "sms" and to_number:
+        try:
+            send_message(
+                to_number=to_number,
+                rcs_response={"text": ADMISSION_OVERLOAD_MESSAGE},
+                pinnacle_client=pinnacle_client,
+            )
+            logger.warning(f"Overloaded: asked {to_number} to resend their message")
+            return jsonify({"status": "shed"})
+        except Exception as e:
+            logger.error(f"Failed to send overload reply: {str(e)}")
+
+    response = jsonify(
+        {"status": "error", "message": "Server busy", "retry_after": retry_after}
+    )
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
 
 
 @app.route("/scheduled-interventions", methods=["POST"])
@@ -180,63 +571,28 @@ def run_scheduled_interventions():
     """
     Run scheduled interventions for all users.
     This would typically be triggered by a cron job or scheduler.
+
+    With ?stream=1 the response is NDJSON: one line per user as soon as they
+    are processed, then a summary line, without buffering the whole run.
     """
-    try:
-        # Get all registered users (in a real app, from database)
-        # Here we're using the in-memory user_contexts as a simulation
-        results = []
-        current_hour = datetime.now().hour
-
-        for phone_number, context in user_contexts.items():
-            # Check if user should receive an intervention based on time and data
-            should_send = determine_if_intervention_needed(
-                phone_number, context, current_hour
-            )
+    if request.args.get("stream", type=int):
+        return Response(
+            stream_with_context(stream_scheduled_interventions()),
+            mimetype="application/x-ndjson",
+        )
 
-            if should_send:
-                # Determine intervention type based on user data and time of day
-                intervention_type = select_intervention_type(context, current_hour)
-
-                # Update context with intervention type
-                context["intervention_type"] = intervention_type
-
-                # Create intervention request
-                intervention_request = [
-                    {
-                        "role": "user",
-                        "content": f"SYSTEM: Generate a scheduled {intervention_type} intervention.",
-                    }
-                ]
-
-                # Generate and send intervention
-                rcs_response = call_gemini(intervention_request, context)
-                response, message_type = send_message(
-                    to_number=phone_number,
-                    rcs_response=rcs_response,
-                    pinnacle_client=pinnacle_client,
-                )
-
-                results.append(
-                    {
-                        "phone_number": phone_number,
-                        "intervention_type": intervention_type,
-                        "status": "sent",
-                    }
-                )
-
-                logger.info(
-                    f"Sent scheduled {intervention_type} intervention to {phone_number}"
-                )
-            else:
-                results.append({"phone_number": phone_number, "status": "skipped"})
+    try:
+        # Generate and send concurrently, with separate LLM and send limits
+        with scheduled_run():
+            results, summary = scheduled_runner.run(scheduled_intervention_jobs())
 
         return jsonify(
             {
                 "status": "success",
-                "interventions_processed": len(user_contexts),
-                "interventions_sent": len(
-                    [r for r in results if r.get("status") == "sent"]
-                ),
+                "interventions_processed": len(results),
+                "interventions_sent": summary["sent"],
+                "interventions_failed": summary["failed"],
+                "timing": summary,
                 "results": results,
             }
         )
@@ -246,14 +602,270 @@ def run_scheduled_interventions():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def stream_scheduled_interventions() -> Iterator[str]:
+    """Yield one NDJSON line per processed user, then a summary line."""
+    summary = RunSummary()
+    processed = 0
+    try:
+        # Skipped users come through as they are scanned, so lines flow even
+        # when nobody is due
+        with scheduled_run():
+            for result in scheduled_runner.iter_run(scheduled_intervention_jobs(), summary):
+                processed += 1
+                yield json.dumps(result) + "\n"
+
+        totals = summary.as_dict()
+        yield json.dumps(
+            {
+                "status": "success",
+                "interventions_processed": processed,
+                "interventions_sent": totals["sent"],
+                "interventions_failed": totals["failed"],
+                "timing": totals,
+            }
+        ) + "\n"
+
+    except Exception as e:
+        # Headers are already sent, so the error goes in the final line
+        logger.error(f"Error streaming scheduled interventions: {str(e)}")
+        yield json.dumps({"status": "error", "message": str(e)}) + "\n"
+
+
+def scheduled_intervention_jobs() -> Iterator[Union[InterventionJob, SkippedJob]]:
+    """
+    Lazily yield (phone_number, context, intervention_type) for users due an
+    intervention, and a SkippedJob for the others.
+    """
+    # Get all registered users (in a real app, from database)
+    # Here we're using the context store as a simulation
+    current_hour = datetime.now().hour
+
+    if context_table is not None:
+        yield from planned_intervention_jobs(current_hour)
+        return
+
+    for phone_number, context in context_store.items():
+        # Leave users in other workers' shards to them
+        if not handles_user(phone_number):
+            continue
+
+        # Check if user should receive an intervention based on time and data
+        should_send = determine_if_intervention_needed(phone_number, context, current_hour)
+
+        if should_send:
+            # Determine intervention type based on user data and time of day
+            intervention_type = select_intervention_type(context, current_hour)
+
+            # Update context with intervention type
+            context["intervention_type"] = intervention_type
+            save_user_context(phone_number, context)
+
+            yield phone_number, context, intervention_type
+        else:
+            yield SkippedJob({"phone_number": phone_number, "status": "skipped"})
+
+
+# Partitioned scheduled runs: users are hashed into SCHEDULED_SHARDS shards
+# and each worker only handles the shards it holds a lease on, so several
+# processes (or hosts sharing the lease database) can run interventions
+# without double-sending.
+SCHEDULED_SHARDS = env_int("SCHEDULED_SHARDS", 0)
+shard_leases = None
+if SCHEDULED_SHARDS > 0:
+    shard_leases = ShardLeaseManager(
+        db_path=os.getenv("SCHEDULED_SHARD_DB", "shard_leases.db"),
+        num_shards=SCHEDULED_SHARDS,
+        lease_seconds=env_float("SCHEDULED_SHARD_LEASE_SECONDS", 120.0),
+        owner=os.getenv("SCHEDULED_WORKER_ID") or None,
+    )
+    shard_leases.start()
+
+
+def handles_user(phone_number: str) -> bool:
+    """Whether this worker is responsible for the user's scheduled interventions."""
+    return shard_leases is None or shard_leases.owns_user(phone_number)
+
+
+def scheduled_run():
+    """Keep this worker's shards, surplus included, until a scheduled run finishes."""
+    return shard_leases.hold_shards() if shard_leases is not None else contextlib.nullcontext()
+
+
+def planned_intervention_jobs(current_hour: int) -> Iterator[Union[InterventionJob, SkippedJob]]:
+    """scheduled_intervention_jobs using the vectorized context table."""
+    if not isinstance(context_store, InMemoryContextStore):
+        # Pick up contexts other workers wrote to the shared store since the last run
+        context_table.refresh(context_store.items_updated_since(context_table.synced_until))
+
+    mask, intervention_types, phone_numbers = context_table.plan(current_hour)
+    due_types = iter(intervention_types)
+
+    for phone_number, should_send in zip(phone_numbers, mask.tolist()):
+        intervention_type = next(due_types) if should_send else None
+        if not handles_user(phone_number):
+            continue
+        if not should_send:
+            yield SkippedJob({"phone_number": phone_number, "status": "skipped"})
+            continue
+
+        context = context_store.get(phone_number)
+        if context is None:
+            continue
+        context["intervention_type"] = intervention_type
+        save_user_context(phone_number, context)
+
+        yield phone_number, context, intervention_type
+
+
+def generate_scheduled_intervention(
+    phone_number: str, context: Dict[str, Any], intervention_type: str
+) -> Dict[str, Any]:
+    """Generate a scheduled intervention for one user (runs on the LLM pool)."""
+    with request_labels(
+        message_type="scheduled", intervention_type=intervention_type
+    ), span("scheduled_generate"):
+        # Create intervention request
+        intervention_request = [
+            {
+                "role": "user",
+                "content": f"SYSTEM: Generate a scheduled {intervention_type} intervention.",
+            }
+        ]
+        return call_gemini(intervention_request, context)
+
+
+def send_scheduled_intervention(
+    phone_number: str, rcs_response: Dict[str, Any], intervention_type: str
+) -> str:
+    """Send a generated scheduled intervention (runs on the send pool)."""
+    # The lease may have lapsed while the message was generated; the shard's
+    # new owner will handle the user instead
+    if not handles_user(phone_number):
+        raise LeaseLostError(f"No longer holds the shard for {phone_number}")
+
+    with request_labels(
+        message_type="scheduled", intervention_type=intervention_type
+    ), span("scheduled_send"):
+        response, message_type = send_message(
+            to_number=phone_number,
+            rcs_response=rcs_response,
+            pinnacle_client=pinnacle_client,
+        )
+
+    logger.info(f"Sent scheduled {intervention_type} intervention to {phone_number}")
+    return message_type
+
+
+def generate_cohort_intervention(cohort: Cohort) -> Dict[str, Any]:
+    """Generate one templated intervention for a cohort of users (runs on the LLM pool)."""
+    with request_labels(
+        message_type="scheduled", intervention_type=cohort.intervention_type
+    ), span("cohort_generate"):
+        conversation, context_data = build_template_request(cohort)
+        return call_gemini(conversation, context_data)
+
+
+# Scheduled runs fan out over bounded pools; LLM and send limits are separate.
+# In cohort mode, users sharing an intervention type, time of day and context
+# buckets share one generated template, filled in per user before sending.
+SCHEDULED_COHORT_MODE = env_flag("SCHEDULED_COHORT_MODE", False)
+if SCHEDULED_COHORT_MODE:
+    scheduled_runner = CohortInterventionRunner(
+        generate_template=generate_cohort_intervention,
+        send=send_scheduled_intervention,
+        llm_concurrency=env_int("SCHEDULED_LLM_CONCURRENCY", 4),
+        send_concurrency=env_int("SCHEDULED_SEND_CONCURRENCY", 8),
+    )
+else:
+    scheduled_runner = InterventionRunner(
+        generate=generate_scheduled_intervention,
+        send=send_scheduled_intervention,
+        llm_concurrency=env_int("SCHEDULED_LLM_CONCURRENCY", 4),
+        send_concurrency=env_int("SCHEDULED_SEND_CONCURRENCY", 8),
+    )
+
+
+def run_due_interventions(phone_numbers) -> None:
+    """
+    Handle users the in-process scheduler found due (scheduler thread).
+
+    Each due user gets the same roll as a cron run would give them, then is
+    rescheduled for the next check, so a wake-up only touches due users.
+    """
+    now = datetime.now()
+    recheck_at = now + timedelta(minutes=INTERVENTION_RECHECK_MINUTES)
+    due = []
+
+    with scheduled_run():
+        for phone_number in phone_numbers:
+            # A failed check must not drop the user from the scheduler: they are
+            # rescheduled for the recheck time instead
+            next_check = recheck_at
+            try:
+                context = context_store.get(phone_number)
+                if context is None:
+                    continue
+
+                # Users in another worker's shard are only rescheduled
+                if handles_user(phone_number) and determine_if_intervention_needed(
+                    phone_number, context, now.hour
+                ):
+                    intervention_type = select_intervention_type(context, now.hour)
+                    context["intervention_type"] = intervention_type
+                    save_user_context(phone_number, context)
+                    due.append((phone_number, context, intervention_type))
+
+                next_check = next_intervention_check(context, not_before=recheck_at)
+            except Exception as e:
+                logger.error(f"Scheduler check for {phone_number} failed: {e}")
+            intervention_scheduler.schedule(phone_number, next_check.timestamp())
+
+        if due:
+            _, summary = scheduled_runner.run(due)
+            logger.info(
+                f"Scheduler checked {len(phone_numbers)} due users: "
+                f"{summary['sent']} sent, {summary['failed']} failed in {summary['total_seconds']}s"
+            )
+
+
+# Built-in alternative to calling /scheduled-interventions from cron: users
+# sit in a priority queue by next eligible time and the scheduler thread only
+# wakes when someone is due. Enable it in one process only, or in every
+# process together with SCHEDULED_SHARDS.
+INTERVENTION_SCHEDULER = env_flag("INTERVENTION_SCHEDULER", False)
+INTERVENTION_RECHECK_MINUTES = env_float("INTERVENTION_RECHECK_MINUTES", 60.0)
+intervention_scheduler = InterventionScheduler(
+    on_due=run_due_interventions,
+    batch_limit=env_int("INTERVENTION_SCHEDULER_BATCH", 1000),
+)
+
+
+def schedule_intervention_check(phone_number: str, context: Dict[str, Any]) -> None:
+    """(Re)schedule a user's next intervention check after their context changed."""
+    if INTERVENTION_SCHEDULER:
+        intervention_scheduler.schedule(
+            phone_number, next_intervention_check(context).timestamp()
+        )
+
+
+def start_intervention_scheduler() -> None:
+    """Load every known user into the scheduler once and start it."""
+    if not INTERVENTION_SCHEDULER:
+        return
+    for phone_number, context in context_store.items():
+        schedule_intervention_check(phone_number, context)
+    intervention_scheduler.start()
+
+
 def get_user_context(phone_number: str) -> Dict[str, Any]:
     """
     Get or create user context.
-    In a real app, this would be stored in a database.
+    Contexts are kept in the configured context store.
     """
-    if phone_number not in user_contexts:
+    context = context_store.get(phone_number)
+    if context is None:
         # Initialize with defaults
-        user_contexts[phone_number] = {
+        context = {
             "last_interaction": datetime.now().isoformat(),
             "location": "unknown",
             "activity": "unknown",
@@ -262,11 +874,20 @@ def get_user_context(phone_number: str) -> Dict[str, Any]:
             "glucose_readings": [],
             "medication_adherence": {},
         }
+        save_user_context(phone_number, context)
+        schedule_intervention_check(phone_number, context)
 
     # Always update time of day
-    user_contexts[phone_number]["time_of_day"] = get_time_of_day()
+    context["time_of_day"] = get_time_of_day()
+
+    return context
 
-    return user_contexts[phone_number]
+
+def save_user_context(phone_number: str, context: Dict[str, Any]) -> None:
+    """Persist changes made to a context returned by get_user_context."""
+    context_store.set(phone_number, context)
+    if context_table is not None:
+        context_table.upsert(phone_number, context)
 
 
 def update_user_context(
@@ -276,7 +897,7 @@ def update_user_context(
     Update user context based on the interaction.
     In a real app, this would use more sophisticated NLP and data management.
     """
-    context = user_contexts.get(phone_number, {})
+    context = context_store.get(phone_number) or {}
 
     # Update last interaction time
     context["last_interaction"] = datetime.now().isoformat()
@@ -306,78 +927,18 @@ def update_user_context(
             break
 
     # Store the updated context
-    user_contexts[phone_number] = context
-
+    save_user_context(phone_number, context)
 
-def determine_if_intervention_needed(
-    phone_number: str, context: Dict[str, Any], current_hour: int
-) -> bool:
-    """
-    Determine if an intervention should be sent based on user data and time.
-    In a real app, this would use more sophisticated logic.
-    """
-    # Don't send interventions during late night hours (11pm-6am)
-    if current_hour >= 23 or current_hour < 6:
-        return False
-
-    # Check when last interaction occurred
-    last_interaction = datetime.fromisoformat(
-        context.get("last_interaction", "2020-01-01T00:00:00")
-    )
-    hours_since_interaction = (datetime.now() - last_interaction).total_seconds() / 3600
-
-    # Don't send if user interacted in the last hour
-    if hours_since_interaction < 1:
-        return False
-
-    # Randomize a bit to avoid predictability
-    chance = random.random()
-
-    # Higher chance of intervention if it's been a while
-    if hours_since_interaction > 24:
-        return chance < 0.8  # 80% chance
-    elif hours_since_interaction > 12:
-        return chance < 0.5  # 50% chance
-    elif hours_since_interaction > 6:
-        return chance < 0.3  # 30% chance
-    else:
-        return chance < 0.1  # 10% chance
-
-
-def select_intervention_type(context: Dict[str, Any], current_hour: int) -> str:
-    """
-    Select which type of intervention to send based on context and time.
-    In a real app, this would use more sophisticated logic.
-    """
-    # Morning (6am-10am): Focus on glucose and medication
-    if 6 <= current_hour < 10:
-        return random.choice(["glucose", "medication"])
-
-    # Middle of day (10am-2pm): Focus on activity
-    elif 10 <= current_hour < 14:
-        return random.choice(["activity", "glucose"])
-
-    # Afternoon (2pm-6pm): Mix of all types
-    elif 14 <= current_hour < 18:
-        return random.choice(["glucose", "activity", "medication"])
-
-    # Evening (6pm-11pm): Focus on medication and educational
-    else:
-        return random.choice(["medication", "educational"])
+    # The user just interacted, so their next intervention moves out
+    schedule_intervention_check(phone_number, context)
 
 
 def get_time_of_day() -> str:
     """Get the current time of day classification."""
-    current_hour = datetime.now().hour
+    return time_of_day_for_hour(datetime.now().hour)
 
-    if 5 <= current_hour < 12:
-        return "morning"
-    elif 12 <= current_hour < 17:
-        return "afternoon"
-    elif 17 <= current_hour < 22:
-        return "evening"
-    else:
-        return "night"
+
+start_intervention_scheduler()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,16 @@
 # model_service.py
-import asyncio
 import json
 import logging
 import os
 import re
-import base64
 
-from google import genai
 from google.genai import types
 from google.genai.types import (FunctionDeclaration, GenerateContentConfig,
-                                Part, Tool, FunctionResponse
-                                )  # Removed LiveClientToolResponse
-from typing import Tuple, Optional
+                                Part, Tool)
 
 from fhir_data import get_patient_data
+from gemini_runtime import get_runtime
+from llm_backends import LiveBackend, UnaryBackend, create_backend
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -276,104 +273,71 @@ get_patient_data_declaration = {
 }
 
 
-async def handle_tool_call(session, tool_call):
-    """Handle function calls (tool calls) from the model."""
-    for fc in tool_call.function_calls:
-        if fc.name == "get_patient_data":
-            data_type = fc.args.get("data_type", "all")
-            try:
-                result = get_patient_data(data_type)
-            except Exception as e:
-                result = {"error": str(e)}
-
-            await session.send(
-                input=FunctionResponse(name=fc.name, id=fc.id, response=result)
-            )
-        else:
+def execute_tool(name: str, args: dict) -> dict:
+    """Run a tool call from the model and return its response payload."""
+    if name == "get_patient_data":
+        data_type = args.get("data_type", "all")
+        try:
+            return get_patient_data(data_type)
+        except Exception as e:
+            return {"error": str(e)}
+    return {"error": "Unknown function call"}
+
+
+def process_model_parts(parts, stream=None):
+    """Log generated code and code-execution output from a model turn."""
+    for part in parts or []:
+        if part.executable_code:
+            logger.info(f"Generated Python code:\n{part.executable_code.code}")
+        if part.code_execution_result:
+            output = part.code_execution_result.output
+            logger.info(f"Code execution result:\n{output}")
+
+
+live_config = {
+    "tools": [{
+        "function_declarations": [get_patient_data_declaration]
+    }, {
+        "code_execution": {}
+    }],
+    "generation_config": {
+        "response_modalities": ["TEXT"]
+    }
+}
 
-            await session.send(input=FunctionResponse(
-                name=fc.name,
-                id=fc.id,
-                response={"error": "Unknown function call"}))
+_backend = None
+
+
+def get_backend():
+    """The LLM backend selected by LLM_BACKEND (live, unary or fake)."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(
+            os.getenv("LLM_BACKEND") or "live",
+            live=lambda: LiveBackend("gemini-2.0-flash-exp", live_config,
+                                     execute_tool, process_model_parts),
+            unary=lambda: UnaryBackend(
+                "gemini-2.0-flash-001",
+                [
+                    Tool(function_declarations=[
+                        FunctionDeclaration(**get_patient_data_declaration)
+                    ]),
+                    Tool(code_execution=types.ToolCodeExecution()),
+                ],
+                execute_tool,
+                process_model_parts,
+            ),
+            execute_tool=execute_tool,
+            on_parts=process_model_parts)
+    return _backend
 
 
 async def run_gemini_conversation(system_prompt: str,
                                   conversation_text: str) -> str:
     """
-    Open a live session with the Gemini model, process image immediately.
+    Run one model turn on the configured backend and return its text.
     """
-    client = genai.Client(
-        api_key=os.getenv('GEMINI_API_KEY'),
-        http_options={'api_version': 'v1alpha'}  # Live (experimental)
-    )
-
-    config = {
-        "tools": [{
-            "function_declarations": [get_patient_data_declaration]
-        }, {
-            "code_execution": {}
-        }],
-        "generation_config": {
-            "response_modalities": ["TEXT"]
-        }
-    }
-
-    final_text = ""
-
-    async with client.aio.live.connect(model="gemini-2.0-flash-exp",
-                                       config=config) as session:
-        # Send the combined prompt
-        await session.send(input=f"{system_prompt}\n\n{conversation_text}",
-                           end_of_turn=True)
-
-        # Receive partial responses in a loop
-        async for response in session.receive():
-            # 1. If there's text, accumulate it
-            if response.text:
-                final_text += response.text
-
-            # 2. If there's a tool call, handle it
-            if response.tool_call:
-                await handle_tool_call(session, response.tool_call)
-
-            # 3. Process code execution and image IMMEDIATELY
-            if response.server_content and response.server_content.model_turn:
-                for part in response.server_content.model_turn.parts:
-                    if part.executable_code:
-                        logger.info(
-                            f"Generated Python code:\n{part.executable_code.code}"
-                        )
-                    if part.code_execution_result:
-                        output = part.code_execution_result.output
-                        logger.info(f"Code execution result:\n{output}")
-
-                        if output and output.startswith(
-                                'data:image/png;base64,'):
-                            try:
-                                # Extract base64 data and decode
-                                image_base64 = output.split(",")[1]
-                                image_bytes = base64.b64decode(image_base64)
-
-                                # Save the image
-                                with open("debug_chart.png", "wb") as f:
-                                    f.write(image_bytes)
-
-                                if os.path.exists(
-                                        "debug_chart.png") and os.path.getsize(
-                                            "debug_chart.png") > 100:
-                                    logger.info(
-                                        "debug_chart.png created successfully."
-                                    )
-                                else:
-                                    logger.warning(
-                                        "debug_chart.png creation failed or file is too small."
-                                    )
-
-                            except Exception as e:
-                                logger.error(f"Error processing image: {e}")
-
-        # Once the loop finishes, we have the full response in final_text
-    return final_text  # Only return the text
+    return await get_backend().generate(system_prompt, conversation_text)
 
 
 def build_conversation_text(conversation_slice):
@@ -404,7 +368,7 @@ def call_gemini(conversation_slice):
     system_prompt = create_context()
     conversation_text = build_conversation_text(conversation_slice)
 
-    final_text = asyncio.run(
+    final_text = get_runtime().run(
         run_gemini_conversation(system_prompt, conversation_text))
 
     # --- Parse the text response ---
@@ -1,12 +1,19 @@
 # message_handler.py
 import os
 import logging
+import threading
+import time
+from collections import deque
 import requests
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Deque, Dict, Tuple, Any, Optional
 from PIL import Image
 import io
 import base64
 
+from chart_store import MMS_VARIANT, content_key, get_chart_store, mms_variant_url
+from metrics import span
+from rate_limiter import create_send_rate_limiter
+
 # Import Pinnacle class if rcs package is installed
 try:
     from rcs import Pinnacle
@@ -17,6 +24,17 @@ except ImportError:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Client-side send budgets per channel plus a global budget (None = unlimited).
+# Sends wait for a token instead of hitting provider throughput limits.
+send_rate_limiter = create_send_rate_limiter()
+
+
+def wait_for_send_slot(channel: str) -> None:
+    """Block until the rate limiter allows a send on this channel."""
+    if send_rate_limiter is not None:
+        send_rate_limiter.acquire(channel)
+
+
 def reformat_for_sms_mms(rcs_response: Dict[str, Any]) -> Dict[str, Any]:
     """
     Convert rich RCS content to SMS/MMS friendly format.
@@ -42,7 +60,8 @@ def reformat_for_sms_mms(rcs_response: Dict[str, Any]) -> Dict[str, Any]:
             if "subtitle" in card:
                 sms_text += f"{card['subtitle']}\n"
             if "mediaUrl" in card:
-                media_urls.append(card["mediaUrl"])
+                # Our own chart URLs have a pre-optimized MMS variant
+                media_urls.append(mms_variant_url(card["mediaUrl"]))
             
             # Convert buttons to text links/instructions
             if "buttons" in card:
@@ -69,6 +88,7 @@ def reformat_for_sms_mms(rcs_response: Dict[str, Any]) -> Dict[str, Any]:
         "mediaUrls": media_urls[:1]  # MMS typically supports 1 image
     }
 
+
 def optimize_chart_for_fallback(chart_image_path: str, target_size_kb: int = None) -> str:
     """
     Optimize chart image for MMS delivery.
@@ -116,6 +136,58 @@ def optimize_chart_for_fallback(chart_image_path: str, target_size_kb: int = Non
         logger.error(f"Failed to optimize image: {e}")
         return chart_image_path  # Return original if optimization fails
 
+
+def optimize_image_bytes(image_bytes: bytes, target_size_kb: int = None) -> bytes:
+    """
+    Resize and JPEG-compress an image for MMS delivery.
+
+    Args:
+        image_bytes: Encoded image (PNG, JPEG, ...)
+        target_size_kb: Target file size in KB
+
+    Returns:
+        JPEG bytes
+
+    Raises:
+        Exception: If the image cannot be decoded or encoded
+    """
+    # Get settings from environment or use defaults
+    if target_size_kb is None:
+        target_size_kb = int(os.getenv('MMS_IMAGE_MAX_SIZE_KB', 100))
+
+    max_dimension = int(os.getenv('MMS_IMAGE_MAX_DIMENSION', 800))
+
+    img = Image.open(io.BytesIO(image_bytes))
+    # JPEG has no alpha channel (matplotlib PNGs are RGBA)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    # Resize if needed
+    if max(img.size) > max_dimension:
+        ratio = max_dimension / max(img.size)
+        new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
+        img = img.resize(new_size, Image.LANCZOS)
+
+    # Optimize using buffer
+    buffer = io.BytesIO()
+
+    # Try different qualities until we reach target size
+    quality = 85
+    while quality > 45:
+        buffer.seek(0)
+        buffer.truncate(0)
+        img.save(buffer, format="JPEG", quality=quality)
+        size_kb = len(buffer.getvalue()) / 1024
+
+        if size_kb <= target_size_kb:
+            break
+
+        quality -= 10
+
+    logger.info(f"Optimized image from {len(image_bytes)/1024:.1f}KB to {size_kb:.1f}KB")
+    return buffer.getvalue()
+
+
 def optimize_base64_image(base64_image: str, target_size_kb: int = None) -> str:
     """
     Optimize a base64 encoded image for MMS delivery.
@@ -127,51 +199,20 @@ def optimize_base64_image(base64_image: str, target_size_kb: int = None) -> str:
     Returns:
         Optimized base64 encoded image
     """
-    # Get settings from environment or use defaults
-    if target_size_kb is None:
-        target_size_kb = int(os.getenv('MMS_IMAGE_MAX_SIZE_KB', 100))
-    
-    max_dimension = int(os.getenv('MMS_IMAGE_MAX_DIMENSION', 800))
-    
     try:
         # Extract the actual base64 data if it has a data URI prefix
         if base64_image.startswith('data:'):
             # Format: data:image/png;base64,actualbase64data
-            image_format = base64_image.split(';')[0].split('/')[1]
             base64_data = base64_image.split(',')[1]
         else:
-            image_format = 'png'  # Assume PNG if no prefix
             base64_data = base64_image
         
         # Decode base64 to image
         image_bytes = base64.b64decode(base64_data)
-        img = Image.open(io.BytesIO(image_bytes))
-        
-        # Resize if needed
-        if max(img.size) > max_dimension:
-            ratio = max_dimension / max(img.size)
-            new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-            img = img.resize(new_size, Image.LANCZOS)
-        
-        # Optimize using buffer
-        buffer = io.BytesIO()
-        
-        # Try different qualities until we reach target size
-        quality = 85
-        while quality > 45:
-            buffer.seek(0)
-            buffer.truncate(0)
-            img.save(buffer, format="JPEG", quality=quality)
-            size_kb = len(buffer.getvalue()) / 1024
-            
-            if size_kb <= target_size_kb:
-                break
-                
-            quality -= 10
+        optimized = optimize_image_bytes(image_bytes, target_size_kb)
         
         # Convert back to base64
-        optimized_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        logger.info(f"Optimized base64 image from {len(base64_data)/1024:.1f}KB to {size_kb:.1f}KB")
+        optimized_base64 = base64.b64encode(optimized).decode('utf-8')
         
         # Return with data URI prefix for compatibility
         return f"data:image/jpeg;base64,{optimized_base64}"
@@ -179,6 +220,32 @@ def optimize_base64_image(base64_image: str, target_size_kb: int = None) -> str:
         logger.error(f"Failed to optimize base64 image: {e}")
         return base64_image  # Return original if optimization fails
 
+
+def optimize_chart_data_uri(data_uri: str) -> str:
+    """
+    optimize_base64_image through the chart store: images are keyed by a hash
+    of their bytes, so a chart that was already optimized (in this process or,
+    with CHART_STORE_DIR, by another one) is not re-encoded.
+
+    Args:
+        data_uri: data:image/...;base64,... image
+
+    Returns:
+        Optimized JPEG data URI, or the original if optimization fails
+    """
+    try:
+        image_bytes = base64.b64decode(data_uri.split(',', 1)[1])
+        key = content_key(image_bytes)
+        store = get_chart_store()
+        if data_uri.startswith('data:image/png'):
+            store.get_or_create(key, "png", lambda: image_bytes)
+        optimized = store.get_or_create(key, MMS_VARIANT, lambda: optimize_image_bytes(image_bytes))
+        return f"data:image/jpeg;base64,{base64.b64encode(optimized).decode('utf-8')}"
+    except Exception as e:
+        logger.error(f"Failed to optimize base64 image: {e}")
+        return data_uri
+
+
 def send_message(to_number: str, rcs_response: Dict[str, Any], pinnacle_client=None) -> Tuple[Dict[str, Any], str]:
     """
     Send message with smart fallback from RCS to MMS/SMS.
@@ -206,14 +273,16 @@ def send_message(to_number: str, rcs_response: Dict[str, Any], pinnacle_client=N
         for card in rcs_response["cards"]:
             if "mediaUrl" in card and card["mediaUrl"].startswith("data:image"):
                 # If it's a base64 image, optimize it
-                card["mediaUrl"] = optimize_base64_image(card["mediaUrl"])
+                with span("optimize_base64_image"):
+                    card["mediaUrl"] = optimize_chart_data_uri(card["mediaUrl"])
     
     # Check if we should force SMS fallback (for testing)
     force_fallback = os.getenv('FORCE_SMS_FALLBACK', 'false').lower() in ('true', '1', 'yes')
     
     # Check RCS capability with Pinnacle API (unless forced)
     if not force_fallback:
-        capability_check = pinnacle_client.check_capabilities(to_number)
+        with span("check_capabilities"):
+            capability_check = pinnacle_client.check_capabilities(to_number)
         rcs_supported = capability_check.get("rcs_supported", False)
     else:
         rcs_supported = False
@@ -222,10 +291,12 @@ def send_message(to_number: str, rcs_response: Dict[str, Any], pinnacle_client=N
     # If RCS is supported, send full RCS message
     if rcs_supported:
         logger.info(f"Sending RCS message to {to_number}")
-        response = pinnacle_client.send.rcs(
-            to=to_number,
-            **rcs_response
-        )
+        wait_for_send_slot("rcs")
+        with span("send.rcs"):
+            response = pinnacle_client.send.rcs(
+                to=to_number,
+                **rcs_response
+            )
         return response, "rcs"
     
     # Otherwise, reformat and send as MMS or SMS
@@ -235,21 +306,76 @@ def send_message(to_number: str, rcs_response: Dict[str, Any], pinnacle_client=N
     # If we have media, send as MMS
     if sms_content["mediaUrls"]:
         logger.info(f"Sending MMS to {to_number}")
-        response = pinnacle_client.send.mms(
-            to=to_number,
-            text=sms_content["text"],
-            mediaUrls=sms_content["mediaUrls"]
-        )
+        wait_for_send_slot("mms")
+        with span("send.mms"):
+            response = pinnacle_client.send.mms(
+                to=to_number,
+                text=sms_content["text"],
+                mediaUrls=sms_content["mediaUrls"]
+            )
         return response, "mms"
     
     # Otherwise, send as plain SMS
     logger.info(f"Sending SMS to {to_number}")
-    response = pinnacle_client.send.sms(
-        to=to_number,
-        text=sms_content["text"]
-    )
+    wait_for_send_slot("sms")
+    with span("send.sms"):
+        response = pinnacle_client.send.sms(
+            to=to_number,
+            text=sms_content["text"]
+        )
     return response, "sms"
 
+
+class FakePinnacleClient:
+    """
+    Stand-in for the Pinnacle client that records messages instead of sending
+    them, for load tests and local runs (PINNACLE_FAKE=true).
+    """
+
+    class _Sender:
+        def __init__(self, client: "FakePinnacleClient"):
+            self._client = client
+
+        def rcs(self, to: str, **message) -> Dict[str, Any]:
+            return self._client._record("rcs", to, message)
+
+        def mms(self, to: str, **message) -> Dict[str, Any]:
+            return self._client._record("mms", to, message)
+
+        def sms(self, to: str, **message) -> Dict[str, Any]:
+            return self._client._record("sms", to, message)
+
+    def __init__(self, rcs_supported: bool = True, latency: float = 0.0, keep_last: int = 1000):
+        """
+        Args:
+            rcs_supported: Value reported by check_capabilities
+            latency: Seconds each send takes
+            keep_last: Most recent messages kept in `sent` (totals are counted
+                separately, so long soak runs stay bounded)
+        """
+        self.rcs_supported = rcs_supported
+        self.latency = latency
+        self.sent: Deque[Dict[str, Any]] = deque(maxlen=keep_last)
+        self.sent_count = 0
+        self.sent_by_channel: Dict[str, int] = {"rcs": 0, "mms": 0, "sms": 0}
+        self._lock = threading.Lock()
+        self.send = self._Sender(self)
+
+    def check_capabilities(self, to_number: str) -> Dict[str, Any]:
+        return {"rcs_supported": self.rcs_supported}
+
+    def _record(self, channel: str, to: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        if self.latency:
+            time.sleep(self.latency)
+        entry = {"channel": channel, "to": to, "message": message, "sent_at": time.time()}
+        with self._lock:
+            self.sent.append(entry)
+            self.sent_count += 1
+            self.sent_by_channel[channel] += 1
+            message_id = f"fake-{self.sent_count}"
+        return {"status": "sent", "channel": channel, "id": message_id}
+
+
 # Helper function to get Pinnacle client
 def get_pinnacle_client() -> Any:
     """
@@ -258,6 +384,10 @@ def get_pinnacle_client() -> Any:
     Returns:
         Initialized Pinnacle client or None if not available
     """
+    if os.getenv('PINNACLE_FAKE', 'false').lower() in ('true', '1', 'yes'):
+        logger.warning("PINNACLE_FAKE is set: messages will be recorded, not sent")
+        return FakePinnacleClient()
+
     if Pinnacle is None:
         logger.error("rcs package not installed. Cannot create Pinnacle client.")
         return None
@@ -269,6 +399,7 @@ def get_pinnacle_client() -> Any:
     
     return Pinnacle(api_key=api_key)
 
+
 # Simple function to test the module
 def test_message_handling():
     """Test the message handling functionality with a sample RCS response."""
@@ -312,5 +443,6 @@ def test_message_handling():
     # Can't test sending without actual credentials
     print("To send a message, use send_message() with valid credentials")
 
+
 if __name__ == "__main__":
     test_message_handling()
\ No newline at end of file
@@ -1,26 +1,141 @@
 import asyncio
+import contextlib
+import copy
+import functools
+import hashlib
 import json
 import logging
 import os
 import re
-import base64
+import contextvars
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from google import genai
-from google.genai.types import FunctionResponse
-from typing import Dict, Any
-
-from fhir_data import get_patient_data
+from google.genai import types
+from typing import Dict, Any, List, Optional
+
+from fhir_data import get_patient_data, on_patient_data_change
+from chart_renderer import ChartRenderer, ChartSpecError
+from data_prefetch import build_prefetch_block, detect_data_types, record_prefetch_outcome
+from gemini_runtime import get_runtime
+from session_pool import LiveSessionPool
+from prompt_cache import PromptCache
+from llm_backends import LLMBackend, LiveBackend, UnaryBackend, create_backend, track_tool_calls
+from progressive_delivery import ReplyStream, fill_chart_placeholders
+from config import env_flag, env_float, env_int
+from metrics import counter, span
+from ttl_cache import TTLCache
+from log_utils import VERBOSE
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def create_context() -> str:
-    return """
+# render_chart answers with media URLs that Pinnacle has to fetch from this
+# app, so the tool is only offered when an absolute public URL is configured;
+# otherwise the model draws charts with code execution as before
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+RENDER_CHART_ENABLED = PUBLIC_BASE_URL.startswith(("http://", "https://"))
+if not RENDER_CHART_ENABLED:
+    logger.warning("PUBLIC_BASE_URL is not an absolute URL: render_chart is disabled")
+
+RENDER_CHART_INSTRUCTIONS = """    - To include a chart, call the `render_chart` tool with a small JSON spec. Do **not** draw charts with code execution or print image data.
+    - The spec fields:
+        - `type`: "line", "bar" or "scatter"
+        - `title`: short chart title
+        - `labels`: x-axis labels (e.g. dates), one per value
+        - `series`: list of {"name": ..., "values": [numbers]} (one entry per line/bar group)
+        - `x_label` / `y_label`: axis labels, include units
+        - `reference_ranges`: optional list of {"label": ..., "low": ..., "high": ...} for normal or target ranges
+    - Think about the clearest chart for the data: trends over time as lines, comparisons as bars, and show the healthy range where one applies.
+    - `render_chart` returns {"url": ...}. Put that URL in "mediaUrl" (where the examples show {{GRAPH_URL}}).
+    - Example call:
+        ```json
+        {
+          "type": "line",
+          "title": "HbA1c trend",
+          "labels": ["2023-04", "2023-07", "2023-10", "2024-01"],
+          "series": [{"name": "HbA1c", "values": [7.4, 7.1, 6.9, 6.8]}],
+          "y_label": "HbA1c (%)",
+          "reference_ranges": [{"label": "Target", "low": 4.0, "high": 7.0}]
+        }
+        ```
+
+"""
+RENDER_CHART_REFERENCE = """- Call render_chart(type, title, labels, series, x_label, y_label, reference_ranges); the chart is rendered on our server.
+- The chart service accepts "line", "bar", or "scatter".
+- Use the patient data values directly in "series"; never pass image data.
+- Place the returned URL in "mediaUrl".
+
+"""
+CODE_EXECUTION_CHART_INSTRUCTIONS = """    - When including a chart, generate **executable Python code** using the **Matplotlib** library to create the chart.
+    - The code should:
+        - Import `matplotlib.pyplot` as `plt`.
+        - Import `io` and `base64`.
+        - Think creatively, thoughtfully and draw a simple, visually appealing chart. It should be very clear and easy to understand. Use appropriate colors, design and appropriate chart types.
+        - Create the chart (e.g., `plt.plot`, `plt.bar`, etc.).
+        - Set appropriate labels and titles.
+        - Save the chart to an in-memory `io.BytesIO` object.
+        - Encode the image data as a base64 string.
+        - Print the base64 string (this is how you'll get the image data).
+    -  Example (Line Chart):
+        ```python
+        import matplotlib.pyplot as plt
+        import io
+        import base64
+
+        # Sample data (replace with actual data)
+        x_values = [1, 2, 3, 4, 5]
+        y_values = [2, 4, 1, 3, 5]
+
+        plt.plot(x_values, y_values)
+        plt.xlabel("X-Axis")
+        plt.ylabel("Y-Axis")
+        plt.title("Sample Line Chart")
+
+        buf = io.BytesIO()
+        plt.savefig(buf, format='png')
+        plt.close()
+        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        buf.close()
+        print(f'data:image/png;base64,{image_base64}')
+
+        ```
+    - Example (Bar Chart):
+          ```python
+          import matplotlib.pyplot as plt
+          import io
+          import base64
+
+          # Sample data
+          labels = ['A', 'B', 'C']
+          values = [10, 25, 15]
+
+          plt.bar(labels, values)
+          plt.xlabel("Categories")
+          plt.ylabel("Values")
+          plt.title("Sample Bar Chart")
+
+          buf = io.BytesIO()
+          plt.savefig(buf, format='png')
+          plt.close()
+          image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+          buf.close()
+          print(f'data:image/png;base64,{image_base64}')
+          ```
+
+"""
+CODE_EXECUTION_CHART_REFERENCE = """- Use Python to call generate_graph(graph_type, data) and then upload_to_pinnacle() internally.
+- The chart service accepts "line", "bar", or "scatter".
+- data can be { "labels": [...], "values": [...] } or a list of { "x": ..., "y": ... }.
+- Return the final Pinnacle URL, which you place in "mediaUrl".
+
+"""
+
+
+_PROMPT_TEMPLATE = """
 # SlothMD System Prompt
 
 You are SlothMD, a consumer-facing medical bot designed to deliver adaptive micro-moment health interventions. You must respond to user queries in **JSON format** following the RCS message schema, while also supporting interactive features such as buttons, quick replies, and charts. Your goal is to provide helpful, accurate health information, useful insights, and be friendly and conversational.
@@ -101,63 +216,7 @@ You are SlothMD, a consumer-facing medical bot designed to deliver adaptive micr
      If you provide "cards", do not provide a top-level "text" or "mediaUrl". However, we are **extending** the structure to include an optional "graph" object. This is custom logic and not standard RCS, but required for our system.
 
 6. **Charts and GRAPH_DATA**
-    - When including a chart, generate **executable Python code** using the **Matplotlib** library to create the chart.
-    - The code should:
-        - Import `matplotlib.pyplot` as `plt`.
-        - Import `io` and `base64`.
-        - Think creatively, thoughtfully and draw a simple, visually appealing chart. It should be very clear and easy to understand. Use appropriate colors, design and appropriate chart types.
-        - Create the chart (e.g., `plt.plot`, `plt.bar`, etc.).
-        - Set appropriate labels and titles.
-        - Save the chart to an in-memory `io.BytesIO` object.
-        - Encode the image data as a base64 string.
-        - Print the base64 string (this is how you'll get the image data).
-    -  Example (Line Chart):
-        ```python
-        import matplotlib.pyplot as plt
-        import io
-        import base64
-
-        # Sample data (replace with actual data)
-        x_values = [1, 2, 3, 4, 5]
-        y_values = [2, 4, 1, 3, 5]
-
-        plt.plot(x_values, y_values)
-        plt.xlabel("X-Axis")
-        plt.ylabel("Y-Axis")
-        plt.title("Sample Line Chart")
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close()
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        buf.close()
-        print(f'data:image/png;base64,{image_base64}')
-
-        ```
-    - Example (Bar Chart):
-          ```python
-          import matplotlib.pyplot as plt
-          import io
-          import base64
-
-          # Sample data
-          labels = ['A', 'B', 'C']
-          values = [10, 25, 15]
-
-          plt.bar(labels, values)
-          plt.xlabel("Categories")
-          plt.ylabel("Values")
-          plt.title("Sample Bar Chart")
-
-          buf = io.BytesIO()
-          plt.savefig(buf, format='png')
-          plt.close()
-          image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-          buf.close()
-          print(f'data:image/png;base64,{image_base64}')
-          ```
-
-7. **Health Cards with Expandable Content**
+<<CHART_INSTRUCTIONS>>7. **Health Cards with Expandable Content**
    - When showing health data, implement "progressive disclosure" with expandable content
    - For each health card, include buttons that let users:
      - See more detailed information ("See More" or "View Details")
@@ -241,12 +300,7 @@ You are SlothMD, a consumer-facing medical bot designed to deliver adaptive micr
 - Call get_patient_data whenever you need the user's health data.
 
 ## Chart Generation (Reference)
-- Use Python to call generate_graph(graph_type, data) and then upload_to_pinnacle() internally.
-- The chart service accepts "line", "bar", or "scatter".
-- data can be { "labels": [...], "values": [...] } or a list of { "x": ..., "y": ... }.
-- Return the final Pinnacle URL, which you place in "mediaUrl".
-
-## Micro-Moment Intervention Examples
+<<CHART_REFERENCE>>## Micro-Moment Intervention Examples
 
 ### Example 1: Pre-hypoglycemic Alert
 ```json
@@ -360,6 +414,23 @@ You are SlothMD, a consumer-facing medical bot designed to deliver adaptive micr
 """
 
 
+@functools.lru_cache(maxsize=1)
+def create_context() -> str:
+    """Return the SlothMD system prompt (built once per process)."""
+    if RENDER_CHART_ENABLED:
+        chart_instructions, chart_reference = RENDER_CHART_INSTRUCTIONS, RENDER_CHART_REFERENCE
+    else:
+        chart_instructions, chart_reference = CODE_EXECUTION_CHART_INSTRUCTIONS, CODE_EXECUTION_CHART_REFERENCE
+    return _PROMPT_TEMPLATE.replace("<<CHART_INSTRUCTIONS>>", chart_instructions).replace(
+        "<<CHART_REFERENCE>>", chart_reference
+    )
+
+
+# Hash of the prompt text: changes whenever the prompt does, and names the
+# cached content in GEMINI_CACHED_CONTENT mode
+PROMPT_VERSION = hashlib.sha256(create_context().encode("utf-8")).hexdigest()[:12]
+
+
 get_patient_data_declaration = {
     "name": "get_patient_data",
     "description": "Retrieves patient data from FHIR server based on the provided query.",
@@ -377,102 +448,248 @@ get_patient_data_declaration = {
 }
 
 
-async def handle_tool_call(session, tool_call):
-    """Handle function calls (tool calls) from the model."""
-    for fc in tool_call.function_calls:
-        if fc.name == "get_patient_data":
-            data_type = fc.args.get("data_type", "all")
-            try:
-                result = get_patient_data(data_type)
-            except Exception as e:
-                result = {"error": str(e)}
+render_chart_declaration = {
+    "name": "render_chart",
+    "description": "Renders a chart from a compact spec on the server and returns its image URL for mediaUrl.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": ["line", "bar", "scatter"]},
+            "title": {"type": "string"},
+            "labels": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "X-axis labels, one per value",
+            },
+            "series": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "values": {"type": "array", "items": {"type": "number"}},
+                    },
+                    "required": ["values"],
+                },
+            },
+            "x_label": {"type": "string"},
+            "y_label": {"type": "string"},
+            "reference_ranges": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "label": {"type": "string"},
+                        "low": {"type": "number"},
+                        "high": {"type": "number"},
+                    },
+                },
+                "description": "Normal or target ranges drawn as shaded bands",
+            },
+        },
+        "required": ["type", "series"],
+    },
+}
 
-            await session.send(
-                input=FunctionResponse(name=fc.name, id=fc.id, response=result)
-            )
-        else:
+# Charts requested through render_chart are drawn here and served from
+# /charts/<id>.png, so replies carry a URL instead of base64 image data
+chart_renderer = ChartRenderer(base_url=PUBLIC_BASE_URL)
 
-            await session.send(
-                input=FunctionResponse(
-                    name=fc.name, id=fc.id, response={"error": "Unknown function call"}
-                )
-            )
+# Function declarations offered to the model (render_chart needs PUBLIC_BASE_URL)
+FUNCTION_DECLARATIONS = [get_patient_data_declaration]
+if RENDER_CHART_ENABLED:
+    FUNCTION_DECLARATIONS.append(render_chart_declaration)
+
+
+def execute_tool(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a model tool call and return its response payload."""
+    if name == "get_patient_data":
+        data_type = args.get("data_type", "all")
+        try:
+            with span("get_patient_data"):
+                return get_patient_data(data_type)
+        except Exception as e:
+            return {"error": str(e)}
+    if name == "render_chart" and RENDER_CHART_ENABLED:
+        try:
+            with span("render_chart"):
+                return chart_renderer.render(args)
+        except ChartSpecError as e:
+            return {"error": f"Invalid chart spec: {e}"}
+    return {"error": "Unknown function call"}
 
 
-async def run_gemini_conversation(system_prompt: str, conversation_text: str) -> str:
+LIVE_MODEL = "gemini-2.0-flash-exp"
+
+live_config = {
+    "tools": [
+        {"function_declarations": FUNCTION_DECLARATIONS},
+        {"code_execution": {}},
+    ],
+    "generation_config": {"response_modalities": ["TEXT"]},
+}
+
+# Keep pre-connected Live sessions with the system prompt already loaded
+GEMINI_SESSION_POOL = env_flag("GEMINI_SESSION_POOL", False)
+_session_pool = None
+_session_pool_lock = asyncio.Lock()
+
+
+async def get_session_pool(system_prompt: str) -> LiveSessionPool:
     """
-    Open a live session with the Gemini model, process image immediately.
+    Return the warm session pool for this prompt, creating it on first use.
+
+    Must be awaited on the runtime loop.
     """
-    # Using API key and options from environment
-    client = genai.Client(
-        api_key=os.getenv("GEMINI_API_KEY"),
-        http_options={"api_version": "v1alpha"},  # Live (experimental)
-    )
+    global _session_pool
+    async with _session_pool_lock:
+        if _session_pool is not None and _session_pool.system_prompt != system_prompt:
+            # Prompt changed: warm sessions hold the old one
+            await _session_pool.close()
+            _session_pool = None
+
+        if _session_pool is None:
+            client = get_runtime().client
+            _session_pool = LiveSessionPool(
+                connect=lambda: client.aio.live.connect(model=LIVE_MODEL, config=live_config),
+                system_prompt=system_prompt,
+                min_size=env_int("GEMINI_POOL_MIN_SIZE", 2),
+                max_size=env_int("GEMINI_POOL_MAX_SIZE", 8),
+                idle_ttl=env_float("GEMINI_POOL_IDLE_TTL", 300.0),
+                max_age=env_float("GEMINI_POOL_MAX_AGE", 540.0),
+            )
+            await _session_pool.start()
+        return _session_pool
+
+
+# Register the prompt as Gemini cached content and send only the conversation.
+# The Live API cannot reference cached content, so this mode uses the unary
+# backend (generate_content with the same tools) against GEMINI_CACHE_MODEL.
+GEMINI_CACHED_CONTENT = env_flag("GEMINI_CACHED_CONTENT", False)
+CACHE_MODEL = os.getenv("GEMINI_CACHE_MODEL", "gemini-2.0-flash-001")
+MAX_TOOL_ROUNDS = 5
+_prompt_cache = None
+
+
+# Tools for unary generate_content calls (the cached prompt holds them too)
+UNARY_TOOLS = [
+    types.Tool(
+        function_declarations=[types.FunctionDeclaration(**declaration) for declaration in FUNCTION_DECLARATIONS]
+    ),
+    types.Tool(code_execution=types.ToolCodeExecution()),
+]
+
+
+def get_prompt_cache() -> PromptCache:
+    global _prompt_cache
+    if _prompt_cache is None:
+        _prompt_cache = PromptCache(
+            model=CACHE_MODEL,
+            system_prompt=create_context(),
+            version=PROMPT_VERSION,
+            tools=UNARY_TOOLS,
+            ttl=env_float("GEMINI_CACHE_TTL", 3600.0),
+        )
+    return _prompt_cache
+
+
+@contextlib.asynccontextmanager
+async def pooled_session(system_prompt: str):
+    """Lease a warm Live session that already holds the system prompt."""
+    pool = await get_session_pool(system_prompt)
+    async with pool.lease() as session:
+        yield session
+
+
+# Which model backend runs conversations: "live" (Gemini Live API), "unary"
+# (generate_content, used for cached content) or "fake" (scripted replay for
+# offline load tests, see llm_backends.FakeBackend)
+LLM_BACKEND = os.getenv("LLM_BACKEND") or ("unary" if GEMINI_CACHED_CONTENT else "live")
+_backend = None
+
+
+def get_backend() -> LLMBackend:
+    """Return the configured LLM backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(
+            LLM_BACKEND,
+            live=lambda: LiveBackend(
+                LIVE_MODEL,
+                live_config,
+                execute_tool,
+                process_model_parts,
+                session_source=pooled_session if GEMINI_SESSION_POOL else None,
+            ),
+            unary=lambda: UnaryBackend(
+                CACHE_MODEL,
+                UNARY_TOOLS,
+                execute_tool,
+                process_model_parts,
+                prompt_cache=get_prompt_cache() if GEMINI_CACHED_CONTENT else None,
+                max_tool_rounds=MAX_TOOL_ROUNDS,
+            ),
+            execute_tool=execute_tool,
+            on_parts=process_model_parts,
+        )
+    return _backend
 
-    config = {
-        "tools": [
-            {"function_declarations": [get_patient_data_declaration]},
-            {"code_execution": {}},
-        ],
-        "generation_config": {"response_modalities": ["TEXT"]},
-    }
 
-    final_text = ""
+def warm_session_pool() -> None:
+    """Start connecting warm sessions in the background (no-op unless pooling is on)."""
+    if GEMINI_SESSION_POOL and LLM_BACKEND == "live":
+        get_runtime().submit(get_session_pool(create_context()))
 
-    async with client.aio.live.connect(
-        model="gemini-2.0-flash-exp", config=config
-    ) as session:
-        # Send the combined prompt with end_of_turn flag
-        await session.send(
-            input=f"{system_prompt}\n\n{conversation_text}", end_of_turn=True
-        )
 
-        # Receive partial responses in a loop
-        async for response in session.receive():
-            # 1. If there's text, accumulate it
-            if response.text:
-                final_text += response.text
-
-            # 2. If there's a tool call, handle it
-            if response.tool_call:
-                await handle_tool_call(session, response.tool_call)
-
-            # 3. Process code execution and image IMMEDIATELY
-            if response.server_content and response.server_content.model_turn:
-                for part in response.server_content.model_turn.parts:
-                    if part.executable_code:
-                        logger.info(
-                            f"Generated Python code:\n{part.executable_code.code}"
-                        )
-                    if part.code_execution_result:
-                        output = part.code_execution_result.output
-                        logger.info(f"Code execution result:\n{output}")
-
-                        if output and output.startswith("data:image/png;base64,"):
-                            try:
-                                # Extract base64 data and decode
-                                image_base64 = output.split(",")[1]
-                                image_bytes = base64.b64decode(image_base64)
-
-                                # Save the image
-                                with open("debug_chart.png", "wb") as f:
-                                    f.write(image_bytes)
-
-                                if (
-                                    os.path.exists("debug_chart.png")
-                                    and os.path.getsize("debug_chart.png") > 100
-                                ):
-                                    logger.info("debug_chart.png created successfully.")
-                                else:
-                                    logger.warning(
-                                        "debug_chart.png creation failed or file is too small."
-                                    )
-
-                            except Exception as e:
-                                logger.error(f"Error processing image: {e}")
-
-        # Once the loop finishes, we have the full response in final_text
-    return final_text  # Only return the text
+# Charts printed by code execution during the current turn (see run_gemini_conversation)
+_turn_charts: "contextvars.ContextVar[Optional[List[str]]]" = contextvars.ContextVar(
+    "turn_charts", default=None
+)
+
+
+async def run_gemini_conversation(
+    system_prompt: str,
+    conversation_text: str,
+    stream: Optional[ReplyStream] = None,
+    tool_calls: Optional[List[str]] = None,
+    charts: Optional[List[str]] = None,
+) -> str:
+    """
+    Run one model turn on the configured backend (LLM_BACKEND).
+
+    The Live backend leases a warm session holding the system prompt when
+    GEMINI_SESSION_POOL is enabled; the unary backend references the prompt
+    from cached content when GEMINI_CACHED_CONTENT is enabled. Streamed text
+    is passed to `stream` if given, the names of the tools the model called
+    are appended to `tool_calls` and code-execution chart images to `charts`.
+    """
+    token = _turn_charts.set(charts)
+    try:
+        with track_tool_calls(tool_calls):
+            return await get_backend().generate(system_prompt, conversation_text, stream)
+    finally:
+        _turn_charts.reset(token)
+
+
+def process_model_parts(parts, stream: Optional[ReplyStream] = None) -> None:
+    """Log generated code and collect code-execution chart images for the turn."""
+    for part in parts or []:
+        if part.executable_code:
+            logger.info(
+                "Generated Python code:\n%s",
+                part.executable_code.code,
+                extra=VERBOSE,
+            )
+        if part.code_execution_result:
+            output = part.code_execution_result.output
+            logger.info("Code execution result:\n%s", output, extra=VERBOSE)
+
+            if output and output.startswith("data:image/png;base64,"):
+                # Runs on the shared Gemini loop: only hand the data URI on
+                # (decoding and optimizing happen when the reply is sent)
+                charts = _turn_charts.get()
+                if charts is not None:
+                    charts.append(output.strip())
 
 
 def build_conversation_text(conversation_slice):
@@ -496,15 +713,28 @@ def remove_markdown_code_fences(text: str) -> str:
     return cleaned.strip()
 
 
-def call_gemini(conversation_slice, context_data: Dict[str, Any] = None):
+# Detect which patient data a message is about (labs, vitals, medications,
+# conditions) and put that projection in the first prompt
+FHIR_PREFETCH = env_flag("FHIR_PREFETCH", False)
+FHIR_PREFETCH_MAX_CHARS = env_int("FHIR_PREFETCH_MAX_CHARS", 8000)
+
+
+def call_gemini(
+    conversation_slice,
+    context_data: Dict[str, Any] = None,
+    stream: Optional[ReplyStream] = None,
+):
     """
     Called from main.py.
 
     Args:
         conversation_slice: List of conversation turns
         context_data: Optional context data for smarter interventions
+        stream: Optional progressive delivery; its first message is sent from
+            this thread while the rest of the reply is still generating
     """
-    system_prompt = create_context()
+    with span("create_context"):
+        system_prompt = create_context()
     conversation_text = build_conversation_text(conversation_slice)
 
     # Add context data to the conversation if provided
@@ -525,7 +755,36 @@ def call_gemini(conversation_slice, context_data: Dict[str, Any] = None):
                 context_str += f"{key}: {value}\n"
         conversation_text += context_str
 
-    final_text = asyncio.run(run_gemini_conversation(system_prompt, conversation_text))
+    # Attach the patient data the question is about so the model can answer
+    # without a get_patient_data round trip
+    prefetched = []
+    if FHIR_PREFETCH:
+        user_turns = [turn["content"] for turn in conversation_slice if turn["role"] == "user"]
+        data_types = detect_data_types(user_turns[-1]) if user_turns else []
+        if data_types:
+            with span("fhir_prefetch"):
+                prefetched, block = build_prefetch_block(
+                    data_types, fetch=get_patient_data, max_chars=FHIR_PREFETCH_MAX_CHARS
+                )
+            conversation_text += block
+
+    tool_calls = []
+    charts = []
+    with span("run_gemini_conversation"):
+        if stream is None:
+            final_text = get_runtime().run(
+                run_gemini_conversation(
+                    system_prompt, conversation_text, tool_calls=tool_calls, charts=charts
+                )
+            )
+        else:
+            future = get_runtime().submit(
+                run_gemini_conversation(system_prompt, conversation_text, stream, tool_calls, charts)
+            )
+            future.add_done_callback(lambda _: stream.finish())
+            stream.wait_for_first_message()
+            final_text = future.result()
+    record_prefetch_outcome(prefetched, tool_calls)
 
     # --- Parse the text response ---
     json_pattern = r"```json\s*(.*?)\s*```"
@@ -549,9 +808,37 @@ def call_gemini(conversation_slice, context_data: Dict[str, Any] = None):
                 response_data = {"text": "Error: Invalid quick reply format"}
                 return response_data
 
+    # {{GRAPH_URL}}-style placeholders get the charts code execution printed
+    # (or are dropped), whichever way the reply is delivered
+    if isinstance(response_data, dict):
+        response_data = fill_chart_placeholders(response_data, charts)
     return response_data
 
 
+# Button/quick-reply answers depend only on the payload, a small patient
+# summary and the prompt, so identical clicks reuse the generated response
+PAYLOAD_CACHE = env_flag("PAYLOAD_CACHE", False)
+payload_response_cache = TTLCache(
+    max_size=env_int("PAYLOAD_CACHE_MAX_SIZE", 512),
+    ttl=env_float("PAYLOAD_CACHE_TTL", 3600.0),
+)
+PAYLOAD_CACHE_LOOKUPS = counter(
+    "rcsbot_payload_cache_lookups_total", "Payload response cache lookups", ("result",)
+)
+
+
+@on_patient_data_change
+def invalidate_payload_cache(changed_keys=None) -> None:
+    """Drop every cached payload response (patient data changed)."""
+    payload_response_cache.clear()
+    logger.info("Payload response cache invalidated")
+
+
+def payload_cache_key(payload: str, patient_data_summary: str) -> tuple:
+    summary_hash = hashlib.sha256(patient_data_summary.encode("utf-8")).hexdigest()
+    return payload, summary_hash, PROMPT_VERSION
+
+
 def process_payload_response(
     payload: str, patient_data: Dict[str, Any] = None
 ) -> Dict[str, Any]:
@@ -596,9 +883,22 @@ def process_payload_response(
         ),
     }
 
+    if PAYLOAD_CACHE:
+        cache_key = payload_cache_key(payload, context_data["patient_data_summary"])
+        cached = payload_response_cache.get(cache_key)
+        PAYLOAD_CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+        if cached is not None:
+            logger.info(f"Payload response cache hit for {payload}")
+            # send_message rewrites media in place; never hand out the cached dict
+            return copy.deepcopy(cached)
+
     # Process with the LLM
     response = call_gemini(conversation, context_data)
 
+    # Don't cache failed generations
+    if PAYLOAD_CACHE and response and not str(response.get("text", "")).startswith("Error:"):
+        payload_response_cache.set(cache_key, copy.deepcopy(response))
+
     return response
 
 
@@ -0,0 +1,239 @@
+import copy
+import json
+import logging
+import queue
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+JSON_FENCE = "```json"
+
+# Sent with quick replies when nothing else is left for the follow-up message
+FOLLOW_UP_PROMPT = "What would you like to do next?"
+
+CONTENT_KEYS = ("text", "mediaUrl", "cards")
+
+
+def is_pending_media(url: Any) -> bool:
+    """True for chart placeholders such as {{GRAPH_URL}} that are filled in later."""
+    return isinstance(url, str) and "{{" in url
+
+
+class JsonFragmentScanner:
+    """
+    Incremental scanner for the model's ```json reply as text streams in.
+
+    It reports each top-level member once its value is complete, and each
+    element of the top-level "cards" array once that card's object closes,
+    without waiting for the rest of the document.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key: Optional[str] = None
+        self._value_start = None
+        self._card_start = None
+        self._card_index = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any, Any]]:
+        """
+        Add streamed text.
+
+        Returns:
+            Events completed by this chunk: ("member", key, value) and
+            ("card", index, card)
+        """
+        if self._done or not chunk:
+            return []
+        self._buffer += chunk
+        if not self._started:
+            fence = self._buffer.find(JSON_FENCE)
+            if fence == -1:
+                return []
+            brace = self._buffer.find("{", fence + len(JSON_FENCE))
+            if brace == -1:
+                return []
+            self._started = True
+            self._pos = brace
+
+        events = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self._done:
+            i = self._pos
+            char = buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._string_start is not None:
+                        self._key = json.loads(buffer[self._string_start:i + 1])
+                        self._string_start = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._string_start = i
+            elif char == ":" and self._depth == 1 and self._value_start is None:
+                self._value_start = i + 1
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 3 and char == "{" and self._key == "cards":
+                    self._card_start = i
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 2 and char == "}" and self._card_start is not None:
+                    card = self._load(buffer[self._card_start:i + 1])
+                    if card is not None:
+                        events.append(("card", self._card_index, card))
+                    self._card_index += 1
+                    self._card_start = None
+                elif self._depth == 0:
+                    self._finish_member(buffer[:i], events)
+                    self._done = True
+            elif char == "," and self._depth == 1:
+                self._finish_member(buffer[:i], events)
+        return events
+
+    def _finish_member(self, buffer: str, events: List[Tuple[str, Any, Any]]) -> None:
+        if self._key is not None and self._value_start is not None:
+            value = self._load(buffer[self._value_start:])
+            if value is not None:
+                events.append(("member", self._key, value))
+        self._key = None
+        self._value_start = None
+
+    @staticmethod
+    def _load(fragment: str) -> Any:
+        try:
+            return json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+
+
+class ReplyStream:
+    """
+    Progressive delivery of one model reply.
+
+    Model text is fed in as it streams. As soon as the top-level "text" or
+    the first card is complete it is queued as the first message, unless that
+    card is still waiting for a chart (then the reply goes out in one piece).
+    follow_up() builds the second message from whatever the first one did not
+    carry: the charts, remaining cards and quick replies.
+
+    feed() runs on the Gemini loop; the early message is handed to the
+    waiting request thread through wait_for_first_message().
+    """
+
+    def __init__(self, send: Callable[[Dict[str, Any]], Any]):
+        """
+        Args:
+            send: Sends one RCS message dict (its return value is kept as
+                first_result); called from the request thread
+        """
+        self.send = send
+        self.first_message_at: Optional[float] = None
+        self.first_message: Optional[Dict[str, Any]] = None
+        self.first_result: Any = None
+        self._scanner = JsonFragmentScanner()
+        self._early: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._queued = False
+
+    @property
+    def first_sent(self) -> bool:
+        return self.first_message is not None
+
+    def feed(self, text: str) -> None:
+        """Scan streamed model text for a complete first message."""
+        for kind, key, value in self._scanner.feed(text):
+            if self._queued:
+                return
+            if kind == "member" and key == "text" and isinstance(value, str) and value:
+                self._queue_first({"text": value})
+            elif kind == "card" and key == 0 and isinstance(value, dict):
+                # A card still waiting for its chart goes out with the full reply
+                if not is_pending_media(value.get("mediaUrl")):
+                    self._queue_first({"cards": [value]})
+
+    def finish(self) -> None:
+        """Mark generation as finished (wakes the request thread if nothing was queued)."""
+        self._early.put(None)
+
+    def wait_for_first_message(self) -> None:
+        """
+        Block until either an early message is ready (and send it) or the
+        whole reply has been generated.
+        """
+        message = self._early.get()
+        if message is None:
+            return
+        try:
+            self.first_result = self.send(copy.deepcopy(message))
+        except Exception as e:
+            # The full reply is sent in one piece instead
+            logger.error(f"Early message failed, sending full reply instead: {e}")
+            return
+        self.first_message = message
+        self.first_message_at = time.monotonic()
+
+    def follow_up(self, response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        The second message: everything the first message did not carry. The
+        response's chart placeholders are already filled by call_gemini.
+
+        Returns:
+            The message to send, or None if nothing is left
+        """
+        rest = copy.deepcopy(response)
+        if self.first_message is None:
+            return rest
+
+        if "cards" in self.first_message:
+            cards = (rest.get("cards") or [])[1:]
+            if cards:
+                rest["cards"] = cards
+            else:
+                rest.pop("cards", None)
+        else:
+            rest.pop("text", None)
+
+        if not any(rest.get(key) for key in CONTENT_KEYS):
+            if not rest.get("quickReplies"):
+                return None
+            rest["text"] = FOLLOW_UP_PROMPT
+        return rest
+
+    def _queue_first(self, message: Dict[str, Any]) -> None:
+        self._queued = True
+        self._early.put(message)
+
+
+def fill_chart_placeholders(response: Dict[str, Any], charts: List[str]) -> Dict[str, Any]:
+    """Replace chart placeholders in order with rendered charts; drop the rest."""
+    holders = [response] + [card for card in response.get("cards") or [] if isinstance(card, dict)]
+    for holder in holders:
+        if is_pending_media(holder.get("mediaUrl")):
+            if charts:
+                holder["mediaUrl"] = charts.pop(0)
+            else:
+                del holder["mediaUrl"]
+    if "cards" in response:
+        # A chart-only card whose chart never arrived has nothing left to show
+        response["cards"] = [card for card in response["cards"] if set(card) - {"title"}]
+        if not response["cards"]:
+            del response["cards"]
+    return response
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from typing import Any, List, Optional
+
+from google.genai import types
+
+from gemini_runtime import get_runtime
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class PromptCacheUnavailable(Exception):
+    """Cached content could not be created; callers should send the prompt inline."""
+
+
+class PromptCache:
+    """
+    Keeps the system prompt (and tool declarations) registered as Gemini
+    cached content, so requests can refer to it by name instead of resending
+    and re-tokenizing it.
+
+    The cache is named after the prompt version, so workers share one entry
+    and a prompt change creates a new one. Its TTL is extended as it nears
+    expiry. Methods must be awaited on the Gemini runtime loop.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        system_prompt: str,
+        version: str,
+        tools: List[types.Tool],
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        retry_after: float = 300.0,
+    ):
+        """
+        Args:
+            model: Model the cache is created for (must match requests)
+            system_prompt: Prompt to cache as the system instruction
+            version: Prompt hash, used in the cache display name
+            tools: Tool declarations (they must live in the cache too)
+            ttl: Cache lifetime in seconds
+            refresh_margin: Extend the TTL when less than this remains
+            retry_after: Seconds to wait before retrying after a failed create
+        """
+        self.model = model
+        self.system_prompt = system_prompt
+        self.version = version
+        self.tools = tools
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.display_name = f"slothmd-{version}"
+
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._unavailable_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_name(self) -> str:
+        """Return the cached content name, creating or refreshing it as needed."""
+        if self._name and time.time() < self._expires_at - self.refresh_margin:
+            return self._name
+
+        async with self._lock:
+            now = time.time()
+            if self._name and now < self._expires_at - self.refresh_margin:
+                return self._name
+            if now < self._unavailable_until:
+                raise PromptCacheUnavailable("prompt cache creation recently failed")
+
+            client = get_runtime().client
+            try:
+                if self._name:
+                    cached = await client.aio.caches.update(
+                        name=self._name,
+                        config=types.UpdateCachedContentConfig(ttl=f"{int(self.ttl)}s"),
+                    )
+                else:
+                    cached = await self._find_existing(client) or await self._create(client)
+            except Exception as e:
+                self._name = None
+                self._unavailable_until = now + self.retry_after
+                raise PromptCacheUnavailable(str(e)) from e
+
+            self._name = cached.name
+            self._expires_at = (
+                cached.expire_time.timestamp() if cached.expire_time else now + self.ttl
+            )
+            return self._name
+
+    async def delete(self) -> None:
+        async with self._lock:
+            if self._name:
+                await get_runtime().client.aio.caches.delete(name=self._name)
+                self._name = None
+
+    async def _find_existing(self, client: Any) -> Optional[types.CachedContent]:
+        # Another worker may already have cached this prompt version
+        pager = await client.aio.caches.list()
+        async for cached in pager:
+            if (
+                cached.display_name == self.display_name
+                and cached.model
+                and cached.model.endswith(self.model)
+                and cached.expire_time
+                and cached.expire_time.timestamp() > time.time() + self.refresh_margin
+            ):
+                logger.info(f"Reusing cached prompt {cached.name} ({self.display_name})")
+                return cached
+        return None
+
+    async def _create(self, client: Any) -> types.CachedContent:
+        cached = await client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                display_name=self.display_name,
+                system_instruction=self.system_prompt,
+                tools=self.tools,
+                ttl=f"{int(self.ttl)}s",
+            ),
+        )
+        logger.info(f"Created cached prompt {cached.name} ({self.display_name})")
+        return cached
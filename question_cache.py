@@ -0,0 +1,284 @@
+import copy
+import hashlib
+import random
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+from metrics import counter
+from ttl_cache import TTLCache
+
+STOPWORDS = frozenset(
+    """
+    a about am an and are as at be can could current do does for from give
+    have how i is it just latest level levels me my number numbers of on or
+    please recent result results see show tell that the their them there
+    this to u up value values view was what whats when where which with would
+    you your
+    """.split()
+)
+
+# Words that ask for the same thing
+SYNONYMS = {
+    "graph": "chart",
+    "plot": "chart",
+    "visualize": "chart",
+    "visualise": "chart",
+    "trend": "chart",
+    "a1c": "hba1c",
+    "bp": "blood_pressure",
+    "meds": "medication",
+    "med": "medication",
+    "medicine": "medication",
+    "labs": "lab",
+    "vitals": "vital",
+    "sugar": "glucose",
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+QUESTION_CACHE_LOOKUPS = counter(
+    "rcsbot_question_cache_lookups_total", "Near-duplicate question cache lookups", ("result",)
+)
+QUESTION_CACHE_AUDITS = counter(
+    "rcsbot_question_cache_audits_total",
+    "Audited question cache hits compared against a fresh LLM answer",
+    ("outcome",),
+)
+
+
+def normalize_question(text: str) -> FrozenSet[str]:
+    """Lowercase, drop punctuation and stopwords, map synonyms, strip plurals."""
+    text = text.lower().replace("'", "")
+    tokens = set()
+    for token in _TOKEN_PATTERN.findall(text):
+        if token in STOPWORDS:
+            continue
+        token = SYNONYMS.get(token, token)
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = SYNONYMS.get(token[:-1], token[:-1])
+        tokens.add(token)
+    return frozenset(tokens)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def response_tokens(response: Dict[str, Any]) -> FrozenSet[str]:
+    """Normalized words from every string in an RCS response (for audits)."""
+    words: List[str] = []
+
+    def collect(value: Any) -> None:
+        if isinstance(value, str):
+            if not value.startswith(("data:", "http")):
+                words.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    collect(response)
+    return normalize_question(" ".join(words))
+
+
+class MinHasher:
+    """MinHash signatures over token sets, with LSH band keys for lookup."""
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._perms = [
+            (rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(num_perm)
+        ]
+
+    def signature(self, tokens: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big")
+            for t in tokens
+        ] or [0]
+        return tuple(min((a * h + b) % self._PRIME for h in hashes) for a, b in self._perms)
+
+    def band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+
+class _Entry:
+    def __init__(self, tokens: FrozenSet[str], signature: Tuple[int, ...], response: Dict[str, Any]):
+        self.tokens = tokens
+        self.signature = signature
+        self.response = response
+
+
+class _ScopeIndex:
+    """Recent answers for one scope, with an LSH index over their signatures."""
+
+    def __init__(self, max_entries: int, hasher: MinHasher):
+        self.max_entries = max_entries
+        self.hasher = hasher
+        self.entries: "OrderedDict[FrozenSet[str], _Entry]" = OrderedDict()
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], set] = defaultdict(set)
+
+    def find(self, tokens: FrozenSet[str], threshold: float) -> Tuple[Optional[_Entry], float]:
+        entry = self.entries.get(tokens)
+        if entry is not None:
+            self.entries.move_to_end(tokens)
+            return entry, 1.0
+
+        signature = self.hasher.signature(tokens)
+        candidates = set()
+        for key in self.hasher.band_keys(signature):
+            candidates |= self.buckets.get(key, set())
+
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            score = jaccard(tokens, candidate)
+            if score > best_score:
+                best, best_score = self.entries[candidate], score
+        if best is not None and best_score >= threshold:
+            self.entries.move_to_end(best.tokens)
+            return best, best_score
+        return None, best_score
+
+    def add(self, tokens: FrozenSet[str], response: Dict[str, Any]) -> None:
+        if tokens in self.entries:
+            self._remove(tokens)
+        signature = self.hasher.signature(tokens)
+        self.entries[tokens] = _Entry(tokens, signature, response)
+        for key in self.hasher.band_keys(signature):
+            self.buckets[key].add(tokens)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, tokens: FrozenSet[str]) -> None:
+        entry = self.entries.pop(tokens)
+        for key in self.hasher.band_keys(entry.signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(tokens)
+                if not bucket:
+                    del self.buckets[key]
+
+
+class QuestionCache:
+    """
+    Serves recent RCS responses to near-identical free-text questions.
+
+    Questions are normalized into token sets. Within a scope (for example
+    phone number + patient-data version + prompt version), MinHash/LSH finds
+    previously answered questions and the closest one is reused if its
+    Jaccard similarity reaches the threshold. A sample of hits can be audited
+    against a fresh answer to measure false hits.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_scopes: int = 1000,
+        max_entries_per_scope: int = 50,
+        ttl: float = 3600.0,
+        audit_rate: float = 0.0,
+        audit_threshold: float = 0.5,
+    ):
+        """
+        Args:
+            threshold: Minimum Jaccard similarity of normalized questions for a hit
+            max_scopes: Scopes (e.g. users) kept, least recently used evicted
+            max_entries_per_scope: Answers kept per scope
+            ttl: Seconds a scope's answers are kept after its last update
+            audit_rate: Fraction of hits to verify against a fresh answer
+            audit_threshold: Response similarity below which an audit counts as a false hit
+        """
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.audit_rate = audit_rate
+        self.audit_threshold = audit_threshold
+        self.hasher = MinHasher()
+        self._scopes = TTLCache(max_size=max_scopes, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.audits = 0
+        self.false_hits = 0
+
+    def lookup(self, scope: Hashable, question: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached response for a similar question, or None."""
+        tokens = normalize_question(question)
+        entry = None
+        if tokens:
+            with self._lock:
+                index = self._scopes.get(scope)
+                if index is not None:
+                    entry, _ = index.find(tokens, self.threshold)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        QUESTION_CACHE_LOOKUPS.inc(result="miss" if entry is None else "hit")
+        return copy.deepcopy(entry.response) if entry is not None else None
+
+    def store(self, scope: Hashable, question: str, response: Dict[str, Any]) -> None:
+        """Remember the response generated for a question."""
+        tokens = normalize_question(question)
+        if not tokens or not response:
+            return
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                index = _ScopeIndex(self.max_entries_per_scope, self.hasher)
+            index.add(tokens, copy.deepcopy(response))
+            # Re-set so the scope's TTL restarts from this update
+            self._scopes.set(scope, index)
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record_audit(
+        self, cached_response: Dict[str, Any], fresh_response: Dict[str, Any]
+    ) -> bool:
+        """
+        Compare a served cached response with a freshly generated one.
+
+        Returns:
+            True if they agree, False if the hit is counted as a false hit
+        """
+        similarity = jaccard(response_tokens(cached_response), response_tokens(fresh_response))
+        agreed = similarity >= self.audit_threshold
+        with self._lock:
+            self.audits += 1
+            if not agreed:
+                self.false_hits += 1
+        QUESTION_CACHE_AUDITS.inc(outcome="match" if agreed else "false_hit")
+        return agreed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "scopes": len(self._scopes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "audits": self.audits,
+                "false_hits": self.false_hits,
+                "false_hit_rate": round(self.false_hits / self.audits, 4) if self.audits else 0.0,
+            }
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import env_float
+from metrics import gauge, histogram
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CHANNELS = ("rcs", "mms", "sms")
+
+SEND_WAIT = histogram(
+    "rcsbot_send_rate_limit_wait_seconds",
+    "Time outbound sends waited on the rate limiter",
+    ("channel",),
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+SEND_WAITING = gauge(
+    "rcsbot_send_rate_limit_waiting", "Outbound sends currently waiting on the rate limiter", ("channel",)
+)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `burst`.
+
+    reserve() always succeeds: it takes a token now, letting the balance go
+    negative, and returns how long the caller must wait for that token. Callers
+    are therefore served in arrival order and the long-run rate never exceeds
+    `rate`.
+    """
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens and return the seconds to wait before using them."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+
+class SendRateLimiter:
+    """
+    Client-side limiter for outbound messages: one token bucket per channel
+    (RCS, MMS, SMS) plus a global bucket shared by all channels. A rate of 0
+    disables that bucket.
+    """
+
+    def __init__(
+        self,
+        channel_rates: Dict[str, float],
+        global_rate: float = 0.0,
+        burst_seconds: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            channel_rates: Messages per second allowed per channel
+            global_rate: Messages per second across all channels
+            burst_seconds: Bucket size expressed as seconds of traffic at full rate
+            sleep: Used to wait (overridable for testing)
+            clock: Time source for refilling the buckets (overridable for testing)
+        """
+        self.sleep = sleep
+        self._channel_buckets = {
+            channel: TokenBucket(rate, rate * burst_seconds, clock)
+            for channel, rate in channel_rates.items()
+            if rate > 0
+        }
+        self._global_bucket = (
+            TokenBucket(global_rate, global_rate * burst_seconds, clock) if global_rate > 0 else None
+        )
+        self.channel_rates = dict(channel_rates)
+        self.global_rate = global_rate
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._channel_buckets) or self._global_bucket is not None
+
+    def acquire(self, channel: str) -> float:
+        """
+        Block until a message may be sent on the channel.
+
+        Returns:
+            Seconds waited
+        """
+        waited = 0.0
+        SEND_WAITING.inc(channel=channel)
+        try:
+            # Channel first, then global: the global token is only taken once
+            # the message is actually about to go out
+            for bucket in (self._channel_buckets.get(channel), self._global_bucket):
+                if bucket is None:
+                    continue
+                wait = bucket.reserve()
+                if wait > 0:
+                    self.sleep(wait)
+                    waited += wait
+        finally:
+            SEND_WAITING.dec(channel=channel)
+        SEND_WAIT.observe(waited, channel=channel)
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channel_rates": self.channel_rates,
+            "global_rate": self.global_rate,
+        }
+
+
+def create_send_rate_limiter() -> Optional[SendRateLimiter]:
+    """
+    Build the limiter from SEND_RATE_RCS / SEND_RATE_MMS / SEND_RATE_SMS,
+    SEND_RATE_GLOBAL (messages per second, 0 = unlimited) and
+    SEND_RATE_BURST_SECONDS. Returns None when every rate is unlimited.
+    """
+    limiter = SendRateLimiter(
+        channel_rates={
+            channel: env_float(f"SEND_RATE_{channel.upper()}", 0.0) for channel in CHANNELS
+        },
+        global_rate=env_float("SEND_RATE_GLOBAL", 0.0),
+        burst_seconds=env_float("SEND_RATE_BURST_SECONDS", 1.0),
+    )
+    if not limiter.enabled:
+        return None
+    logger.info(f"Outbound send rate limits: {limiter.stats()}")
+    return limiter
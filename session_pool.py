@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class PooledSession:
+    """A connected Live session plus the bookkeeping the pool needs."""
+
+    def __init__(self, session: Any, connection: Any):
+        self.session = session
+        self.connection = connection  # async context manager that owns the session
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.healthy = True
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def idle_time(self) -> float:
+        return time.monotonic() - self.last_used
+
+
+class LiveSessionPool:
+    """
+    Pool of pre-connected Gemini Live sessions that already hold the system prompt.
+
+    Each warm session has been sent the system prompt without ending the turn,
+    so a request only has to send the user's turn. A session is leased for one
+    conversation and then closed and replaced in the background: it carries
+    that user's turns and must not be handed to anyone else.
+
+    All methods must run on the same event loop (the GeminiRuntime loop).
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        system_prompt: str,
+        min_size: int = 2,
+        max_size: int = 8,
+        idle_ttl: float = 300.0,
+        max_age: float = 540.0,
+        acquire_timeout: float = 10.0,
+        maintenance_interval: float = 15.0,
+    ):
+        """
+        Args:
+            connect: Zero-argument callable returning an async context manager
+                that yields a Live session (e.g. client.aio.live.connect(...))
+            system_prompt: Prompt preloaded into every warm session
+            min_size: Number of warm sessions kept ready
+            max_size: Upper bound on open sessions (warm + leased + connecting)
+            idle_ttl: Seconds a warm session may sit unused before it is refreshed
+            max_age: Seconds after which a session is considered stale
+            acquire_timeout: Seconds to wait for a session when the pool is exhausted
+            maintenance_interval: Seconds between idle eviction / top-up passes
+        """
+        self.connect = connect
+        self.system_prompt = system_prompt
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_age = max_age
+        self.acquire_timeout = acquire_timeout
+        self.maintenance_interval = maintenance_interval
+
+        self._idle: List[PooledSession] = []
+        self._leased = 0
+        self._connecting = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+        # Background close / top-up tasks; the loop only keeps weak references
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+        self._stats = {
+            "leases": 0,
+            "warm_hits": 0,
+            "cold_connects": 0,
+            "evicted_idle": 0,
+            "evicted_unhealthy": 0,
+            "connect_errors": 0,
+        }
+
+    async def start(self) -> None:
+        """Warm the pool up to min_size and start the maintenance task."""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintain())
+        await self._top_up()
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[Any]:
+        """
+        Lease a warm session for a single conversation.
+
+        The session is closed afterwards and a replacement is connected in the
+        background. If the caller raises, the session is discarded the same way.
+        """
+        if self._condition is None:
+            await self.start()
+
+        pooled = await self._acquire()
+        self._stats["leases"] += 1
+        try:
+            yield pooled.session
+        except Exception:
+            pooled.healthy = False
+            raise
+        finally:
+            async with self._condition:
+                self._leased -= 1
+                self._condition.notify()
+            self._spawn(self._close(pooled))
+            self._spawn(self._top_up())
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool size and lease counters."""
+        return {
+            "idle": len(self._idle),
+            "leased": self._leased,
+            "connecting": self._connecting,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            **self._stats,
+        }
+
+    async def close(self) -> None:
+        """Close all warm sessions and stop maintenance."""
+        self._closed = True
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await self._close(pooled)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _is_healthy(self, pooled: PooledSession) -> bool:
+        return (
+            pooled.healthy
+            and pooled.age() < self.max_age
+            and pooled.idle_time() < self.idle_ttl
+        )
+
+    def _open_count(self) -> int:
+        return len(self._idle) + self._leased + self._connecting
+
+    async def _acquire(self) -> PooledSession:
+        deadline = time.monotonic() + self.acquire_timeout
+        async with self._condition:
+            while True:
+                # Prefer the most recently warmed session
+                while self._idle:
+                    pooled = self._idle.pop()
+                    if self._is_healthy(pooled):
+                        self._leased += 1
+                        self._stats["warm_hits"] += 1
+                        pooled.last_used = time.monotonic()
+                        return pooled
+                    self._stats["evicted_unhealthy"] += 1
+                    self._spawn(self._close(pooled))
+
+                if self._open_count() < self.max_size:
+                    self._connecting += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No Live session available within {self.acquire_timeout}s"
+                    )
+                try:
+                    await asyncio.wait_for(self._condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+        # Nothing warm: connect one now (outside the lock)
+        self._stats["cold_connects"] += 1
+        try:
+            pooled = await self._open()
+        except Exception:
+            async with self._condition:
+                self._connecting -= 1
+                self._condition.notify()
+            raise
+        async with self._condition:
+            self._connecting -= 1
+            self._leased += 1
+        return pooled
+
+    async def _open(self) -> PooledSession:
+        connection = self.connect()
+        session = await connection.__aenter__()
+        pooled = PooledSession(session, connection)
+        try:
+            # Preload the system prompt without ending the turn
+            await session.send(input=self.system_prompt, end_of_turn=False)
+        except Exception:
+            await self._close(pooled)
+            raise
+        return pooled
+
+    async def _close(self, pooled: PooledSession) -> None:
+        try:
+            await pooled.connection.__aexit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"Error closing Live session: {e}")
+
+    async def _top_up(self) -> None:
+        """Connect warm sessions until min_size are idle (bounded by max_size)."""
+        if self._closed:
+            return
+        async with self._condition:
+            needed = min(
+                self.min_size - len(self._idle) - self._connecting,
+                self.max_size - self._open_count(),
+            )
+            if needed <= 0:
+                return
+            self._connecting += needed
+        await asyncio.gather(*(self._warm_one() for _ in range(needed)))
+
+    async def _warm_one(self) -> None:
+        try:
+            pooled = await self._open()
+        except Exception as e:
+            self._stats["connect_errors"] += 1
+            logger.error(f"Failed to warm Live session: {e}")
+            async with self._condition:
+                self._connecting -= 1
+                self._condition.notify()
+            return
+        async with self._condition:
+            self._connecting -= 1
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    async def _maintain(self) -> None:
+        """Periodically evict idle/stale sessions and keep the pool topped up."""
+        while not self._closed:
+            await asyncio.sleep(self.maintenance_interval)
+            async with self._condition:
+                keep = []
+                for pooled in self._idle:
+                    if self._is_healthy(pooled):
+                        keep.append(pooled)
+                    else:
+                        self._stats["evicted_idle"] += 1
+                        self._spawn(self._close(pooled))
+                self._idle = keep
+            await self._top_up()
@@ -0,0 +1,236 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker is about to act on a user whose shard it no longer holds."""
+
+
+def shard_for(phone_number: str, num_shards: int) -> int:
+    """Stable shard for a phone number (same on every process and host)."""
+    digest = hashlib.sha1(phone_number.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+class ShardLeaseManager:
+    """
+    Time-bounded leases on user shards, kept in a SQLite database that every
+    worker can open (WAL mode).
+
+    Each worker heartbeats in the background: it registers itself as live,
+    renews the shards it holds, gives back shards above its fair share
+    (shards / live workers) and claims free or expired ones. A worker that
+    dies stops renewing and its shards are picked up once the lease expires.
+    Surplus shards are only given back once no run is in flight (see
+    hold_shards), so a run is not cut off halfway through a shard.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        num_shards: int,
+        lease_seconds: float = 120.0,
+        owner: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            db_path: SQLite file shared by all workers
+            num_shards: Number of phone-number hash shards
+            lease_seconds: How long a lease lasts without renewal
+            owner: Unique worker ID (defaults to hostname:pid)
+            clock: Wall-clock time source, shared by every worker on the database
+        """
+        self.db_path = db_path
+        self.num_shards = num_shards
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.clock = clock
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._held: List[int] = []
+        # Stop trusting our leases a little before they actually expire
+        self._valid_until = 0.0
+        self._runs = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shard_leases ("
+            "shard INTEGER PRIMARY KEY, owner TEXT, expires_at REAL NOT NULL DEFAULT 0)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shard_workers ("
+            "owner TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO shard_leases (shard) VALUES (?)",
+            [(shard,) for shard in range(num_shards)],
+        )
+
+    def shard_of(self, phone_number: str) -> int:
+        return shard_for(phone_number, self.num_shards)
+
+    def holds(self, shard: int) -> bool:
+        """Whether this worker currently holds a valid lease on the shard."""
+        with self._lock:
+            return self.clock() < self._valid_until and shard in self._held
+
+    def owns_user(self, phone_number: str) -> bool:
+        return self.holds(self.shard_of(phone_number))
+
+    def held_shards(self) -> List[int]:
+        with self._lock:
+            return list(self._held) if self.clock() < self._valid_until else []
+
+    @contextmanager
+    def hold_shards(self) -> Iterator[None]:
+        """
+        Keep every shard held now, surplus included, renewed until the block
+        exits; rebalancing resumes at the next heartbeat after that.
+        """
+        with self._lock:
+            self._runs += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._runs -= 1
+
+    def heartbeat(self) -> List[int]:
+        """Renew, rebalance and claim leases. Returns the shards now held."""
+        now = self.clock()
+        with self._lock:
+            in_run = self._runs > 0
+        expires_at = now + self.lease_seconds
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO shard_workers (owner, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET expires_at = excluded.expires_at",
+                (self.owner, expires_at),
+            )
+            conn.execute("DELETE FROM shard_workers WHERE expires_at < ?", (now,))
+            live_workers = conn.execute("SELECT COUNT(*) FROM shard_workers").fetchone()[0]
+            fair_share = math.ceil(self.num_shards / max(live_workers, 1))
+
+            held = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT shard FROM shard_leases "
+                    "WHERE owner = ? AND expires_at >= ? AND shard < ? ORDER BY shard",
+                    (self.owner, now, self.num_shards),
+                )
+            ]
+            surplus = [] if in_run else held[fair_share:]
+            if surplus:
+                held = held[:fair_share]
+                conn.executemany(
+                    "UPDATE shard_leases SET owner = NULL, expires_at = 0 "
+                    "WHERE shard = ? AND owner = ?",
+                    [(shard, self.owner) for shard in surplus],
+                )
+
+            if len(held) < fair_share:
+                free = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT shard FROM shard_leases "
+                        "WHERE (owner IS NULL OR expires_at < ?) AND shard < ? "
+                        "ORDER BY RANDOM() LIMIT ?",
+                        (now, self.num_shards, fair_share - len(held)),
+                    )
+                ]
+                held.extend(free)
+
+            conn.executemany(
+                "UPDATE shard_leases SET owner = ?, expires_at = ? WHERE shard = ?",
+                [(self.owner, expires_at, shard) for shard in held],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        held.sort()
+        with self._lock:
+            changed = held != self._held
+            self._held = held
+            self._valid_until = expires_at - self.lease_seconds / 4
+        if changed:
+            logger.info(
+                f"Worker {self.owner} holds {len(held)}/{self.num_shards} shards "
+                f"({live_workers} live workers)"
+            )
+        return held
+
+    def release(self) -> None:
+        """Give up all leases and deregister this worker."""
+        with self._lock:
+            self._held = []
+            self._valid_until = 0.0
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE shard_leases SET owner = NULL, expires_at = 0 WHERE owner = ?",
+                (self.owner,),
+            )
+            conn.execute("DELETE FROM shard_workers WHERE owner = ?", (self.owner,))
+
+    def start(self) -> None:
+        """Take initial leases and keep them renewed in a background thread."""
+        if self._thread is not None:
+            return
+        self.heartbeat()
+        self._thread = threading.Thread(
+            target=self._heartbeat_loop, name="shard-leases", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        self._stop.set()
+        try:
+            self.release()
+        except Exception as e:
+            logger.error(f"Failed to release shard leases: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        held = self.held_shards()
+        return {
+            "owner": self.owner,
+            "num_shards": self.num_shards,
+            "lease_seconds": self.lease_seconds,
+            "held_shards": held,
+        }
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; autocommit so BEGIN IMMEDIATE is explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Shard lease heartbeat failed: {e}")
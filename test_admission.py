@@ -0,0 +1,106 @@
+import os
+
+os.environ.setdefault("PINNACLE_FAKE", "true")
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import main  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from job_queue import QueueFullError  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def test_try_admit_refuses_beyond_in_flight_plus_queue():
+    admission = AdmissionController(max_in_flight=2, max_queue=1, latency_budget=1000.0)
+    tickets = [admission.try_admit() for _ in range(3)]
+    assert all(ticket is not None for ticket in tickets)
+    assert admission.try_admit() is None
+
+    tickets[0].finish()
+    assert admission.try_admit() is not None
+    stats = admission.stats()
+    assert stats["admitted"] == 4 and stats["rejected"] == 1
+
+
+def test_try_admit_refuses_work_that_cannot_finish_within_the_budget():
+    admission = AdmissionController(
+        max_in_flight=2, max_queue=10, latency_budget=10.0, initial_service_time=4.0
+    )
+    # Two waves of 4s fit in the budget, a third does not
+    tickets = [admission.try_admit() for _ in range(4)]
+    assert all(ticket is not None for ticket in tickets)
+    assert admission.try_admit() is None
+
+
+def test_retry_after_grows_with_the_backlog():
+    admission = AdmissionController(
+        max_in_flight=2, max_queue=10, latency_budget=1000.0, initial_service_time=3.0
+    )
+    assert admission.retry_after() == 3
+    for _ in range(6):
+        admission.try_admit()
+    # Four jobs queued behind two slots: two more waves before a retry can run
+    assert admission.retry_after() == 9
+
+
+def test_service_time_estimate_follows_completed_jobs():
+    admission = AdmissionController(max_in_flight=1, initial_service_time=10.0)
+    with admission.try_admit():
+        pass
+    assert admission.stats()["avg_service_seconds"] < 10.0
+    assert admission.stats()["running"] == 0 and admission.stats()["waiting"] == 0
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    admission = AdmissionController(max_in_flight=1, max_queue=0, initial_service_time=7.0)
+    held = admission.try_admit()
+    monkeypatch.setattr(main, "admission", admission)
+    yield admission
+    held.finish()
+
+
+def test_webhook_is_shed_with_503_and_retry_after(saturated):
+    client = main.app.test_client()
+    event = {"from": "+15550000001", "text": "hi", "messageId": "shed-503"}
+
+    response = client.post("/webhook", json=event)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert response.get_json()["retry_after"] == 7
+
+    # The shed event was forgotten, so Pinnacle's redelivery is not a duplicate
+    response = client.post("/webhook", json=event)
+    assert response.status_code == 503
+
+
+def test_full_webhook_queue_is_shed_with_503(monkeypatch):
+    def full(*args, **kwargs):
+        raise QueueFullError("full")
+
+    monkeypatch.setattr(main.webhook_queue, "submit", full)
+    response = main.app.test_client().post(
+        "/webhook", json={"from": "+15550000001", "text": "hi", "messageId": "queue-full"}
+    )
+    assert response.status_code == 503
+    assert main.admission.stats()["running"] + main.admission.stats()["waiting"] == 0
+
+
+def test_trigger_intervention_is_shed_with_503(saturated):
+    response = main.app.test_client().post(
+        "/trigger-intervention", json={"phone_number": "+15550000001"}
+    )
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_sms_overload_mode_asks_the_sender_to_resend(saturated, monkeypatch):
+    monkeypatch.setattr(main, "ADMISSION_OVERLOAD_MODE", "sms")
+    sent_before = main.pinnacle_client.sent_count
+
+    response = main.app.test_client().post(
+        "/webhook", json={"from": "+15550000001", "text": "hi", "messageId": "shed-sms"}
+    )
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "shed"
+    assert main.pinnacle_client.sent_count == sent_before + 1
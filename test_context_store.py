@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from context_store import SQLiteContextStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "contexts.db")
+
+
+def test_write_through_is_visible_to_other_instances(db_path):
+    ours = SQLiteContextStore(db_path)
+    theirs = SQLiteContextStore(db_path)
+
+    ours.set("+15550000001", {"location": "home"})
+    assert theirs.get("+15550000001") == {"location": "home"}
+    assert len(theirs) == 1
+    assert list(theirs.items()) == [("+15550000001", {"location": "home"})]
+
+
+def test_write_behind_buffers_until_flush(db_path):
+    # A long interval keeps the background flusher out of the way
+    ours = SQLiteContextStore(db_path, write_behind_interval=3600.0)
+    theirs = SQLiteContextStore(db_path)
+
+    ours.set("+15550000001", {"location": "home"})
+    assert ours.get("+15550000001") == {"location": "home"}
+    assert theirs.get("+15550000001") is None
+
+    ours.flush()
+    assert theirs.get("+15550000001") == {"location": "home"}
+    ours.close()
+
+
+def test_failed_flush_keeps_pending_contexts_and_retries_them(db_path, monkeypatch):
+    ours = SQLiteContextStore(db_path, write_behind_interval=3600.0)
+    theirs = SQLiteContextStore(db_path)
+    ours.set("+15550000001", {"location": "home"})
+    ours.set("+15550000002", {"location": "work"})
+
+    write = ours._write
+
+    def failing_write(batch):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(ours, "_write", failing_write)
+    with pytest.raises(sqlite3.OperationalError):
+        ours.flush()
+
+    # Nothing was lost: the contexts are still served and still pending
+    assert ours.get("+15550000001") == {"location": "home"}
+    assert theirs.get("+15550000001") is None
+
+    monkeypatch.setattr(ours, "_write", write)
+    ours.flush()
+    assert theirs.get("+15550000001") == {"location": "home"}
+    assert theirs.get("+15550000002") == {"location": "work"}
+    assert ours._pending == {}
+    ours.close()
+
+
+def test_context_set_during_a_flush_stays_pending(db_path, monkeypatch):
+    ours = SQLiteContextStore(db_path, write_behind_interval=3600.0)
+    theirs = SQLiteContextStore(db_path)
+    ours.set("+15550000001", {"location": "home"})
+
+    write = ours._write
+
+    def write_then_update(batch):
+        write(batch)
+        ours.set("+15550000001", {"location": "gym"})
+
+    monkeypatch.setattr(ours, "_write", write_then_update)
+    ours.flush()
+    assert theirs.get("+15550000001") == {"location": "home"}
+    assert ours.get("+15550000001") == {"location": "gym"}
+
+    monkeypatch.setattr(ours, "_write", write)
+    ours.flush()
+    assert theirs.get("+15550000001") == {"location": "gym"}
+    ours.close()
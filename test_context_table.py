@@ -0,0 +1,44 @@
+from context_store import SQLiteContextStore
+from context_table import ContextTable
+
+
+def context(last_meal):
+    return {"last_interaction": "2024-01-01T08:00:00", "last_meal": last_meal}
+
+
+def test_refresh_only_applies_rows_written_since_the_last_sync(tmp_path):
+    path = str(tmp_path / "contexts.db")
+    ours = SQLiteContextStore(path)
+    theirs = SQLiteContextStore(path)
+    ours.set("+15550000001", context(1))
+    ours.set("+15550000002", context(2))
+
+    table = ContextTable(seed=1)
+    assert table.refresh(ours.items_updated_since(table.synced_until)) == 2
+    synced_until = table.synced_until
+    assert synced_until > 0
+
+    # Another worker updates one user and adds one
+    theirs.set("+15550000002", context(5))
+    theirs.set("+15550000003", context(3))
+    updates = list(ours.items_updated_since(table.synced_until))
+    assert {"+15550000002", "+15550000003"} <= {phone for phone, _, _ in updates}
+
+    table.refresh(updates)
+    assert table.synced_until >= synced_until
+    assert table.phone_numbers == ["+15550000001", "+15550000002", "+15550000003"]
+    assert table.last_meal[1] == 5
+
+
+def test_plan_returns_the_phone_numbers_its_mask_covers():
+    table = ContextTable(seed=1)
+    for n in range(10):
+        table.upsert(f"+1555000000{n}", context(n))
+
+    mask, types, phone_numbers = table.plan(current_hour=12, now=1e10)
+    assert len(mask) == len(phone_numbers) == 10
+    assert len(types) == int(mask.sum())
+
+    # Later inserts don't change the snapshot a run is already iterating
+    table.upsert("+15550000010", context(1))
+    assert len(phone_numbers) == 10
@@ -0,0 +1,77 @@
+import time
+
+from dedup_store import DedupStore, webhook_dedup_key
+
+
+def test_repeated_key_is_a_duplicate_until_its_ttl_expires():
+    store = DedupStore(ttl=0.05)
+    assert store.check_and_add("id:1")
+    assert not store.check_and_add("id:1")
+
+    time.sleep(0.1)
+    assert store.check_and_add("id:1")
+
+
+def test_per_key_ttl_overrides_the_default():
+    store = DedupStore(ttl=3600.0)
+    assert store.check_and_add("hash:abc", ttl=0.05)
+    assert store.check_and_add("id:2")
+
+    time.sleep(0.1)
+    assert store.check_and_add("hash:abc")
+    assert not store.check_and_add("id:2")
+
+
+def test_duplicates_are_detected_across_instances_sharing_sqlite(tmp_path):
+    db_path = str(tmp_path / "dedup.db")
+    first = DedupStore(db_path=db_path)
+    second = DedupStore(db_path=db_path)
+
+    assert first.check_and_add("id:1")
+    # Not in second's memory tier, but already in the shared database
+    assert not second.check_and_add("id:1")
+    assert second.check_and_add("id:2")
+    assert not first.check_and_add("id:2")
+
+
+def test_expired_sqlite_entries_are_accepted_again(tmp_path):
+    db_path = str(tmp_path / "dedup.db")
+    first = DedupStore(db_path=db_path, ttl=0.05)
+    second = DedupStore(db_path=db_path, ttl=0.05)
+
+    assert first.check_and_add("id:1")
+    time.sleep(0.1)
+    assert second.check_and_add("id:1")
+
+
+def test_discard_lets_a_redelivery_through(tmp_path):
+    db_path = str(tmp_path / "dedup.db")
+    first = DedupStore(db_path=db_path)
+    second = DedupStore(db_path=db_path)
+    assert first.check_and_add("id:1")
+
+    first.discard("id:1")
+    assert second.check_and_add("id:1")
+    second.discard("id:1")
+    assert first.check_and_add("id:1")
+
+
+def test_stats_count_checks_and_duplicates():
+    store = DedupStore()
+    for key in ["id:1", "id:1", "id:2", "id:1"]:
+        store.check_and_add(key)
+
+    stats = store.stats()
+    assert stats["checked"] == 4
+    assert stats["duplicates_dropped"] == stats["llm_calls_saved"] == 2
+    assert stats["memory_size"] == 2
+    assert not stats["sqlite_backed"]
+
+
+def test_dedup_key_prefers_message_id_over_content():
+    event = {"from": "+15550000001", "text": "yes", "messageId": "abc"}
+    assert webhook_dedup_key(event) == "id:abc"
+
+    without_id = {"from": "+15550000001", "text": "yes"}
+    assert webhook_dedup_key(without_id).startswith("hash:")
+    assert webhook_dedup_key(without_id) != webhook_dedup_key({**without_id, "timestamp": "1"})
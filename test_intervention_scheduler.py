@@ -0,0 +1,107 @@
+import threading
+import time
+
+from intervention_scheduler import InterventionScheduler
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_scheduler(clock, on_due=None, **kwargs):
+    return InterventionScheduler(on_due=on_due or (lambda due: None), clock=clock, **kwargs)
+
+
+def test_pop_due_returns_due_users_in_time_order():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.schedule("+15550000003", 1003.0)
+    scheduler.schedule("+15550000001", 1001.0)
+    scheduler.schedule("+15550000002", 1002.0)
+    scheduler.schedule("+15550000009", 2000.0)
+
+    clock.now = 1003.0
+    assert scheduler.pop_due() == ["+15550000001", "+15550000002", "+15550000003"]
+    assert scheduler.pop_due() == []
+    assert scheduler.next_due("+15550000009") == 2000.0
+
+
+def test_pop_due_respects_batch_limit():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, batch_limit=2)
+    for n in range(5):
+        scheduler.schedule(f"+1555000000{n}", 1000.0 + n)
+
+    assert scheduler.pop_due(now=1010.0) == ["+15550000000", "+15550000001"]
+    assert scheduler.pop_due(now=1010.0) == ["+15550000002", "+15550000003"]
+    assert scheduler.pop_due(now=1010.0) == ["+15550000004"]
+
+
+def test_rescheduling_moves_a_user_and_skips_the_stale_entry():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.schedule("+15550000001", 1001.0)
+    scheduler.schedule("+15550000001", 1500.0)
+    scheduler.schedule("+15550000002", 1002.0)
+    scheduler.unschedule("+15550000002")
+
+    assert scheduler.pop_due(now=1100.0) == []
+    assert scheduler.stats()["scheduled_users"] == 1
+    assert scheduler.pop_due(now=1500.0) == ["+15550000001"]
+    assert scheduler.stats()["heap_entries"] == 0
+
+
+def test_stats_report_time_until_next_due_user():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    assert scheduler.stats()["next_due_in_seconds"] is None
+
+    scheduler.schedule("+15550000001", 1060.0)
+    assert scheduler.stats()["next_due_in_seconds"] == 60.0
+    clock.now = 1100.0
+    assert scheduler.stats()["next_due_in_seconds"] == 0.0
+
+
+def test_retry_reschedules_only_users_on_due_did_not_reschedule():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, retry_delay=300.0)
+    scheduler.schedule("+15550000001", 1000.0)
+    scheduler.schedule("+15550000002", 1000.0)
+    due = scheduler.pop_due()
+
+    # on_due got as far as rescheduling the first user before failing
+    scheduler.schedule("+15550000001", 4600.0)
+    scheduler._retry(due)
+
+    assert scheduler.next_due("+15550000001") == 4600.0
+    assert scheduler.next_due("+15550000002") == 1300.0
+    assert scheduler.stats()["retried"] == 1
+
+
+def test_failing_on_due_is_retried_by_the_scheduler_thread():
+    clock = FakeClock()
+    called = threading.Event()
+
+    def on_due(due):
+        called.set()
+        raise RuntimeError("context store unavailable")
+
+    scheduler = make_scheduler(clock, on_due=on_due, retry_delay=300.0)
+    scheduler.schedule("+15550000001", 1000.0)
+    scheduler.start()
+    try:
+        assert called.wait(5)
+        for _ in range(500):
+            if scheduler.stats()["retried"]:
+                break
+            time.sleep(0.01)
+    finally:
+        scheduler.stop()
+
+    stats = scheduler.stats()
+    assert stats["wakeups"] == 1 and stats["dispatched"] == 1 and stats["retried"] == 1
+    assert scheduler.next_due("+15550000001") == 1300.0
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from job_queue import JobQueue, QueueFullError
+
+import pytest
+
+
+def test_jobs_with_the_same_key_run_in_submission_order_one_at_a_time():
+    queue = JobQueue(workers=4)
+    order = []
+    running = []
+
+    def job(n):
+        running.append(n)
+        assert len(running) == 1
+        time.sleep(0.005)
+        order.append(n)
+        running.remove(n)
+
+    futures = [queue.submit(job, n, key="+15550000001") for n in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+    queue.shutdown()
+    assert order == list(range(10))
+
+
+def test_jobs_with_different_keys_run_in_parallel():
+    queue = JobQueue(workers=3)
+    barrier = threading.Barrier(3, timeout=5)
+
+    # Each job waits for the other two, so this only finishes if all three run at once
+    futures = [queue.submit(barrier.wait, key=f"+1555000000{n}") for n in range(3)]
+    for future in futures:
+        future.result(timeout=5)
+    queue.shutdown()
+    assert queue.stats()["completed"] == 3
+
+
+def test_shutdown_drains_queued_jobs_for_one_key_without_hanging():
+    queue = JobQueue(workers=4)
+    release = threading.Event()
+    done = []
+
+    started = threading.Event()
+    queue.submit(lambda: (started.set(), release.wait(5)), key="+15550000001")
+    for n in range(5):
+        queue.submit(lambda n=n: (time.sleep(0.01), done.append(n)), key="+15550000001")
+    started.wait(5)
+
+    # The other workers sit idle while jobs for the busy key are still queued
+    stopper = threading.Thread(target=queue.shutdown, daemon=True)
+    stopper.start()
+    while not queue._stopping:
+        time.sleep(0.001)
+    release.set()
+    stopper.join(timeout=5)
+
+    assert not stopper.is_alive()
+    assert done == list(range(5))
+    assert queue.stats()["depth"] == 0 and queue.stats()["completed"] == 6
+
+
+def test_failed_job_sets_exception_and_the_key_keeps_going():
+    queue = JobQueue(workers=2)
+
+    def fail():
+        raise ValueError("boom")
+
+    failed = queue.submit(fail, key="+15550000001")
+    after = queue.submit(lambda: "ok", key="+15550000001")
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    assert after.result(timeout=5) == "ok"
+    queue.shutdown()
+    assert queue.stats()["failed"] == 1
+
+
+def test_submit_raises_when_queue_is_full():
+    queue = JobQueue(workers=1, max_depth=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    queue.submit(lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    queue.submit(lambda: None)
+    with pytest.raises(QueueFullError):
+        queue.submit(lambda: None)
+    release.set()
+    queue.shutdown()
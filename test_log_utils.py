@@ -0,0 +1,38 @@
+import logging
+import queue
+
+from log_utils import BoundedQueueHandler
+
+
+def make_record(msg, args):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+
+
+def prepare(msg, args=(), max_field_length=20):
+    handler = BoundedQueueHandler(queue.Queue(), max_field_length=max_field_length)
+    return handler.prepare(make_record(msg, args))
+
+
+def test_long_format_string_keeps_its_placeholders():
+    msg = "Scheduled intervention for user " + "x" * 40 + " sent via %s in %.1fs"
+    record = prepare(msg, ("rcs", 1.25))
+    assert record.msg == msg
+    assert record.getMessage().endswith("sent via rcs in 1.2s")
+
+
+def test_long_arguments_are_truncated():
+    record = prepare("Received webhook: %s", ("y" * 100,))
+    assert record.getMessage() == "Received webhook: " + "y" * 20 + "... (+80 chars)"
+
+
+def test_mapping_arguments_are_truncated():
+    record = prepare("Payload %(payload)s", ({"payload": "z" * 30},))
+    assert record.getMessage() == "Payload " + "z" * 20 + "... (+10 chars)"
+
+
+def test_plain_message_is_truncated_and_data_uris_collapsed():
+    record = prepare("a" * 50)
+    assert record.getMessage() == "a" * 20 + "... (+30 chars)"
+
+    record = prepare("chart data:image/png;base64," + "A" * 200, max_field_length=1000)
+    assert record.getMessage() == "chart <data:image/png;base64 222 chars>"
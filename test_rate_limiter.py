@@ -0,0 +1,90 @@
+import re
+
+from message_handler import FakePinnacleClient
+from rate_limiter import SEND_WAIT, SendRateLimiter
+
+
+class FakeClock:
+    """Monotonic clock that only moves when the limiter sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def make_limiter(clock, channel_rates, global_rate=0.0):
+    rates = {"rcs": 0.0, "mms": 0.0, "sms": 0.0}
+    rates.update(channel_rates)
+    return SendRateLimiter(rates, global_rate=global_rate, sleep=clock.sleep, clock=clock)
+
+
+def send(client, limiter, channel, count):
+    sender = getattr(client.send, channel)
+    for i in range(count):
+        limiter.acquire(channel)
+        sender(to=f"+1555000{i:04d}", text="hello")
+
+
+def wait_histogram(channel):
+    """(count, sum) of rcsbot_send_rate_limit_wait_seconds for a channel."""
+    samples = "\n".join(SEND_WAIT.render())
+    count = re.search(rf'_count{{channel="{channel}"}} (\S+)', samples)
+    total = re.search(rf'_sum{{channel="{channel}"}} (\S+)', samples)
+    return (int(count.group(1)), float(total.group(1))) if count else (0, 0.0)
+
+
+def test_channel_rate_allows_one_burst_then_paces_sends():
+    clock = FakeClock()
+    client = FakePinnacleClient(rcs_supported=False)
+    limiter = make_limiter(clock, {"sms": 20.0})
+    count_before, total_before = wait_histogram("sms")
+
+    send(client, limiter, "sms", 100)
+
+    # The first second's worth goes out as a burst, the other 80 at 20/s
+    assert client.sent_by_channel["sms"] == 100
+    assert abs(clock.now - 4.0) < 1e-6
+    count, total = wait_histogram("sms")
+    assert count - count_before == 100
+    assert abs((total - total_before) - 4.0) < 1e-6
+
+
+def test_channels_are_limited_independently():
+    clock = FakeClock()
+    client = FakePinnacleClient()
+    limiter = make_limiter(clock, {"sms": 1.0})
+
+    send(client, limiter, "sms", 3)
+    waited = clock.now
+    send(client, limiter, "rcs", 50)
+
+    assert abs(waited - 2.0) < 1e-6
+    assert clock.now == waited
+    assert client.sent_by_channel == {"rcs": 50, "mms": 0, "sms": 3}
+
+
+def test_global_rate_caps_all_channels_together():
+    clock = FakeClock()
+    client = FakePinnacleClient()
+    limiter = make_limiter(clock, {}, global_rate=10.0)
+
+    for _ in range(10):
+        send(client, limiter, "rcs", 1)
+        send(client, limiter, "mms", 1)
+        send(client, limiter, "sms", 1)
+
+    # 30 sends at 10/s with a 10 message burst
+    assert client.sent_count == 30
+    assert abs(clock.now - 2.0) < 1e-6
+
+
+def test_limiter_with_every_rate_unlimited_is_disabled():
+    clock = FakeClock()
+    limiter = make_limiter(clock, {})
+    assert not limiter.enabled
+    assert limiter.acquire("sms") == 0.0
@@ -0,0 +1,64 @@
+import json
+import os
+
+os.environ.setdefault("PINNACLE_FAKE", "true")
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import main  # noqa: E402
+from cohort_interventions import CohortInterventionRunner  # noqa: E402
+from intervention_runner import InterventionRunner, SkippedJob  # noqa: E402
+
+
+def skipped_jobs(count, produced):
+    for i in range(count):
+        produced.append(i)
+        yield SkippedJob({"phone_number": f"+1555000{i:04d}", "status": "skipped"})
+
+
+def test_stream_writes_skipped_users_as_they_are_scanned(monkeypatch):
+    produced = []
+    monkeypatch.setattr(main, "scheduled_intervention_jobs", lambda: skipped_jobs(50, produced))
+
+    stream = main.stream_scheduled_interventions()
+    for seen in range(1, 51):
+        line = json.loads(next(stream))
+        assert line["status"] == "skipped"
+        # Nothing is scanned ahead of what has been written
+        assert len(produced) == seen
+
+    summary = json.loads(next(stream))
+    assert summary["status"] == "success"
+    assert summary["interventions_processed"] == 50
+    assert summary["interventions_sent"] == 0
+
+
+def due_and_skipped(produced):
+    for i in range(6):
+        produced.append(i)
+        if i % 3 == 0:
+            yield f"+1555000{i:04d}", {}, "glucose"
+        else:
+            yield SkippedJob({"phone_number": f"+1555000{i:04d}", "status": "skipped"})
+
+
+def test_runner_reports_skipped_and_sent_users():
+    sent = []
+    runner = InterventionRunner(
+        generate=lambda phone, context, kind: {"text": kind},
+        send=lambda phone, response, kind: sent.append(phone) or "rcs",
+    )
+    results, summary = runner.run(due_and_skipped([]))
+    assert sorted(result["status"] for result in results) == ["sent"] * 2 + ["skipped"] * 4
+    assert summary["sent"] == 2 and len(sent) == 2
+
+
+def test_cohort_runner_passes_skipped_users_through_before_grouping():
+    produced = []
+    runner = CohortInterventionRunner(
+        generate_template=lambda cohort: {"text": cohort.intervention_type},
+        send=lambda phone, response, kind: "rcs",
+    )
+    results = runner.iter_run(due_and_skipped(produced))
+    first = next(results)
+    assert first["status"] == "skipped" and len(produced) == 2
+    assert sorted(result["status"] for result in [first, *results]) == ["sent"] * 2 + ["skipped"] * 4
@@ -0,0 +1,188 @@
+import asyncio
+import time
+
+import pytest
+
+from session_pool import LiveSessionPool
+
+SYSTEM_PROMPT = "You are SlothMD."
+
+
+class FakeSession:
+    def __init__(self, number: int):
+        self.number = number
+        self.sent = []
+
+    async def send(self, input, end_of_turn=False):
+        self.sent.append((input, end_of_turn))
+
+
+class FakeConnection:
+    """Stands in for client.aio.live.connect(...): an async context manager yielding a session."""
+
+    def __init__(self, factory: "FakeConnect"):
+        self.factory = factory
+        self.session = None
+        self.closed = False
+
+    async def __aenter__(self):
+        if self.factory.fail_next:
+            self.factory.fail_next -= 1
+            raise ConnectionError("connect failed")
+        self.factory.opened += 1
+        self.session = FakeSession(self.factory.opened)
+        self.factory.sessions.append(self.session)
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+        self.factory.closed.append(self.session)
+
+
+class FakeConnect:
+    def __init__(self):
+        self.opened = 0
+        self.fail_next = 0
+        self.sessions = []
+        self.closed = []
+
+    def __call__(self):
+        return FakeConnection(self)
+
+
+def make_pool(connect, **kwargs):
+    options = dict(min_size=2, max_size=4, maintenance_interval=3600.0, acquire_timeout=1.0)
+    options.update(kwargs)
+    return LiveSessionPool(connect, SYSTEM_PROMPT, **options)
+
+
+async def settle():
+    # Let background close / top-up tasks run
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_start_preloads_system_prompt_without_ending_turn():
+    async def scenario():
+        connect = FakeConnect()
+        pool = make_pool(connect)
+        await pool.start()
+        assert pool.stats()["idle"] == 2
+        assert [session.sent for session in connect.sessions] == [[(SYSTEM_PROMPT, False)]] * 2
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_sessions_are_used_once_and_replaced():
+    async def scenario():
+        connect = FakeConnect()
+        pool = make_pool(connect)
+        await pool.start()
+
+        async with pool.lease() as first:
+            pass
+        await settle()
+        async with pool.lease() as second:
+            pass
+        await settle()
+
+        assert first is not second
+        assert first in connect.closed and second in connect.closed
+        stats = pool.stats()
+        assert stats["leases"] == 2 and stats["warm_hits"] == 2
+        assert stats["idle"] == 2 and stats["leased"] == 0
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_stale_sessions_are_not_leased():
+    async def scenario():
+        connect = FakeConnect()
+        pool = make_pool(connect, max_age=60.0)
+        await pool.start()
+        stale = list(pool._idle)
+        for pooled in stale:
+            pooled.created_at = time.monotonic() - 120.0
+
+        async with pool.lease() as session:
+            assert session not in [pooled.session for pooled in stale]
+        await settle()
+
+        assert pool.stats()["evicted_unhealthy"] == 2
+        assert all(pooled.session in connect.closed for pooled in stale)
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_maintenance_evicts_idle_sessions_and_tops_up():
+    async def scenario():
+        connect = FakeConnect()
+        pool = make_pool(connect, idle_ttl=0.05, maintenance_interval=0.02)
+        await pool.start()
+        first_sessions = list(connect.sessions)
+
+        await asyncio.sleep(0.1)
+        await settle()
+
+        stats = pool.stats()
+        assert stats["evicted_idle"] >= 2
+        assert all(session in connect.closed for session in first_sessions)
+        assert stats["idle"] + stats["connecting"] == 2
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_session_is_discarded_and_replaced_after_error():
+    async def scenario():
+        connect = FakeConnect()
+        pool = make_pool(connect)
+        await pool.start()
+
+        with pytest.raises(RuntimeError):
+            async with pool.lease() as session:
+                raise RuntimeError("turn failed")
+        await settle()
+
+        assert session in connect.closed
+        assert pool.stats()["idle"] == 2
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_warm_up_is_counted_and_lease_connects_cold():
+    async def scenario():
+        connect = FakeConnect()
+        connect.fail_next = 2
+        pool = make_pool(connect)
+        await pool.start()
+        assert pool.stats()["connect_errors"] == 2
+        assert pool.stats()["idle"] == 0
+
+        async with pool.lease() as session:
+            assert session.sent == [(SYSTEM_PROMPT, False)]
+        assert pool.stats()["cold_connects"] == 1
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_background_tasks_are_tracked_until_done():
+    async def scenario():
+        connect = FakeConnect()
+        pool = make_pool(connect)
+        await pool.start()
+
+        async with pool.lease() as session:
+            pass
+        assert len(pool._tasks) == 2
+
+        await pool.close()
+        assert not pool._tasks
+        assert session in connect.closed
+
+    asyncio.run(scenario())
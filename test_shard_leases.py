@@ -0,0 +1,90 @@
+from shard_leases import ShardLeaseManager, shard_for
+
+NUM_SHARDS = 4
+LEASE_SECONDS = 120.0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_manager(tmp_path, owner, clock):
+    return ShardLeaseManager(
+        db_path=str(tmp_path / "leases.db"),
+        num_shards=NUM_SHARDS,
+        lease_seconds=LEASE_SECONDS,
+        owner=owner,
+        clock=clock,
+    )
+
+
+def user_in_shard(shard):
+    return next(f"+1555{n:07d}" for n in range(10000) if shard_for(f"+1555{n:07d}", NUM_SHARDS) == shard)
+
+
+def test_second_worker_gets_surplus_shards_after_rebalancing(tmp_path):
+    clock = FakeClock()
+    a = make_manager(tmp_path, "a", clock)
+    b = make_manager(tmp_path, "b", clock)
+
+    assert a.heartbeat() == [0, 1, 2, 3]
+    # Every shard is still leased to a, so b has to wait for a to give some back
+    assert b.heartbeat() == []
+
+    clock.now += 10
+    a_held = a.heartbeat()
+    b_held = b.heartbeat()
+    assert len(a_held) == len(b_held) == 2
+    assert sorted(a_held + b_held) == [0, 1, 2, 3]
+    for shard in range(NUM_SHARDS):
+        assert a.owns_user(user_in_shard(shard)) != b.owns_user(user_in_shard(shard))
+
+
+def test_expired_worker_shards_are_taken_over(tmp_path):
+    clock = FakeClock()
+    a = make_manager(tmp_path, "a", clock)
+    b = make_manager(tmp_path, "b", clock)
+    a.heartbeat()
+    b.heartbeat()
+    a.heartbeat()
+    b.heartbeat()
+
+    # a stops heartbeating; once its leases lapse b picks everything up
+    clock.now += LEASE_SECONDS + 1
+    assert a.held_shards() == []
+    assert not a.owns_user(user_in_shard(0))
+    assert b.heartbeat() == [0, 1, 2, 3]
+
+
+def test_surplus_shards_are_kept_until_the_run_finishes(tmp_path):
+    clock = FakeClock()
+    a = make_manager(tmp_path, "a", clock)
+    b = make_manager(tmp_path, "b", clock)
+    a.heartbeat()
+
+    with a.hold_shards():
+        b.heartbeat()
+        clock.now += 10
+        # a renews its surplus mid-run instead of handing it to b
+        assert a.heartbeat() == [0, 1, 2, 3]
+        assert b.heartbeat() == []
+        assert all(a.owns_user(user_in_shard(shard)) for shard in range(NUM_SHARDS))
+
+    clock.now += 10
+    assert len(a.heartbeat()) == 2
+    assert len(b.heartbeat()) == 2
+
+
+def test_release_hands_shards_back_immediately(tmp_path):
+    clock = FakeClock()
+    a = make_manager(tmp_path, "a", clock)
+    b = make_manager(tmp_path, "b", clock)
+    a.heartbeat()
+
+    a.release()
+    assert a.held_shards() == []
+    assert b.heartbeat() == [0, 1, 2, 3]
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a time-to-live.
+
+    Expired entries are dropped lazily on access; when the cache is full the
+    least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: Optional[float] = 3600.0):
+        """
+        Args:
+            max_size: Maximum number of entries kept
+            ttl: Default time-to-live in seconds, None for no expiry
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (marking it recently used) or default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, evicting the least recently used entry if full.
+
+        Args:
+            ttl: Overrides the cache's default time-to-live for this entry
+        """
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: Hashable, value: Any = True, ttl: Optional[float] = None) -> bool:
+        """
+        Store a value only if the key is not already cached (and unexpired).
+
+        Returns:
+            True if the value was added, False if the key was already present
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at = entry[1]
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    return False
+            self._store(key, value, ttl)
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry and return its value (or default)."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]) -> None:
+        # Caller holds the lock
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss/eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }